@@ -6,34 +6,45 @@ This script is designed to be called from TypeScript/JavaScript
 
 import sys
 import os
-from data_cleaner import DataCleaner
+import argparse
+from data_cleaner import DataCleaner, CHUNK_ROWS
 
 def main():
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description='Clean a route export and print the cleaned file path')
+    parser.add_argument('input_file', nargs='?', help='CSV export to clean')
+    parser.add_argument('output_file', nargs='?', help='Cleaned CSV path (default: <input>_cleaned.csv)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help=f'Rows cleaned at a time (default: {CHUNK_ROWS:,}; 0 loads the whole file)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Don't write the cleaned rows to the analyses' columnar route cache")
+    args = parser.parse_args()
+
+    if not args.input_file:
         print("Error: No input file provided", file=sys.stderr)
         sys.exit(1)
 
-    input_file = sys.argv[1]
+    input_file = args.input_file
 
     if not os.path.exists(input_file):
         print(f"Error: File not found: {input_file}", file=sys.stderr)
         sys.exit(1)
 
     # Determine output path
-    if len(sys.argv) >= 3:
-        output_file = sys.argv[2]
+    if args.output_file:
+        output_file = args.output_file
     else:
         # Default: add _cleaned suffix
         base, ext = os.path.splitext(input_file)
         output_file = f"{base}_cleaned{ext}"
 
     try:
-        # Run the cleaner
+        # Run the cleaner (chunk by chunk unless --chunk-rows 0)
         cleaner = DataCleaner(input_file)
-        cleaner.clean_all()
-
-        # Save cleaned data
-        actual_output = cleaner.save_cleaned_data(output_file)
+        if args.chunk_rows > 0:
+            actual_output = cleaner.clean_chunked(output_file, args.chunk_rows, write_cache=not args.no_cache)
+        else:
+            cleaner.clean_all()
+            actual_output = cleaner.save_cleaned_data(output_file, write_cache=not args.no_cache)
 
         # Print report to stderr so stdout only has the path
         print(file=sys.stderr)
@@ -1,17 +1,213 @@
 """
 Data Cleaner for Order Delivery Analysis
 This script cleans and prepares delivery data for analysis, handling failed orders and data quality issues.
+
+Every cleaning step is a column-wise transform of one frame, so the same
+pipeline runs on a whole export or chunk by chunk (clean_chunked), with the
+cleaning report summed across chunks. The cleaned rows can also be written
+straight into the analyses' columnar route cache, so the server doesn't
+re-parse the cleaned CSV.
 """
 
+import sys
 import pandas as pd
 import numpy as np
+from pathlib import Path
 from datetime import datetime
 
+# Columnar cache shared with the analysis scripts (optional: needs pyarrow
+# and scripts/analysis/route_cache.py next to this file)
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scripts' / 'analysis'))
+try:
+    from route_cache import CacheWriter, cache_enabled
+except ImportError:
+    CacheWriter = None
+# Streams .csv.gz / .csv.zst / .zip exports (pandas alone infers from the name)
+try:
+    from compressed_input import read_csv
+except ImportError:
+    read_csv = pd.read_csv
+
+# Rows per chunk when cleaning chunk by chunk
+CHUNK_ROWS = 250_000
+
+DATE_COLUMNS = [
+    'Date', 'Pickup Enroute', 'Pickup Arrived', 'Load Start Time',
+    'Load End Time', 'Pickup Complete', 'Last Dropoff Complete',
+    'Trip Planned Start'
+]
+
+TIME_COLUMNS = [
+    'Driver Dwell Time', 'Driver Load Time', 'Driver Sort Time',
+    'Driver Store Time', 'Trip Actual Time', 'Driver Total Time',
+    'Estimated Duration', 'Headroom'
+]
+
+CRITICAL_FIELDS = ['Carrier', 'Date', 'Store Id', 'Walmart Trip Id', 'Total Orders']
+
+# Inconsistent rows kept for the detailed warning
+MAX_INCONSISTENT_EXAMPLES = 5
+
+
+# ===== CLEANING STEPS =====
+# Each step takes a frame and returns (frame, stats); stats from different
+# chunks combine with merge_stats.
+
+def drop_invalid_rows(df):
+    """Remove rows with critical fields missing or no orders."""
+    initial_count = len(df)
+    df = df.dropna(subset=CRITICAL_FIELDS)
+    df = df[df['Total Orders'] > 0]
+    return df, {'rows_removed': initial_count - len(df)}
+
+
+def standardize_dates(df):
+    """Parse date/time columns (unparseable values become NaT)."""
+    converted = []
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            try:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+                converted.append(col)
+            except Exception as e:
+                print(f"Warning: Could not convert {col}: {e}")
+    return df, {'date_columns': converted}
+
+
+def adjust_failed_orders(df):
+    """
+    Recalculate rates for trips with failed orders so failed orders don't
+    count against delivery performance.
+
+    Trips with deliverable orders left get rates over (total - failed);
+    trips where every order failed get a failed rate of 1 and zero for the rest.
+    """
+    failed = df['Failed Orders']
+    failed_mask = (failed > 0).to_numpy()
+    stats = {
+        'failed_orders_fixed': int(failed_mask.sum()),
+        'total_failed_orders': int(failed.sum()),
+        'max_failed_orders': int(failed.max()) if failed.notna().any() else 0,
+    }
+    if not failed_mask.any():
+        return df, stats
+
+    total = df['Total Orders'].to_numpy(dtype=np.float64)
+    failed_values = failed.to_numpy(dtype=np.float64)
+    effective_total = total - failed_values
+    # Comparisons with NaN are False, so a missing count takes the "all failed" path
+    # just as it did per row
+    deliverable = failed_mask & (effective_total > 0)
+    all_failed = failed_mask & ~(effective_total > 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df.loc[deliverable, 'Failed Orders Rate'] = (failed_values / total)[deliverable]
+        for col, rate_col in (('Delivered Orders', 'Adjusted Cddr'),
+                              ('Returned Orders', 'Returned Orders Rate'),
+                              ('Pending Orders', 'Pending Orders Rate')):
+            counts = df[col].to_numpy(dtype=np.float64)
+            # Only rates with something to report are recalculated
+            rows = deliverable & (counts > 0)
+            df.loc[rows, rate_col] = (counts / effective_total)[rows]
+
+    if all_failed.any():
+        df.loc[all_failed, 'Failed Orders Rate'] = 1.0
+        for rate_col in ('Adjusted Cddr', 'Returned Orders Rate', 'Pending Orders Rate'):
+            df.loc[all_failed, rate_col] = 0.0
+    return df, stats
+
+
+def fix_negative_times(df):
+    """Make negative durations positive (Headroom may legitimately be negative)."""
+    negatives = {}
+    fixed_count = 0
+    for col in TIME_COLUMNS:
+        if col not in df.columns:
+            continue
+        negative_mask = df[col] < 0
+        count = int(negative_mask.sum())
+        if count == 0:
+            continue
+        negatives[col] = count
+        if col != 'Headroom':
+            df.loc[negative_mask, col] = df.loc[negative_mask, col].abs()
+            fixed_count += count
+    return df, {'negative_values_fixed': fixed_count, 'negative_by_column': negatives}
+
+
+def check_order_counts(df):
+    """Rows where delivered + returned + pending + failed != total (more than 0.1 apart)."""
+    expected = (df['Delivered Orders'] + df['Returned Orders'] +
+                df['Pending Orders'] + df['Failed Orders'])
+    difference = expected - df['Total Orders']
+    inconsistent = difference.abs() > 0.1
+
+    examples = []
+    for trip_id, exp, actual, diff in zip(df.loc[inconsistent, 'Walmart Trip Id'][:MAX_INCONSISTENT_EXAMPLES],
+                                          expected[inconsistent][:MAX_INCONSISTENT_EXAMPLES],
+                                          df.loc[inconsistent, 'Total Orders'][:MAX_INCONSISTENT_EXAMPLES],
+                                          difference[inconsistent][:MAX_INCONSISTENT_EXAMPLES]):
+        examples.append({'trip_id': trip_id, 'expected': exp, 'actual': actual, 'difference': diff})
+
+    return df, {'inconsistent_rows': int(inconsistent.sum()), 'inconsistent_examples': examples}
+
+
+STEPS = [drop_invalid_rows, standardize_dates, adjust_failed_orders, fix_negative_times, check_order_counts]
+
+
+def clean_frame(df):
+    """Run every cleaning step on one frame (a whole export or a chunk)."""
+    stats = {'total_rows': len(df)}
+    for step in STEPS:
+        df, step_stats = step(df)
+        stats.update(step_stats)
+    return df, stats
+
+
+def merge_stats(total, stats):
+    """Fold one chunk's stats into the running totals (in place)."""
+    for key, value in stats.items():
+        if key == 'max_failed_orders':
+            total[key] = max(total.get(key, 0), value)
+        elif key == 'date_columns':
+            total[key] = total.get(key, []) + [col for col in value if col not in total.get(key, [])]
+        elif key == 'negative_by_column':
+            merged = total.setdefault(key, {})
+            for col, count in value.items():
+                merged[col] = merged.get(col, 0) + count
+        elif key == 'inconsistent_examples':
+            examples = total.setdefault(key, [])
+            examples.extend(value[:MAX_INCONSISTENT_EXAMPLES - len(examples)])
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def csv_view(df):
+    """
+    The frame as the analyses read it back from the cleaned CSV: parsed
+    dates become the text to_csv writes for them, so cached and CSV reads match.
+    """
+    formatted = {}
+    for col in df.columns[[dtype.kind == 'M' for dtype in df.dtypes]]:
+        times = df[col].dropna()
+        if (times == times.dt.normalize()).all():
+            fmt = '%Y-%m-%d'
+        elif ((times.dt.microsecond == 0) & (times.dt.nanosecond == 0)).all():
+            fmt = '%Y-%m-%d %H:%M:%S'
+        else:
+            fmt = '%Y-%m-%d %H:%M:%S.%f'
+        formatted[col] = df[col].dt.strftime(fmt)
+    return df.assign(**formatted)
+
+
 class DataCleaner:
     def __init__(self, file_path):
         """Initialize with the path to the CSV file."""
         self.file_path = file_path
         self.df = None
+        self.final_rows = 0
+        self.stats = {}
         self.cleaning_report = {
             'total_rows': 0,
             'rows_removed': 0,
@@ -20,11 +216,21 @@ class DataCleaner:
             'negative_values_fixed': 0
         }
 
+    def _record(self, stats):
+        """Add step stats to the report."""
+        merge_stats(self.stats, stats)
+        report = self.cleaning_report
+        for key in ('total_rows', 'rows_removed', 'failed_orders_fixed', 'negative_values_fixed'):
+            report[key] = self.stats.get(key, 0)
+        report['date_issues_fixed'] = len(self.stats.get('date_columns', []))
+        if 'total_failed_orders' in self.stats:
+            report['total_failed_orders'] = self.stats['total_failed_orders']
+
     def load_data(self):
         """Load the CSV file into a pandas DataFrame."""
         print("Loading data...")
-        self.df = pd.read_csv(self.file_path)
-        self.cleaning_report['total_rows'] = len(self.df)
+        self.df = read_csv(self.file_path)
+        self._record({'total_rows': len(self.df)})
         print(f"Loaded {len(self.df)} rows")
         return self
 
@@ -39,47 +245,13 @@ class DataCleaner:
         3. Clearly marked for separate analysis
         """
         print("\nFixing failed orders...")
+        self.df, stats = adjust_failed_orders(self.df)
+        self._record(stats)
 
-        # Identify rows with failed orders
-        failed_mask = self.df['Failed Orders'] > 0
-        failed_count = failed_mask.sum()
-        total_failed_orders = int(self.df['Failed Orders'].sum())
-
+        failed_count = stats['failed_orders_fixed']
         if failed_count > 0:
             print(f"Found {failed_count} trips with failed orders")
-            print(f"Total failed orders across all trips: {total_failed_orders}")
-
-            # Adjust metrics for failed orders
-            # Failed orders should not affect delivery rates
-            for idx in self.df[failed_mask].index:
-                failed = self.df.loc[idx, 'Failed Orders']
-                total = self.df.loc[idx, 'Total Orders']
-                delivered = self.df.loc[idx, 'Delivered Orders']
-                pending = self.df.loc[idx, 'Pending Orders']
-                returned = self.df.loc[idx, 'Returned Orders']
-
-                # Recalculate rates excluding failed orders
-                effective_total = total - failed
-                if effective_total > 0:
-                    self.df.loc[idx, 'Failed Orders Rate'] = failed / total
-                    # Update adjusted CDDR to reflect only deliverable orders
-                    if delivered > 0:
-                        self.df.loc[idx, 'Adjusted Cddr'] = delivered / effective_total
-
-                    # Recalculate other rates excluding failed orders
-                    if returned > 0:
-                        self.df.loc[idx, 'Returned Orders Rate'] = returned / effective_total
-                    if pending > 0:
-                        self.df.loc[idx, 'Pending Orders Rate'] = pending / effective_total
-                else:
-                    # If all orders failed, set rates appropriately
-                    self.df.loc[idx, 'Failed Orders Rate'] = 1.0
-                    self.df.loc[idx, 'Adjusted Cddr'] = 0.0
-                    self.df.loc[idx, 'Returned Orders Rate'] = 0.0
-                    self.df.loc[idx, 'Pending Orders Rate'] = 0.0
-
-            self.cleaning_report['failed_orders_fixed'] = failed_count
-            self.cleaning_report['total_failed_orders'] = total_failed_orders
+            print(f"Total failed orders across all trips: {stats['total_failed_orders']}")
             print(f"Adjusted metrics for {failed_count} trips with failed orders")
             print(f"Failed orders are now properly tracked and excluded from delivery metrics")
 
@@ -88,76 +260,31 @@ class DataCleaner:
     def fix_date_formats(self):
         """Standardize date/time formats and fix parsing issues."""
         print("\nStandardizing date formats...")
-
-        date_columns = [
-            'Date', 'Pickup Enroute', 'Pickup Arrived', 'Load Start Time',
-            'Load End Time', 'Pickup Complete', 'Last Dropoff Complete',
-            'Trip Planned Start'
-        ]
-
-        fixed_count = 0
-        for col in date_columns:
-            if col in self.df.columns:
-                try:
-                    self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
-                    fixed_count += 1
-                except Exception as e:
-                    print(f"Warning: Could not convert {col}: {e}")
-
-        self.cleaning_report['date_issues_fixed'] = fixed_count
-        print(f"Standardized {fixed_count} date columns")
+        self.df, stats = standardize_dates(self.df)
+        self._record(stats)
+        print(f"Standardized {len(stats['date_columns'])} date columns")
 
         return self
 
     def fix_negative_values(self):
         """Fix negative time values and other anomalies."""
         print("\nFixing negative values and anomalies...")
+        self.df, stats = fix_negative_times(self.df)
+        self._record(stats)
 
-        time_columns = [
-            'Driver Dwell Time', 'Driver Load Time', 'Driver Sort Time',
-            'Driver Store Time', 'Trip Actual Time', 'Driver Total Time',
-            'Estimated Duration', 'Headroom'
-        ]
-
-        fixed_count = 0
-        for col in time_columns:
-            if col in self.df.columns:
-                # Count negative values
-                negative_mask = self.df[col] < 0
-                count = negative_mask.sum()
-
-                if count > 0:
-                    print(f"  {col}: {count} negative values found")
-                    # Set negative values to 0 or absolute value depending on context
-                    if col == 'Headroom':
-                        # Headroom can legitimately be negative (over time)
-                        pass
-                    else:
-                        # Other time values should not be negative
-                        self.df.loc[negative_mask, col] = self.df.loc[negative_mask, col].abs()
-                        fixed_count += count
-
-        self.cleaning_report['negative_values_fixed'] = fixed_count
-        print(f"Fixed {fixed_count} negative values")
+        for col, count in stats['negative_by_column'].items():
+            print(f"  {col}: {count} negative values found")
+        print(f"Fixed {stats['negative_values_fixed']} negative values")
 
         return self
 
     def remove_invalid_rows(self):
         """Remove rows with critical missing data."""
         print("\nRemoving invalid rows...")
+        self.df, stats = drop_invalid_rows(self.df)
+        self._record(stats)
 
-        initial_count = len(self.df)
-
-        # Remove rows where critical fields are missing
-        critical_fields = ['Carrier', 'Date', 'Store Id', 'Walmart Trip Id', 'Total Orders']
-        self.df = self.df.dropna(subset=critical_fields)
-
-        # Remove rows where total orders is 0 or negative
-        self.df = self.df[self.df['Total Orders'] > 0]
-
-        removed = initial_count - len(self.df)
-        self.cleaning_report['rows_removed'] = removed
-
+        removed = stats['rows_removed']
         if removed > 0:
             print(f"Removed {removed} invalid rows")
         else:
@@ -168,61 +295,124 @@ class DataCleaner:
     def validate_data(self):
         """Validate data consistency and print detailed warnings."""
         print("\nValidating data consistency...")
+        self.df, stats = check_order_counts(self.df)
+        self._record(stats)
+        failed = self.df['Failed Orders']
+        self._print_validation({
+            **stats,
+            'failed_orders_fixed': int((failed > 0).sum()),
+            'total_failed_orders': int(failed.sum()),
+            'max_failed_orders': int(failed.max()) if failed.notna().any() else 0,
+        })
 
-        # Check if delivered + returned + pending + failed = total
-        validation_issues = 0
-        inconsistent_rows = []
-
-        for idx, row in self.df.iterrows():
-            expected_total = row['Delivered Orders'] + row['Returned Orders'] + \
-                           row['Pending Orders'] + row['Failed Orders']
-            actual_total = row['Total Orders']
-
-            if abs(expected_total - actual_total) > 0.1:  # Allow small floating point differences
-                validation_issues += 1
-                if len(inconsistent_rows) < 5:  # Keep first 5 for detailed reporting
-                    inconsistent_rows.append({
-                        'trip_id': row['Walmart Trip Id'],
-                        'expected': expected_total,
-                        'actual': actual_total,
-                        'difference': expected_total - actual_total
-                    })
+        return self
 
+    def _print_validation(self, stats):
+        validation_issues = stats['inconsistent_rows']
         if validation_issues > 0:
             print(f"Warning: {validation_issues} rows have inconsistent order counts")
             print("\nFirst few inconsistent rows:")
-            for row in inconsistent_rows:
-                print(f"  Trip {row['trip_id'][:8]}...: Expected {row['expected']}, Got {row['actual']} (diff: {row['difference']})")
+            for row in stats['inconsistent_examples']:
+                print(f"  Trip {str(row['trip_id'])[:8]}...: Expected {row['expected']}, Got {row['actual']} (diff: {row['difference']})")
         else:
             print("✓ All order counts are consistent")
 
         # Validate failed orders specifically
-        failed_count = (self.df['Failed Orders'] > 0).sum()
-        total_failed = int(self.df['Failed Orders'].sum())
-
         print(f"\nFailed Orders Summary:")
-        print(f"  Trips with failed orders: {failed_count}")
-        print(f"  Total failed orders: {total_failed}")
-
-        if total_failed > 0:
-            max_failed = int(self.df['Failed Orders'].max())
-            print(f"  Max failed orders in single trip: {max_failed}")
-
-        return self
-
-    def save_cleaned_data(self, output_path=None):
-        """Save the cleaned data to a new CSV file."""
+        print(f"  Trips with failed orders: {stats['failed_orders_fixed']}")
+        print(f"  Total failed orders: {stats['total_failed_orders']}")
+
+        if stats['total_failed_orders'] > 0:
+            print(f"  Max failed orders in single trip: {stats['max_failed_orders']}")
+
+    def _default_output(self):
+        return self.file_path.replace('.csv', '_cleaned.csv')
+
+    def _open_cache(self, output_path, write_cache):
+        """Cache writer for the cleaned file, or None when the cache isn't available."""
+        if not write_cache:
+            return None
+        if CacheWriter is None or not cache_enabled():
+            print("Route cache not available (needs pyarrow and scripts/analysis/route_cache.py) - CSV only")
+            return None
+        return CacheWriter(output_path, 'Date')
+
+    def _close_cache(self, cache, failed=False):
+        if cache is None:
+            return
+        if failed:
+            cache.abort()
+            return
+        manifest = cache.close()
+        print(f"Wrote route cache: {len(manifest['partitions'])} day partitions")
+
+    def save_cleaned_data(self, output_path=None, write_cache=False):
+        """Save the cleaned data to a new CSV file (and optionally the route cache)."""
         if output_path is None:
-            output_path = self.file_path.replace('.csv', '_cleaned.csv')
+            output_path = self._default_output()
 
         print(f"\nSaving cleaned data to {output_path}...")
         self.df.to_csv(output_path, index=False)
         print(f"Saved {len(self.df)} rows")
+        self.final_rows = len(self.df)
+
+        cache = self._open_cache(output_path, write_cache)
+        try:
+            if cache is not None:
+                cache.write(csv_view(self.df))
+        except Exception as e:
+            # The cache only saves time; analyses rebuild it from the CSV
+            print(f"Warning: route cache not written: {e}")
+            self._close_cache(cache, failed=True)
+        else:
+            self._close_cache(cache)
+
+        return output_path
+
+    def clean_chunked(self, output_path=None, chunk_rows=CHUNK_ROWS, write_cache=False):
+        """
+        Clean the export chunk by chunk and stream the result to output_path
+        (and optionally the route cache) without holding the whole file.
+
+        Returns the output path; the report covers every chunk.
+        """
+        if output_path is None:
+            output_path = self._default_output()
+
+        print(f"Cleaning {self.file_path} in chunks of {chunk_rows:,} rows...")
+        cache = self._open_cache(output_path, write_cache)
+        cache_failed = False
+        first = True
+        self.final_rows = 0
+
+        for number, chunk in enumerate(read_csv(self.file_path, chunksize=chunk_rows), 1):
+            cleaned, stats = clean_frame(chunk)
+            self._record(stats)
+            cleaned.to_csv(output_path, mode='w' if first else 'a', header=first, index=False)
+            first = False
+            self.final_rows += len(cleaned)
+
+            if cache is not None and not cache_failed:
+                try:
+                    cache.write(csv_view(cleaned))
+                except Exception as e:
+                    print(f"Warning: route cache not written: {e}")
+                    cache_failed = True
+            print(f"  Chunk {number}: {len(chunk):,} rows → {len(cleaned):,} kept")
+
+        if first:
+            raise ValueError(f"No rows in {self.file_path}")
+
+        self._close_cache(cache, failed=cache_failed)
 
+        print(f"\nValidating data consistency...")
+        self._print_validation(self.stats)
+        print(f"\nSaved {self.final_rows} rows to {output_path}")
         return output_path
 
     def print_report(self):
         """Print a summary report of the cleaning process."""
+        final_rows = len(self.df) if self.df is not None else self.final_rows
         print("\n" + "="*60)
         print("DATA CLEANING REPORT")
         print("="*60)
@@ -232,7 +422,7 @@ class DataCleaner:
         print(f"Total failed orders found:   {self.cleaning_report.get('total_failed_orders', 0)}")
         print(f"Date columns standardized:   {self.cleaning_report['date_issues_fixed']}")
         print(f"Negative values fixed:       {self.cleaning_report['negative_values_fixed']}")
-        print(f"Final row count:             {len(self.df)}")
+        print(f"Final row count:             {final_rows}")
         print("="*60)
         print("\nData is ready for analysis!")
         print("✓ Failed orders properly tracked and excluded from metrics")
@@ -268,4 +458,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
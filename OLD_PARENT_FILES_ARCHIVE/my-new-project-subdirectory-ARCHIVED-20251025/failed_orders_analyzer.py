@@ -1,6 +1,12 @@
 """
 Failed Orders Analysis Module
 Analyzes patterns and trends in failed order pickups to identify root causes and improvement opportunities.
+
+Every breakdown (carrier, store, hour, day of week, on-time status, load
+duration, with/without failures) comes from one grouping-sets pass: each
+dimension is coded to integers once, the rows are aggregated over the
+combined key in a single scan, and each dimension is rolled up from those
+cells. self.df is never modified.
 """
 
 import pandas as pd
@@ -9,13 +15,87 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+LOAD_BINS = [0, 10, 20, 30, 50, 100, float('inf')]
+LOAD_LABELS = ['0-10min', '10-20min', '20-30min', '30-50min', '50-100min', '100+min']
+
+PERFORMANCE_METRICS = ['Driver Store Time', 'Trip Actual Time', 'Driver Total Time',
+                       'Drops Per Hour Trip', 'Adjusted Cddr']
+
+
+# Largest dense cube grouping_sets builds; bigger keys are summed on their own
+MAX_CUBE_CELLS = 1 << 20
+
+# Carrier / store breakdown columns: (output name, measure, kind)
+FAILURE_COLUMNS = [
+    ('Total Failed', 'failed', 'sum'),
+    ('Avg Failed Per Trip', 'failed', 'mean'),
+    ('Trips With Failures', 'failed', 'count'),
+    ('Total Orders', 'orders', 'sum'),
+    ('Total Trips', 'trip', 'count'),
+]
+
+
+def grouping_sets(keys, measures):
+    """
+    Sums of each measure for every level of every key, from one scan.
+
+    Low-cardinality keys are packed into one mixed-radix cell number, so each
+    measure is summed per cell with a single bincount and every key is rolled
+    up from that (small, dense) cube. A key too large to fit the cube (stores)
+    is summed straight from its own codes in the same loop.
+
+    Args:
+        keys: {dimension: (codes, levels)} - integer codes per row, -1 where
+              the row has no value for that dimension
+        measures: {name: float array} - NaN is skipped, as in a groupby sum
+
+    Returns:
+        {dimension: {measure: array of length levels}}
+    """
+    # Smallest keys first; slot 0 of each axis holds "missing"
+    cube, direct, shape = [], [], []
+    for name in sorted(keys, key=lambda name: keys[name][1]):
+        levels = keys[name][1]
+        if np.prod(shape + [levels + 1]) <= MAX_CUBE_CELLS:
+            cube.append(name)
+            shape.append(levels + 1)
+        else:
+            direct.append(name)
+
+    cell = np.zeros(len(next(iter(measures.values()))), dtype=np.int64)
+    for name in cube:
+        codes, levels = keys[name]
+        cell = cell * (levels + 1) + (codes + 1)
+
+    results = {name: {} for name in keys}
+    for measure, values in measures.items():
+        weights = np.nan_to_num(values)
+        cells = np.bincount(cell, weights=weights, minlength=int(np.prod(shape))).reshape(shape)
+        for axis, name in enumerate(cube):
+            others = tuple(other for other in range(len(cube)) if other != axis)
+            results[name][measure] = cells.sum(axis=others)[1:]
+        for name in direct:
+            codes, levels = keys[name]
+            results[name][measure] = np.bincount(codes + 1, weights=weights, minlength=levels + 1)[1:]
+    return results
+
+
+def _coded(values, sort=True):
+    """Integer codes (-1 for missing) and the sorted distinct values"""
+    codes, uniques = pd.factorize(values, sort=sort)
+    return codes.astype(np.int64), uniques
+
 
 class FailedOrdersAnalyzer:
     def __init__(self, file_path):
         """Initialize the analyzer with data file path."""
         self.file_path = file_path
         self.df = None
-        self.failed_trips = None
+        self.failed_mask = None
+        self.failed_count = 0
+        self._dimensions = None
         self.analysis_results = {}
 
     def load_data(self):
@@ -46,30 +126,117 @@ class FailedOrdersAnalyzer:
             self.failure_column = 'Failed Orders'  # Default
             print("⚠️  No failed orders or pickups detected in dataset")
 
-        # Filter for trips with failures
-        self.failed_trips = self.df[self.df[self.failure_column] > 0].copy()
+        # Trips with failures, as a row mask (no copy of the frame)
+        self.failed_mask = (self.df[self.failure_column] > 0).to_numpy()
+        self.failed_count = int(self.failed_mask.sum())
+        self._dimensions = None
 
         print(f"Total trips: {len(self.df)}")
-        print(f"Trips with {self.failure_column.lower()}: {len(self.failed_trips)}")
+        print(f"Trips with {self.failure_column.lower()}: {self.failed_count}")
         print(f"Total {self.failure_column.lower()}: {int(self.df[self.failure_column].sum())}")
-        print(f"{self.failure_column} rate: {len(self.failed_trips)/len(self.df)*100:.2f}%\n")
+        print(f"{self.failure_column} rate: {self.failed_count/len(self.df)*100:.2f}%\n")
 
         return self
 
+    @property
+    def failed_trips(self):
+        """Rows with failures"""
+        return self.df[self.failed_mask]
+
+    def aggregate_dimensions(self):
+        """
+        Run the grouping-sets pass once; every breakdown reads its result.
+
+        Returns:
+            {dimension: {'index': level labels, measure: sums per level}}
+        """
+        if self._dimensions is not None:
+            return self._dimensions
+
+        df = self.df
+        failure = df[self.failure_column]
+        keys, labels = {}, {}
+
+        for name, column in (('carrier', 'Carrier'), ('store', 'Store Id'), ('ontime', 'Is Pickup Arrived Ontime')):
+            if column in df.columns:
+                codes, uniques = _coded(df[column])
+            else:
+                codes, uniques = np.full(len(df), -1, dtype=np.int64), pd.Index([])
+            keys[name] = (codes, len(uniques))
+            labels[name] = pd.Index(uniques, name=column)
+
+        pickup = df['Pickup Arrived']
+        hours = pickup.dt.hour
+        keys['hour'] = (hours.fillna(-1).to_numpy().astype(np.int64), 24)
+        labels['hour'] = pd.Index(np.arange(24), dtype=hours.dtype, name='Hour')
+        keys['day'] = (pickup.dt.dayofweek.fillna(-1).to_numpy().astype(np.int64), 7)
+        labels['day'] = pd.Index(DAY_NAMES, name='Day_of_Week')
+
+        # Load duration only counts trips with failures
+        buckets = pd.cut(df['Driver Load Time'], bins=LOAD_BINS, labels=False)
+        bucket_codes = np.where(self.failed_mask, buckets.fillna(-1).to_numpy(), -1).astype(np.int64)
+        keys['load'] = (bucket_codes, len(LOAD_LABELS))
+        labels['load'] = pd.CategoricalIndex(LOAD_LABELS, categories=LOAD_LABELS, ordered=True,
+                                             name='Load Duration Bucket')
+
+        # With (0) / without (1) failures, for the performance comparison
+        status = np.where(self.failed_mask, 0, np.where((failure == 0).to_numpy(), 1, -1))
+        keys['status'] = (status.astype(np.int64), 2)
+
+        measures = {
+            'rows': np.ones(len(df)),
+            'failed_sum': failure.to_numpy(dtype=np.float64),
+            'failed_count': failure.notna().to_numpy(dtype=np.float64),
+            'orders_sum': df['Total Orders'].to_numpy(dtype=np.float64),
+            'trip_count': df['Walmart Trip Id'].notna().to_numpy(dtype=np.float64),
+        }
+        for metric in PERFORMANCE_METRICS:
+            values = df[metric].to_numpy(dtype=np.float64)
+            measures[f'{metric}_sum'] = values
+            measures[f'{metric}_count'] = (~np.isnan(values)).astype(np.float64)
+
+        results = grouping_sets(keys, measures)
+        for name, sums in results.items():
+            if name in labels:
+                sums['index'] = labels[name]
+        self._dimensions = results
+        return results
+
+    def _breakdown(self, dimension, columns):
+        """
+        Frame for one dimension's observed levels.
+
+        columns: [(output name, measure, kind)] - kind is 'sum', 'mean' or 'count'
+        """
+        sums = self.aggregate_dimensions()[dimension]
+        present = sums['rows'] > 0
+        data = {}
+        for output, measure, kind in columns:
+            if kind == 'count':
+                data[output] = sums[f'{measure}_count'][present].astype(np.int64)
+            elif kind == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    data[output] = sums[f'{measure}_sum'][present] / sums[f'{measure}_count'][present]
+            else:
+                values = sums[f'{measure}_sum'][present]
+                source = self.failure_column if measure == 'failed' else 'Total Orders'
+                # Keep integer columns integer, as a groupby sum would
+                data[output] = values.astype(self.df[source].dtype) if self.df[source].dtype.kind in 'iu' else values
+        index = sums['index'][present]
+        if dimension == 'day':
+            # groupby orders string keys alphabetically
+            order = np.argsort(np.asarray(index, dtype=object), kind='stable')
+            index = index[order]
+            data = {name: values[order] for name, values in data.items()}
+        return pd.DataFrame(data, index=index)
+
     def analyze_by_carrier(self):
         """Analyze failures by carrier."""
         print("="*60)
         print(f"{self.failure_column.upper()} BY CARRIER")
         print("="*60)
 
-        carrier_analysis = self.df.groupby('Carrier').agg({
-            self.failure_column: ['sum', 'mean', 'count'],
-            'Total Orders': 'sum',
-            'Walmart Trip Id': 'count'
-        }).round(2)
-
-        carrier_analysis.columns = ['Total Failed', 'Avg Failed Per Trip',
-                                   'Trips With Failures', 'Total Orders', 'Total Trips']
+        carrier_analysis = self._breakdown('carrier', FAILURE_COLUMNS).round(2)
 
         carrier_analysis['Failed Order Rate %'] = (
             carrier_analysis['Total Failed'] / carrier_analysis['Total Orders'] * 100
@@ -93,14 +260,7 @@ class FailedOrdersAnalyzer:
         print(f"TOP 15 STORES WITH {self.failure_column.upper()}")
         print("="*60)
 
-        store_analysis = self.df.groupby('Store Id').agg({
-            self.failure_column: ['sum', 'mean', 'count'],
-            'Total Orders': 'sum',
-            'Walmart Trip Id': 'count'
-        }).round(2)
-
-        store_analysis.columns = ['Total Failed', 'Avg Failed Per Trip',
-                                 'Trips With Failures', 'Total Orders', 'Total Trips']
+        store_analysis = self._breakdown('store', FAILURE_COLUMNS).round(2)
 
         store_analysis['Failed Order Rate %'] = (
             store_analysis['Total Failed'] / store_analysis['Total Orders'] * 100
@@ -122,17 +282,13 @@ class FailedOrdersAnalyzer:
         print(f"{self.failure_column.upper()} TIME PATTERNS")
         print("="*60)
 
-        # Extract time features
-        self.df['Hour'] = self.df['Pickup Arrived'].dt.hour
-        self.df['Day_of_Week'] = self.df['Pickup Arrived'].dt.day_name()
+        time_columns = [(self.failure_column, 'failed', 'sum'),
+                        ('Total Orders', 'orders', 'sum'),
+                        ('Walmart Trip Id', 'trip', 'count')]
 
         # Hourly analysis
         print("\nBy Hour of Day:")
-        hourly = self.df.groupby('Hour').agg({
-            self.failure_column: 'sum',
-            'Total Orders': 'sum',
-            'Walmart Trip Id': 'count'
-        })
+        hourly = self._breakdown('hour', time_columns)
 
         hourly['Failed Rate %'] = (hourly[self.failure_column] / hourly['Total Orders'] * 100).round(2)
         hourly = hourly[hourly[self.failure_column] > 0].sort_values(self.failure_column, ascending=False)
@@ -140,11 +296,7 @@ class FailedOrdersAnalyzer:
 
         # Day of week analysis
         print("\nBy Day of Week:")
-        daily = self.df.groupby('Day_of_Week').agg({
-            self.failure_column: 'sum',
-            'Total Orders': 'sum',
-            'Walmart Trip Id': 'count'
-        })
+        daily = self._breakdown('day', time_columns)
 
         daily['Failed Rate %'] = (daily[self.failure_column] / daily['Total Orders'] * 100).round(2)
         daily = daily.sort_values(self.failure_column, ascending=False)
@@ -163,17 +315,15 @@ class FailedOrdersAnalyzer:
         print(f"{self.failure_column.upper()} IMPACT ON PERFORMANCE")
         print("="*60)
 
-        # Compare trips with vs without failed orders
-        trips_with_failures = self.df[self.df[self.failure_column] > 0]
-        trips_without_failures = self.df[self.df[self.failure_column] == 0]
-
-        metrics = ['Driver Store Time', 'Trip Actual Time', 'Driver Total Time',
-                  'Drops Per Hour Trip', 'Adjusted Cddr']
+        # Compare trips with vs without failed orders (status 0 / 1 of the grouping pass)
+        status = self.aggregate_dimensions()['status']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = {metric: status[f'{metric}_sum'] / status[f'{metric}_count'] for metric in PERFORMANCE_METRICS}
 
         comparison = pd.DataFrame({
-            f'With {self.failure_column}': trips_with_failures[metrics].mean(),
-            f'Without {self.failure_column}': trips_without_failures[metrics].mean()
-        }).round(2)
+            f'With {self.failure_column}': [means[metric][0] for metric in PERFORMANCE_METRICS],
+            f'Without {self.failure_column}': [means[metric][1] for metric in PERFORMANCE_METRICS]
+        }, index=PERFORMANCE_METRICS).round(2)
 
         comparison['Difference'] = (comparison[f'With {self.failure_column}'] -
                                    comparison[f'Without {self.failure_column}']).round(2)
@@ -192,10 +342,12 @@ class FailedOrdersAnalyzer:
         print(f"TOP 20 TRIPS WITH HIGHEST {self.failure_column.upper()} COUNTS")
         print("="*60)
 
-        problem_trips = self.failed_trips.nlargest(20, self.failure_column)[
+        # Top 20 among the masked rows; only those rows are copied
+        top_rows = self.df[self.failure_column].where(self.failed_mask).nlargest(20).index
+        problem_trips = self.df.loc[top_rows,
             ['Date', 'Carrier', 'Store Id', 'Courier Name', 'Total Orders',
              self.failure_column, 'Failed Orders Rate', 'Delivered Orders', 'Pickup Arrived']
-        ].copy()
+        ]
 
         print(problem_trips.to_string(index=False))
         print()
@@ -209,24 +361,22 @@ class FailedOrdersAnalyzer:
         print("FAILURE PATTERN ANALYSIS")
         print("="*60)
 
-        failed = self.failed_trips
-
         # Check correlation with failed pickups
         print("Correlation with Failed Pickups:")
-        if 'Failed Pickups' in failed.columns:
-            correlation = failed[[self.failure_column, 'Failed Pickups', 'Total Orders']].corr()
+        if 'Failed Pickups' in self.df.columns:
+            correlation = self.df.loc[self.failed_mask, [self.failure_column, 'Failed Pickups', 'Total Orders']].corr()
             print(correlation[self.failure_column].round(3))
             print()
 
         # Analyze if on-time arrival matters
         print(f"{self.failure_column} by Pickup Arrival Status:")
-        if 'Is Pickup Arrived Ontime' in failed.columns:
-            ontime_analysis = self.df.groupby('Is Pickup Arrived Ontime').agg({
-                self.failure_column: ['sum', 'mean'],
-                'Total Orders': 'sum',
-                'Walmart Trip Id': 'count'
-            }).round(2)
-            ontime_analysis.columns = ['Total Failed', 'Avg Failed', 'Total Orders', 'Trips']
+        if 'Is Pickup Arrived Ontime' in self.df.columns:
+            ontime_analysis = self._breakdown('ontime', [
+                ('Total Failed', 'failed', 'sum'),
+                ('Avg Failed', 'failed', 'mean'),
+                ('Total Orders', 'orders', 'sum'),
+                ('Trips', 'trip', 'count'),
+            ]).round(2)
             ontime_analysis['Failed Rate %'] = (
                 ontime_analysis['Total Failed'] / ontime_analysis['Total Orders'] * 100
             ).round(2)
@@ -235,18 +385,11 @@ class FailedOrdersAnalyzer:
 
         # Analyze by load time
         print(f"{self.failure_column} by Load Time Duration:")
-        failed_copy = self.df[self.df[self.failure_column] > 0].copy()
-        failed_copy['Load Duration Bucket'] = pd.cut(
-            failed_copy['Driver Load Time'],
-            bins=[0, 10, 20, 30, 50, 100, float('inf')],
-            labels=['0-10min', '10-20min', '20-30min', '30-50min', '50-100min', '100+min']
-        )
-
-        load_analysis = failed_copy.groupby('Load Duration Bucket').agg({
-            self.failure_column: ['sum', 'mean'],
-            'Walmart Trip Id': 'count'
-        }).round(2)
-        load_analysis.columns = ['Total Failed', 'Avg Failed', 'Trips']
+        load_analysis = self._breakdown('load', [
+            ('Total Failed', 'failed', 'sum'),
+            ('Avg Failed', 'failed', 'mean'),
+            ('Trips', 'trip', 'count'),
+        ]).round(2)
         print(load_analysis)
         print()
 
@@ -262,7 +405,7 @@ class FailedOrdersAnalyzer:
         total_orders = self.df['Total Orders'].sum()
         overall_rate = (total_failed / total_orders * 100)
 
-        trips_affected = len(self.failed_trips)
+        trips_affected = self.failed_count
         total_trips = len(self.df)
         trip_rate = (trips_affected / total_trips * 100)
 
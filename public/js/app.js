@@ -94,12 +94,12 @@ function initializeUpload() {
     uploadArea.classList.remove('dragover');
     
     const file = e.dataTransfer.files[0];
-    if (file && file.name.endsWith('.csv')) {
+    if (file && /\.(csv|csv\.gz|csv\.zst|zip)$/i.test(file.name)) {
       state.uploadedFile = file;
       fileName.textContent = `✅ ${file.name} (${formatFileSize(file.size)})`;
       fileInput.files = e.dataTransfer.files;
     } else {
-      showNotification('Please upload a CSV file', 'error');
+      showNotification('Please upload a CSV file (.csv, .csv.gz, .csv.zst or .zip)', 'error');
     }
   });
 }
@@ -6,29 +6,75 @@ Shows if low batch density is consistent or only on specific days
 
 import sys
 import json
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Union
 
-def analyze_batch_by_day(csv_path: str, focus_stores: List[int] = None) -> Dict[str, Any]:
-    """Analyze batch density day-by-day for specific stores"""
+from profiling import StageProfiler
+from route_loader import load_routes, parse_dates, json_default, date_window
+from multi_file import resolve_inputs, map_files
 
-    df = pd.read_csv(csv_path)
+# Routes before this date are excluded unless the request sets start_date
+DEFAULT_START_DATE = '2025-10-04'
 
-    # Convert Date column to datetime and filter for Oct 4th onwards
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    df = df[df['Date'] >= '2025-10-04']
+def partial_batch_by_day(csv_path: str, keep: Optional[np.ndarray] = None,
+                         profiler: Optional[StageProfiler] = None,
+                         focus_stores: List[int] = None,
+                         start_date: Optional[str] = DEFAULT_START_DATE,
+                         end_date: Optional[str] = None) -> Dict[str, Any]:
+    """Mergeable store/day route and order counts for one export"""
+    profiler = profiler or StageProfiler()
 
-    # If focus_stores specified, filter to those stores
-    if focus_stores and len(focus_stores) > 0:
-        df = df[df['Store Id'].isin(focus_stores)]
+    # If focus_stores specified, only those stores' rows are read
+    df = load_routes(csv_path, profiler=profiler, keep=keep, start_date=start_date, end_date=end_date,
+                     store_ids=focus_stores if focus_stores else None)
+
+    profiler.begin('parse_dates', rows=len(df))
+    # Convert Date column to datetime (the loader already applied the date window)
+    df['Date'] = parse_dates(df['Date'], errors='coerce')
 
     # Group by Store and Date
-    store_day_groups = df.groupby(['Store Id', 'Date'])
+    profiler.begin('store_day_groupby', rows=len(df))
+    store_days = df.groupby(['Store Id', 'Date']).agg(
+        route_count=('Total Orders', 'size'),
+        total_orders=('Total Orders', 'sum'),
+    )
+    # Carriers/couriers in order of first appearance, like Series.unique()
+    carriers = df[['Store Id', 'Date', 'Carrier']].drop_duplicates()
+    couriers = df[['Store Id', 'Date', 'Courier Name']].drop_duplicates()
+    profiler.end()
+
+    return {'store_days': store_days, 'carriers': carriers, 'couriers': couriers}
+
+def merge_batch_by_day(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-file partials into one, as if the files were concatenated"""
+    if len(partials) == 1:
+        return partials[0]
+    return {
+        'store_days': pd.concat([p['store_days'] for p in partials]).groupby(level=[0, 1], sort=True).sum(),
+        'carriers': pd.concat([p['carriers'] for p in partials], ignore_index=True).drop_duplicates(),
+        'couriers': pd.concat([p['couriers'] for p in partials], ignore_index=True).drop_duplicates(),
+    }
+
+def _values_by_store_day(pairs: pd.DataFrame, column: str) -> Dict[tuple, list]:
+    values = {}
+    for store_id, date, value in zip(pairs['Store Id'], pairs['Date'], pairs[column]):
+        values.setdefault((store_id, date), []).append(value)
+    return values
+
+def finalize_batch_by_day(partial: Dict[str, Any], profiler: Optional[StageProfiler] = None) -> Dict[str, Any]:
+    """Turn merged store/day counts into the day-by-day response"""
+    profiler = profiler or StageProfiler()
+    store_days = partial['store_days']
+
+    profiler.begin('day_by_day', rows=len(store_days))
+    carriers = _values_by_store_day(partial['carriers'], 'Carrier')
+    couriers = _values_by_store_day(partial['couriers'], 'Courier Name')
 
     day_by_day_analysis = []
-    for (store_id, date), group_data in store_day_groups:
-        route_count = len(group_data)
-        total_orders = int(group_data['Total Orders'].sum())
+    for (store_id, date), day in store_days.iterrows():
+        route_count = int(day['route_count'])
+        total_orders = int(day['total_orders'])
         batch_density = round(total_orders / route_count, 2) if route_count > 0 else 0
 
         day_by_day_analysis.append({
@@ -38,55 +84,76 @@ def analyze_batch_by_day(csv_path: str, focus_stores: List[int] = None) -> Dict[
             'route_count': route_count,
             'total_orders': total_orders,
             'batch_density': batch_density,
-            'carriers': group_data['Carrier'].unique().tolist(),
-            'couriers': group_data['Courier Name'].unique().tolist(),
+            'carriers': carriers.get((store_id, date), []),
+            'couriers': couriers.get((store_id, date), []),
         })
 
     # Sort by store and date
     day_by_day_analysis.sort(key=lambda x: (x['store_id'], x['date']))
 
     # Calculate store-level summary
+    profiler.begin('store_summary', rows=len(store_days))
     store_summary = {}
-    df_store_groups = df.groupby('Store Id')
-
-    for store_id, store_data in df_store_groups:
-        dates = store_data['Date'].unique()
-        route_counts_by_day = []
-        batch_densities_by_day = []
 
-        for date in dates:
-            day_data = store_data[store_data['Date'] == date]
-            routes = len(day_data)
-            orders = int(day_data['Total Orders'].sum())
-            batch = round(orders / routes, 2) if routes > 0 else 0
-            route_counts_by_day.append(routes)
-            batch_densities_by_day.append(batch)
+    for store_id, days in store_days.groupby(level=0):
+        route_counts_by_day = days['route_count'].astype(int).tolist()
+        orders_by_day = days['total_orders'].astype(int).tolist()
+        batch_densities_by_day = [
+            round(orders / routes, 2) if routes > 0 else 0
+            for orders, routes in zip(orders_by_day, route_counts_by_day)
+        ]
+        total_routes = sum(route_counts_by_day)
+        total_orders = sum(orders_by_day)
 
         store_summary[int(store_id)] = {
-            'days_operated': len(dates),
-            'total_routes': len(store_data),
-            'total_orders': int(store_data['Total Orders'].sum()),
-            'overall_batch_density': round(int(store_data['Total Orders'].sum()) / len(store_data), 2),
+            'days_operated': len(days),
+            'total_routes': total_routes,
+            'total_orders': total_orders,
+            'overall_batch_density': round(total_orders / total_routes, 2),
             'min_batch_density': round(min(batch_densities_by_day), 2) if batch_densities_by_day else 0,
             'max_batch_density': round(max(batch_densities_by_day), 2) if batch_densities_by_day else 0,
             'avg_batch_density': round(sum(batch_densities_by_day) / len(batch_densities_by_day), 2) if batch_densities_by_day else 0,
             'batch_density_std': round(pd.Series(batch_densities_by_day).std(), 2) if len(batch_densities_by_day) > 1 else 0,
             'consistency': 'High' if (pd.Series(batch_densities_by_day).std() if len(batch_densities_by_day) > 1 else 0) < 5 else 'Low',
         }
+    profiler.end()
 
     return {
         'day_by_day': day_by_day_analysis,
         'store_summary': store_summary,
     }
 
+def analyze_batch_by_day(csv_path: Union[str, List[str]], focus_stores: List[int] = None,
+                         profiler: Optional[StageProfiler] = None,
+                         workers: Optional[int] = None,
+                         start_date: Optional[str] = DEFAULT_START_DATE,
+                         end_date: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze batch density day-by-day for specific stores (one file, a glob or a list)"""
+    profiler = profiler or StageProfiler()
+
+    partials = map_files(resolve_inputs(csv_path), partial_batch_by_day, workers=workers,
+                         profiler=profiler, focus_stores=focus_stores,
+                         start_date=start_date, end_date=end_date)
+    with profiler.stage('merge_partials', rows=len(partials)):
+        merged = merge_batch_by_day(partials)
+    return finalize_batch_by_day(merged, profiler)
+
 def main():
     input_data = json.load(sys.stdin)
     csv_path = input_data['csv_path']
     focus_stores = input_data.get('focus_stores', None)
+    start_date, end_date = date_window(input_data, default_start=DEFAULT_START_DATE)
+    profiler = StageProfiler.from_request(input_data)
+
+    with profiler.run():
+        results = analyze_batch_by_day(csv_path, focus_stores, profiler,
+                                       workers=input_data.get('workers'),
+                                       start_date=start_date, end_date=end_date)
 
-    results = analyze_batch_by_day(csv_path, focus_stores)
+        with profiler.stage('json_encode'):
+            result_json = json.dumps(results, indent=2, default=json_default)
 
-    print(json.dumps(results, indent=2))
+    print(profiler.attach(result_json))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+BigQuery Store Metrics Analysis - Walmart Data
+Shows useful operational metrics per store:
+- Dwell time at store
+- Load time
+- Driving time (planned trip time)
+- Volume metrics (trips, orders, stores)
+
+Store metrics are built from per-store sums, so a download can be
+aggregated batch by batch as it arrives (see scripts/bigquery_pipeline.py)
+and give the same answer as reading the finished CSV. For the same reason a
+large file can be hash-partitioned by store_id over several processes
+("partitions" in the request) with identical results.
+
+start_date/end_date limit the rows to a window of slot_dt days, and
+"profile": true attaches per-stage timings, as in the other analyses.
+"""
+
+import sys
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional
+
+from profiling import StageProfiler
+from compressed_input import read_csv
+from route_loader import find_date_column, date_window_mask, date_window
+from multi_file import map_partitions, partition_count
+
+# Summed BigQuery columns -> output name
+SUM_COLUMNS = {
+    'total_trips_completed': 'route_count',
+    'Order_Count': 'total_orders',
+    'Total_Deliveries_Delivered_Returned': 'delivered_orders',
+    'DWELL_TIME_PER_TRIP_NUM': 'dwell_num',
+    'DWELL_TIME_PER_TRIP_DEN': 'dwell_den',
+    'loading_time_per_trip_num': 'load_num',
+    'loading_time_per_trip_den': 'load_den',
+    'driving_time_per_trip_num': 'drive_num',
+    'driving_time_per_trip_den': 'drive_den',
+}
+CARRIER_COLUMN = 'carrier_org_nm'
+
+
+def safe_divide(num, den):
+    """Safe division with NaN/Inf handling"""
+    if pd.isna(num) or pd.isna(den) or den == 0:
+        return 0
+    result = num / den
+    if pd.isna(result) or result == float('inf') or result == float('-inf'):
+        return 0
+    return round(result, 2)
+
+
+def partial_store_kpis(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Mergeable sums for one batch of BigQuery rows.
+
+    Returns:
+        overall: column sums over every row
+        stores: per-store column sums
+        store_carriers: (store_id, carrier) pairs in order of appearance
+    """
+    df = df.rename(columns=lambda col: col.strip())
+    sums = df[list(SUM_COLUMNS)].apply(pd.to_numeric, errors='coerce').rename(columns=SUM_COLUMNS)
+
+    stores = sums.groupby(df['store_id']).sum()
+    if CARRIER_COLUMN in df.columns:
+        store_carriers = df[['store_id', CARRIER_COLUMN]].dropna(subset=['store_id']).drop_duplicates()
+    else:
+        store_carriers = pd.DataFrame(columns=['store_id', CARRIER_COLUMN])
+
+    return {
+        'overall': sums.sum(),
+        'stores': stores,
+        'store_carriers': store_carriers,
+    }
+
+
+def merge_store_kpis(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine batch partials (in arrival order) into one"""
+    if len(partials) == 1:
+        return partials[0]
+    return {
+        'overall': sum((p['overall'] for p in partials[1:]), partials[0]['overall']),
+        'stores': pd.concat([p['stores'] for p in partials]).groupby(level=0).sum(),
+        'store_carriers': pd.concat([p['store_carriers'] for p in partials], ignore_index=True).drop_duplicates(),
+    }
+
+
+def _safe_ratio(num: pd.Series, den: pd.Series) -> pd.Series:
+    """Vectorized safe_divide (Python round, so values match it exactly)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (num / den.where(den != 0)).replace([np.inf, -np.inf], np.nan)
+    return ratio.map(lambda value: round(value, 2)).fillna(0)
+
+
+def finalize_store_kpis(partial: Dict[str, Any], top_n: int = 10, bottom_n: int = 10) -> Dict[str, Any]:
+    """Build the analysis response from merged sums"""
+    totals = partial['overall']
+    stores = partial['stores']
+
+    # ===== OVERALL METRICS =====
+    total_routes = int(totals['route_count'])
+    total_orders = int(totals['total_orders'])
+
+    # Calculate average dwell time, load time, driving time
+    avg_dwell = safe_divide(totals['dwell_num'], totals['dwell_den'])
+    avg_load = safe_divide(totals['load_num'], totals['load_den'])
+    avg_drive = safe_divide(totals['drive_num'], totals['drive_den'])
+
+    overall = {
+        'total_routes': total_routes,
+        'total_orders': total_orders,
+        'total_delivered': int(totals['delivered_orders']),
+        'unique_stores': len(stores),
+        'batch_density': safe_divide(total_orders, total_routes),
+        'avg_dwell_time': avg_dwell,
+        'avg_load_time': avg_load,
+        'avg_driving_time': avg_drive,
+        'avg_total_time': avg_dwell + avg_load + avg_drive
+    }
+
+    # ===== STORE-LEVEL METRICS =====
+    table = pd.DataFrame({
+        'store_id': stores.index.astype(int),
+        'route_count': stores['route_count'].astype(int).to_numpy(),
+        'total_orders': stores['total_orders'].astype(int).to_numpy(),
+        'delivered_orders': stores['delivered_orders'].astype(int).to_numpy(),
+        'batch_density': _safe_ratio(stores['total_orders'], stores['route_count']).to_numpy(),
+        'avg_dwell_time': _safe_ratio(stores['dwell_num'], stores['dwell_den']).to_numpy(),
+        'avg_load_time': _safe_ratio(stores['load_num'], stores['load_den']).to_numpy(),
+        'avg_driving_time': _safe_ratio(stores['drive_num'], stores['drive_den']).to_numpy(),
+    })
+    table['avg_total_time'] = table['avg_dwell_time'] + table['avg_load_time'] + table['avg_driving_time']
+
+    pairs = partial['store_carriers']
+    if len(pairs):
+        carriers = {}
+        for store_id, carrier in zip(pairs['store_id'], pairs[CARRIER_COLUMN]):
+            carriers.setdefault(store_id, []).append(carrier)
+        table['carriers'] = [carriers.get(store_id, []) for store_id in stores.index]
+    else:
+        table['carriers'] = [['Nash']] * len(table)
+
+    store_metrics = table.to_dict('records')
+
+    # Sort stores by batch density (highest first)
+    stores_sorted = sorted(store_metrics, key=lambda x: x['batch_density'], reverse=True)
+
+    # Apply ranking
+    if top_n == -1:
+        top_10_stores = stores_sorted
+        bottom_10_stores = []
+    else:
+        top_10_stores = stores_sorted[:top_n]
+        bottom_10_stores = stores_sorted[-bottom_n:] if bottom_n > 0 else []
+
+    return {
+        'overall': overall,
+        'store_metrics': store_metrics,
+        'top_10_stores': top_10_stores,
+        'bottom_10_stores': bottom_10_stores
+    }
+
+
+def analyze_bigquery_store_metrics(csv_path: str, top_n: int = 10, bottom_n: int = 10,
+                                   partitions: int = 1,
+                                   profiler: Optional[StageProfiler] = None,
+                                   start_date: Optional[str] = None,
+                                   end_date: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze BigQuery data with store-level operational metrics (days in [start_date, end_date])"""
+    profiler = profiler or StageProfiler()
+
+    with profiler.stage('read_csv') as stage:
+        df = read_csv(csv_path)
+        df = df.rename(columns=lambda col: col.strip())
+        stage.rows = len(df)
+    print(f"Loaded {len(df)} rows", file=sys.stderr)
+    print(f"Columns: {df.columns.tolist()[:20]}", file=sys.stderr)
+
+    if start_date is not None or end_date is not None:
+        date_column = find_date_column(df.columns)
+        if date_column is None:
+            raise ValueError("CSV must have either 'Date', 'Report Date', or 'slot_dt' column to filter by date")
+        with profiler.stage('date_window', rows=len(df)):
+            df = df[date_window_mask(df[date_column], start_date, end_date)].reset_index(drop=True)
+
+    if partitions > 1:
+        # Each store's rows sit in one partition, so merging only concatenates stores
+        partials = map_partitions(df, 'store_id', partial_store_kpis, partitions, profiler=profiler)
+        with profiler.stage('merge_partials', rows=len(partials)):
+            merged = merge_store_kpis(partials)
+    else:
+        with profiler.stage('store_sums', rows=len(df)):
+            merged = partial_store_kpis(df)
+
+    with profiler.stage('finalize'):
+        return finalize_store_kpis(merged, top_n, bottom_n)
+
+
+def ranking_limits(input_data: Dict[str, Any]) -> tuple:
+    """top_n / bottom_n from a request ('all' lists every store)"""
+    top_n = input_data.get('top_n', 10)
+    bottom_n = input_data.get('bottom_n', 10)
+    if str(top_n).lower() == 'all':
+        return -1, -1
+    return int(top_n), int(bottom_n)
+
+
+def main():
+    try:
+        input_data = json.load(sys.stdin)
+        csv_path = input_data['csv_path']
+        top_n, bottom_n = ranking_limits(input_data)
+        start_date, end_date = date_window(input_data)
+        profiler = StageProfiler.from_request(input_data)
+
+        with profiler.run():
+            results = analyze_bigquery_store_metrics(csv_path, top_n, bottom_n,
+                                                     partition_count(input_data.get('partitions')),
+                                                     profiler, start_date=start_date, end_date=end_date)
+            with profiler.stage('json_encode'):
+                result_json = json.dumps(results, indent=2, default=str)
+                result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+        print(profiler.attach(result_json))
+    except Exception as e:
+        print(f"Error in analysis: {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
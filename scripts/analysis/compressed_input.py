@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Compressed Input
+Lets every loader read .csv.gz, .csv.zst and .zip exports as if they were
+plain CSV. Compression is recognised by file extension or, failing that, by
+the file's magic bytes (uploads are saved as .csv whatever they contain).
+
+Files are decoded as a stream - never unpacked to disk or fully into memory
+- and decompression runs on a read-ahead thread, so on a multi-core machine
+the next blocks are inflated while pandas parses the current ones (zlib and
+zstd release the GIL while decoding).
+"""
+
+import io
+import gzip
+import queue
+import zipfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Extension -> codec
+COMPRESSED_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd', '.zip': 'zip'}
+
+# Leading bytes -> codec, for compressed files with a plain .csv name
+MAGIC_BYTES = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd', b'PK\x03\x04': 'zip'}
+
+# Decompressed bytes per block, and blocks decoded ahead of the parser
+READ_BLOCK_BYTES = 1 << 20
+READ_AHEAD_BLOCKS = 8
+
+# Zip members that can hold the export when an archive has several files
+TABLE_SUFFIXES = ('.csv', '.tsv', '.txt')
+
+
+def compression_of(path: str) -> Optional[str]:
+    """Codec of a file ('gzip', 'zstd', 'zip') or None for plain text"""
+    codec = COMPRESSED_SUFFIXES.get(Path(path).suffix.lower())
+    if codec is not None:
+        return codec
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(4)
+    except OSError:
+        return None  # let the reader report the missing file
+    for magic, codec in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def is_compressed(path: str) -> bool:
+    return compression_of(path) is not None
+
+
+def split_suffix(path: str) -> Tuple[str, str]:
+    """('name', '.csv.gz') for 'dir/name.csv.gz' - the stem without any compression suffix"""
+    name = Path(path).name
+    suffix = ''
+    if Path(name).suffix.lower() in COMPRESSED_SUFFIXES:
+        suffix = Path(name).suffix
+        name = name[:-len(suffix)]
+    inner = Path(name).suffix
+    if inner:
+        name = name[:-len(inner)]
+    return name, inner + suffix
+
+
+# ===== DECODING =====
+
+class ReadAheadStream(io.RawIOBase):
+    """Raw stream that decodes the source on a background thread, a few blocks ahead"""
+
+    def __init__(self, source: BinaryIO, block_bytes: int = READ_BLOCK_BYTES,
+                 blocks: int = READ_AHEAD_BLOCKS):
+        super().__init__()
+        self._source = source
+        self._block_bytes = block_bytes
+        self._blocks = queue.Queue(blocks)
+        self._stop = threading.Event()
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, name='decompress', daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                block = self._source.read(self._block_bytes)
+                if not block:
+                    break
+                if not self._put(block):
+                    return
+        except Exception as e:
+            # Raised to the reader in its own thread
+            self._put(e)
+            return
+        self._put(None)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            item = self._blocks.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            self._pending = memoryview(item)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+def _zip_member(archive: zipfile.ZipFile) -> str:
+    """The export inside an archive: its only file, or its only CSV/TSV/TXT file"""
+    files = [info.filename for info in archive.infolist()
+             if not info.is_dir() and not info.filename.startswith('__MACOSX/')]
+    if len(files) == 1:
+        return files[0]
+    tables = [name for name in files if name.lower().endswith(TABLE_SUFFIXES)]
+    if len(tables) == 1:
+        return tables[0]
+    raise ValueError(f"Expected one CSV in {archive.filename}, found: {', '.join(files) or 'nothing'}")
+
+
+def _decoder(path: str, codec: str) -> BinaryIO:
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError(f"Reading {path} needs the zstandard package (pip install zstandard)")
+        # Exports written in several frames (pzstd, appended chunks) read as one stream
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_size=READ_BLOCK_BYTES, read_across_frames=True, closefd=True)
+    if codec == 'zip':
+        # The member keeps the file open after the archive object is closed
+        with zipfile.ZipFile(path) as archive:
+            return archive.open(_zip_member(archive))
+    raise ValueError(f"Unknown compression '{codec}'")
+
+
+@contextmanager
+def open_input(path: str) -> Iterator[BinaryIO]:
+    """Binary stream of a file's (decompressed) contents"""
+    codec = compression_of(path)
+    if codec is None:
+        with open(path, 'rb') as f:
+            yield f
+        return
+
+    stream = io.BufferedReader(ReadAheadStream(_decoder(path, codec)), READ_BLOCK_BYTES)
+    try:
+        yield stream
+    finally:
+        stream.close()
+
+
+def read_head(path: str, size: int) -> bytes:
+    """First bytes of a file's decompressed contents (for sniffing encodings)"""
+    with open_input(path) as stream:
+        return stream.read(size)
+
+
+# ===== PANDAS =====
+
+def _read_csv_chunks(path: str, kwargs: Any) -> Iterator[pd.DataFrame]:
+    with open_input(path) as stream:
+        with pd.read_csv(stream, **kwargs) as reader:
+            yield from reader
+
+
+def read_csv(path: str, **kwargs):
+    """
+    pd.read_csv for plain or compressed exports.
+
+    Takes the same arguments; with chunksize it returns an iterator of
+    chunks (the file stays open until the iterator is exhausted or closed).
+    """
+    if compression_of(path) is None:
+        return pd.read_csv(path, **kwargs)
+    if kwargs.get('chunksize'):
+        return _read_csv_chunks(path, kwargs)
+    with open_input(path) as stream:
+        return pd.read_csv(stream, **kwargs)
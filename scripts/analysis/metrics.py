@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Derived Route Metrics
+Every per-route column the analyses derive from an export (hours, DPH,
+variances, rates) is declared here once, with the columns it is computed
+from. derive() plans just the metrics a caller asks for, computes them in
+dependency order and remembers them on the frame, so a later analysis of
+the same loaded routes (or a filtered slice of them) reuses the columns
+instead of recomputing them.
+
+    df = load_routes(csv_path)
+    derive(df, ['DPH', 'Returns Rate'])   # Total Time Hours comes along as a dependency
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Metric name -> (columns it depends on, function computing it from the frame)
+METRICS: Dict[str, Tuple[Tuple[str, ...], Callable[[pd.DataFrame], pd.Series]]] = {}
+
+# df.attrs key listing the metrics already derived on a frame. pandas carries
+# attrs through row filters and copies, along with the columns themselves.
+DERIVED_ATTR = 'derived_metrics'
+
+
+def metric(name: str, *depends_on: str):
+    """Register a derived column; dependencies are export columns or other metrics"""
+    def register(fn):
+        if name in METRICS:
+            raise ValueError(f"Metric '{name}' is already registered")
+        METRICS[name] = (depends_on, fn)
+        return fn
+    return register
+
+
+# ===== HOURS =====
+
+@metric('Total Time Hours', 'Driver Total Time')
+def _total_time_hours(df):
+    return df['Driver Total Time'] / 60
+
+
+@metric('Actual Time Hours', 'Trip Actual Time')
+def _actual_time_hours(df):
+    return df['Trip Actual Time'] / 60
+
+
+@metric('Planned Time Hours', 'Estimated Duration')
+def _planned_time_hours(df):
+    return df['Estimated Duration'] / 60
+
+
+# ===== PRODUCTIVITY =====
+
+@metric('DPH', 'Delivered Orders', 'Total Time Hours')
+def _dph(df):
+    """Deliveries per hour of driver time (0 when no time was logged)"""
+    hours = df['Total Time Hours'].astype('float64')
+    delivered = df['Delivered Orders'].astype('float64')
+    return pd.Series(np.where(hours == 0, 0, delivered / hours.where(hours != 0)), index=df.index)
+
+
+@metric('drops_per_hour', 'Total Orders', 'Trip Actual Time')
+def _drops_per_hour(df):
+    # Divides by trip minutes, not hours - the returns low-efficiency flag
+    # has always been evaluated against this value
+    return (df['Total Orders'] / df['Trip Actual Time']).round(2)
+
+
+# ===== VARIANCE =====
+
+@metric('Variance Minutes', 'Trip Actual Time', 'Estimated Duration')
+def _variance_minutes(df):
+    return df['Trip Actual Time'] - df['Estimated Duration']
+
+
+@metric('Variance Hours', 'Variance Minutes')
+def _variance_hours(df):
+    return df['Variance Minutes'] / 60
+
+
+@metric('variance_pct', 'Variance Minutes', 'Estimated Duration')
+def _variance_pct(df):
+    return (df['Variance Minutes'] / df['Estimated Duration'] * 100).round(2)
+
+
+# ===== RATES =====
+
+@metric('Returns Rate', 'Returned Orders', 'Total Orders')
+def _returns_rate(df):
+    return (df['Returned Orders'] / df['Total Orders']).fillna(0)
+
+
+@metric('return_rate', 'Returns Rate')
+def _return_rate_pct(df):
+    return (df['Returns Rate'] * 100).round(2)
+
+
+@metric('Pending Rate', 'Pending Orders', 'Total Orders')
+def _pending_rate(df):
+    return (df['Pending Orders'] / df['Total Orders']).fillna(0)
+
+
+@metric('Has Pending', 'Pending Orders')
+def _has_pending(df):
+    return df['Pending Orders'] > 0
+
+
+@metric('High Pending', 'Pending Rate')
+def _high_pending(df):
+    return df['Pending Rate'] > 0.20  # >20% pending
+
+
+# ===== PLANNER =====
+
+def derived_columns(df: pd.DataFrame) -> List[str]:
+    """Metrics already derived (and still present) on a frame"""
+    return [name for name in df.attrs.get(DERIVED_ATTR, []) if name in df.columns]
+
+
+def plan(columns: List[str], derived: Optional[List[str]] = None) -> List[str]:
+    """
+    Metrics to compute, in dependency order, to produce the requested columns.
+
+    Args:
+        columns: Metric names the caller needs
+        derived: Metrics already present, which are not recomputed
+
+    Returns:
+        Metric names; each appears after everything it depends on
+    """
+    done = set(derived or [])
+    order: List[str] = []
+    visiting = set()
+
+    def visit(name):
+        if name in done or name not in METRICS:
+            # Export columns are inputs, not planned
+            return
+        if name in visiting:
+            raise ValueError(f"Metric dependency cycle at '{name}'")
+        visiting.add(name)
+        for dependency in METRICS[name][0]:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in columns:
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric '{name}' (registered: {', '.join(sorted(METRICS))})")
+        visit(name)
+    return order
+
+
+def derive(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """
+    Add the requested metrics (and their dependencies) to df in place.
+
+    Metrics already derived on df are reused, so calling this again with
+    overlapping columns only computes what is missing.
+
+    Args:
+        df: Loaded routes
+        columns: Metric names to make available
+
+    Returns:
+        The same frame, for chaining
+    """
+    derived = derived_columns(df)
+    steps = plan(columns, derived)
+    if not steps:
+        return df
+
+    missing = sorted({dependency for name in steps for dependency in METRICS[name][0]
+                      if dependency not in METRICS and dependency not in df.columns})
+    if missing:
+        raise ValueError(f"Missing columns for {', '.join(steps)}: {', '.join(missing)}")
+
+    for name in steps:
+        df[name] = METRICS[name][1](df)
+    df.attrs[DERIVED_ATTR] = derived + steps
+    return df
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Multi-File Analysis Inputs
+Lets every analysis take a list of exports or a glob instead of one CSV.
+Files are processed in parallel, one process per file, and each worker
+returns a mergeable partial aggregate. Trips repeated across overlapping
+exports (e.g. two weekly downloads sharing a day) are dropped before
+aggregation, keeping the copy from the earliest file.
+
+A single large export can be spread over cores the same way: its rows are
+hash-partitioned by a key (Store Id), so every group lives in exactly one
+partition and each worker aggregates its groups independently.
+"""
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+
+from profiling import StageProfiler
+from compressed_input import read_csv
+
+# A trip is identified by its Walmart Trip Id when the export has one;
+# otherwise by the columns that pin a single route run
+TRIP_ID_COLUMN = 'Walmart Trip Id'
+FALLBACK_TRIP_KEY = ['Date', 'Store Id', 'Carrier', 'Courier Name', 'Trip Planned Start']
+
+_GLOB_CHARS = set('*?[')
+
+
+def resolve_inputs(csv_path: Union[str, Sequence[str]]) -> List[str]:
+    """
+    Expand the request's csv_path into a list of files.
+
+    Accepts a single path, a glob pattern ("data/weekly-*.csv") or a list
+    mixing both. Globs expand in sorted order so runs are reproducible.
+    """
+    patterns = [csv_path] if isinstance(csv_path, str) else list(csv_path)
+    paths = []
+    for pattern in patterns:
+        if _GLOB_CHARS & set(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise FileNotFoundError(f"No files match {pattern}")
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+
+    if not paths:
+        raise ValueError("csv_path must name at least one file")
+    # The same file listed twice would be all duplicates anyway
+    return list(dict.fromkeys(paths))
+
+
+def trip_key_columns(paths: List[str]) -> List[str]:
+    """Trip key usable in every file (only headers are read)"""
+    headers = [set(read_csv(path, nrows=0).columns) for path in paths]
+    common = set.intersection(*headers)
+    if TRIP_ID_COLUMN in common:
+        return [TRIP_ID_COLUMN]
+    key = [col for col in FALLBACK_TRIP_KEY if col in common]
+    if not key:
+        raise ValueError("Files share no trip key columns; cannot drop duplicate trips")
+    return key
+
+
+def trip_key_hashes(csv_path: str, key_columns: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    64-bit hash of each row's trip key, read as text so dtypes can't differ
+    between files, plus which rows have no key at all (every key column blank).
+    """
+    keys = read_csv(csv_path, usecols=key_columns, dtype=str, keep_default_na=False)[key_columns]
+    blank = (keys.apply(lambda column: column.str.strip()) == '').all(axis=1).to_numpy()
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy(), blank
+
+
+def duplicate_trip_masks(paths: List[str], workers: Optional[int] = None) -> List[Optional[np.ndarray]]:
+    """
+    Keep-masks that drop trips already seen in an earlier file.
+
+    Duplicates within a single file are left alone - only overlap between
+    exports is removed. Rows without a trip key can't be matched to
+    anything, so they are always kept. A None mask means keep every row.
+    """
+    key_columns = trip_key_columns(paths)
+    with ProcessPoolExecutor(max_workers=_pool_size(workers, len(paths))) as pool:
+        keys = list(pool.map(trip_key_hashes, paths, [key_columns] * len(paths)))
+
+    masks = []
+    seen = np.empty(0, dtype=np.uint64)
+    for file_hashes, blank in keys:
+        keep = blank | ~np.isin(file_hashes, seen)
+        masks.append(None if keep.all() else keep)
+        seen = np.union1d(seen, file_hashes[~blank])
+    return masks
+
+
+def _pool_size(workers: Optional[int], tasks: int) -> int:
+    return max(1, min(workers or os.cpu_count() or 1, tasks))
+
+
+def map_files(paths: List[str], partial_fn: Callable[..., Any], workers: Optional[int] = None,
+              dedupe: bool = True, profiler: Optional[StageProfiler] = None, **kwargs) -> List[Any]:
+    """
+    Run `partial_fn(csv_path, keep=mask, **kwargs)` for every file.
+
+    A single file runs in-process (with the profiler, so per-stage timings
+    still work); several files fan out over a process pool and the partials
+    come back in input order for the caller to merge.
+    """
+    profiler = profiler or StageProfiler()
+
+    if len(paths) == 1:
+        return [partial_fn(paths[0], profiler=profiler, **kwargs)]
+
+    masks = [None] * len(paths)
+    if dedupe:
+        with profiler.stage('dedupe_trips') as stage:
+            masks = duplicate_trip_masks(paths, workers)
+            stage.rows = sum(len(mask) - int(mask.sum()) for mask in masks if mask is not None)
+
+    with profiler.stage('file_partials'):
+        with ProcessPoolExecutor(max_workers=_pool_size(workers, len(paths))) as pool:
+            futures = [pool.submit(partial_fn, path, keep=mask, **kwargs) for path, mask in zip(paths, masks)]
+            return [future.result() for future in futures]
+
+
+def partition_count(partitions: Any) -> int:
+    """Partitions requested ('auto' = one per core; None/0/1 = no partitioning)"""
+    if str(partitions).lower() == 'auto':
+        return os.cpu_count() or 1
+    return max(1, int(partitions or 1))
+
+
+def hash_partitions(keys: pd.Series, partitions: int) -> List[np.ndarray]:
+    """
+    Row positions of each hash partition of keys.
+
+    Every row of a key lands in the same partition, and rows keep their
+    export order within it.
+    """
+    buckets = (pd.util.hash_pandas_object(keys, index=False).to_numpy() % np.uint64(partitions)).astype(np.int64)
+    order = np.argsort(buckets, kind='stable')
+    bounds = np.searchsorted(buckets[order], np.arange(partitions + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(partitions)]
+
+
+def map_partitions(df: pd.DataFrame, key: str, partial_fn: Callable[..., Any], partitions: int,
+                   workers: Optional[int] = None, profiler: Optional[StageProfiler] = None,
+                   **kwargs) -> List[Any]:
+    """
+    Run `partial_fn(partition, **kwargs)` on hash partitions of df by key.
+
+    Partitions run over a process pool and come back in partition order;
+    empty ones are skipped. Partition frames keep df's row labels so callers
+    can restore export order where ties depend on it.
+    """
+    profiler = profiler or StageProfiler()
+
+    with profiler.stage('hash_partition', rows=len(df)):
+        parts = [rows for rows in hash_partitions(df[key], partitions) if len(rows)]
+
+    with profiler.stage('partition_partials', rows=len(parts)):
+        if len(parts) <= 1:
+            return [partial_fn(df, **kwargs)]
+        with ProcessPoolExecutor(max_workers=_pool_size(workers, len(parts))) as pool:
+            futures = [pool.submit(partial_fn, df.iloc[rows], **kwargs) for rows in parts]
+            return [future.result() for future in futures]
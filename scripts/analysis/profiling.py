@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Per-Stage Profiling for Analysis Scripts
+Opt-in timing and memory instrumentation. Enable with the request flag
+`"profile": true` or the ROUTE_ANALYZER_PROFILE=1 environment variable;
+set `"profile_dump"` / ROUTE_ANALYZER_PROFILE_DUMP to also write a cProfile
+stats file. Results are attached to the JSON output under `_profile`.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_ENV = 'ROUTE_ANALYZER_PROFILE'
+PROFILE_DUMP_ENV = 'ROUTE_ANALYZER_PROFILE_DUMP'
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None if unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+class _Stage:
+    """Mutable record yielded by StageProfiler.stage so callers can set row counts"""
+
+    __slots__ = ('rows',)
+
+    def __init__(self, rows: Optional[int] = None):
+        self.rows = rows
+
+
+class StageProfiler:
+    """Records wall time, rows processed and peak RSS per named stage"""
+
+    def __init__(self, enabled: bool = False, dump_path: Optional[str] = None):
+        self.enabled = enabled or bool(dump_path)
+        self.dump_path = dump_path
+        self.stages = []
+        self.extra = {}
+        self._started = None
+        self._elapsed = None
+        self._cprofile = None
+        self._current = None
+
+    @classmethod
+    def from_request(cls, request: Dict[str, Any]) -> 'StageProfiler':
+        """Build a profiler from the stdin request and environment"""
+        env_flag = os.getenv(PROFILE_ENV, '').lower() in ('1', 'true', 'yes')
+        enabled = bool(request.get('profile')) or env_flag
+        dump_path = request.get('profile_dump') or os.getenv(PROFILE_DUMP_ENV) or None
+        return cls(enabled=enabled, dump_path=dump_path)
+
+    @contextmanager
+    def run(self):
+        """Wrap a whole analysis run (starts cProfile when a dump path is set)"""
+        if not self.enabled:
+            yield self
+            return
+
+        self._started = time.perf_counter()
+        if self.dump_path:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        try:
+            yield self
+        finally:
+            self.end()
+            if self._cprofile is not None:
+                self._cprofile.disable()
+                self._cprofile.dump_stats(self.dump_path)
+            self._elapsed = time.perf_counter() - self._started
+
+    def begin(self, name: str, rows: Optional[int] = None) -> None:
+        """Start a stage, closing the previous one (for long linear functions)"""
+        if not self.enabled:
+            return
+        self.end()
+        self._current = (name, rows, time.perf_counter())
+
+    def end(self, rows: Optional[int] = None) -> None:
+        """Close the open stage; `rows` overrides the count given to begin()"""
+        if not self.enabled or self._current is None:
+            return
+        name, begin_rows, start = self._current
+        self._current = None
+        rows = rows if rows is not None else begin_rows
+        self.stages.append({
+            'stage': name,
+            'seconds': round(time.perf_counter() - start, 4),
+            'rows': int(rows) if rows is not None else None,
+            'peak_rss_mb': peak_rss_mb(),
+        })
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None):
+        """Time one block; set `.rows` on the yielded record if unknown up front"""
+        record = _Stage(rows)
+        self.begin(name, rows)
+        try:
+            yield record
+        finally:
+            self.end(record.rows)
+
+    def report(self) -> Dict[str, Any]:
+        """Profile summary attached to the result under `_profile`"""
+        total = self._elapsed
+        if total is None and self._started is not None:
+            total = time.perf_counter() - self._started
+        return {
+            'total_seconds': round(total, 4) if total is not None else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+            'cprofile_file': self.dump_path,
+            **self.extra,
+        }
+
+    def attach(self, result_json: str) -> str:
+        """
+        Splice `_profile` into an already-encoded JSON object.
+        Avoids encoding the (potentially large) result a second time.
+        """
+        if not self.enabled:
+            return result_json
+
+        body = result_json.rstrip()
+        if not body.endswith('}'):
+            return result_json
+
+        head = body[:-1].rstrip()
+        separator = '' if head.endswith('{') else ','
+        profile_json = json.dumps(self.report(), indent=2).replace('\n', '\n  ')
+        return f'{head}{separator}\n  "_profile": {profile_json}\n}}'
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Mergeable Quantile Sketches
+KLL sketch for medians and percentiles in chunked, multi-file and
+incremental pipelines. Sketches are built per group, serialized to plain
+dicts, and merged across chunks or processes without holding every value.
+Small groups (no more values than the sketch capacity) stay exact and
+interpolate like pandas' median/quantile. An epsilon of EXACT keeps every
+value, for callers whose data is in memory anyway.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Hashable, Iterable, List, Optional
+
+# Rank error of 1% keeps every published median within ~1 percentile
+DEFAULT_EPSILON = 0.01
+# No compaction at all: quantiles are pandas' exact ones
+EXACT = 0
+
+# Capacity of the lower levels shrinks geometrically by this factor
+_LEVEL_DECAY = 2 / 3
+_MIN_LEVEL_CAPACITY = 8
+
+
+def k_for_epsilon(epsilon: float) -> int:
+    """
+    Sketch size parameter k for a target normalized rank error.
+    Uses the empirical KLL bound eps ≈ 2.446 / k^0.9433 (two-sided).
+    EXACT gives k = 0, a sketch that never compacts.
+    """
+    if epsilon == EXACT:
+        return 0
+    if not 0 < epsilon < 1:
+        raise ValueError("epsilon must be between 0 and 1")
+    return max(_MIN_LEVEL_CAPACITY, int(math.ceil((2.446 / epsilon) ** (1 / 0.9433))))
+
+
+class KLLSketch:
+    """Mergeable KLL quantile sketch over float values"""
+
+    def __init__(self, epsilon: float = DEFAULT_EPSILON, k: Optional[int] = None,
+                 seed: Optional[int] = 0):
+        self.k = k if k is not None else k_for_epsilon(epsilon)
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._rng = np.random.default_rng(seed)
+
+    # ===== BUILDING =====
+
+    def update(self, values: Iterable[float]) -> 'KLLSketch':
+        """Add a batch of values (NaNs are skipped, like pandas)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Merge another sketch into this one (in place)"""
+        if other.count == 0:
+            return self
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches with different k ({self.k} vs {other.k})")
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for depth, items in enumerate(other.levels):
+            if len(items):
+                self.levels[depth] = np.concatenate([self.levels[depth], items])
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _capacity(self, depth: int) -> int:
+        height = len(self.levels)
+        return max(_MIN_LEVEL_CAPACITY, int(math.ceil(self.k * _LEVEL_DECAY ** (height - depth - 1))))
+
+    def _compress(self) -> None:
+        """Compact over-full levels: sort, keep every other item, promote a level up"""
+        if self.k == 0:
+            return
+        depth = 0
+        while depth < len(self.levels):
+            items = self.levels[depth]
+            if len(items) > self._capacity(depth):
+                if depth + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+
+                items = np.sort(items)
+                # An odd item stays behind so total weight is preserved exactly;
+                # which one is random, so no end of the range is favoured
+                if len(items) % 2:
+                    stay = int(self._rng.integers(0, len(items)))
+                    keep, paired = items[stay:stay + 1], np.delete(items, stay)
+                else:
+                    keep, paired = items[:0], items
+                offset = int(self._rng.integers(0, 2))
+                promoted = paired[offset::2]
+
+                self.levels[depth] = keep
+                self.levels[depth + 1] = np.concatenate([self.levels[depth + 1], promoted])
+                # Capacities depend on height, so rescan from the bottom
+                depth = 0
+                continue
+            depth += 1
+
+    # ===== QUERYING =====
+
+    @property
+    def is_exact(self) -> bool:
+        """True while every value is still held at weight 1"""
+        return all(len(items) == 0 for items in self.levels[1:])
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q in [0, 1] (NaN for an empty sketch)"""
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        """Values at several quantiles in one pass"""
+        qs = np.asarray(list(qs), dtype=np.float64)
+        if self.count == 0:
+            return [math.nan] * len(qs)
+
+        if self.is_exact:
+            # Linear interpolation, identical to pandas' median/quantile
+            return [float(v) for v in np.quantile(self.levels[0], qs)]
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level), 2 ** depth, dtype=np.float64)
+            for depth, level in enumerate(self.levels)
+        ])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        total = cumulative[-1]
+
+        positions = np.searchsorted(cumulative, qs * total, side='left')
+        positions = np.clip(positions, 0, len(items) - 1)
+        values = items[positions]
+        values[qs <= 0] = self.min
+        values[qs >= 1] = self.max
+        return [float(v) for v in values]
+
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+    # ===== SERIALIZATION =====
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain-dict form (JSON/pickle friendly) for shipping between processes"""
+        return {
+            'k': self.k,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'levels': [level.tolist() for level in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KLLSketch':
+        sketch = cls(k=data['k'])
+        sketch.levels = [np.asarray(level, dtype=np.float64) for level in data['levels']] or [np.empty(0)]
+        sketch.count = data['count']
+        sketch.min = data['min'] if data['min'] is not None else math.inf
+        sketch.max = data['max'] if data['max'] is not None else -math.inf
+        return sketch
+
+    def copy(self) -> 'KLLSketch':
+        return KLLSketch.from_dict(self.to_dict())
+
+
+def group_sketches(df: pd.DataFrame, key, column: str,
+                   epsilon: float = DEFAULT_EPSILON) -> Dict[Hashable, KLLSketch]:
+    """
+    Build one sketch per group with a single sort instead of a Python groupby loop.
+
+    Args:
+        df: Frame holding the key and value columns
+        key: Group column name (or list of names for a tuple key)
+        column: Value column to sketch
+        epsilon: Target rank error
+    """
+    if len(df) == 0:
+        return {}
+
+    keys = df[key]
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(keys) if isinstance(key, list) else keys, sort=False)
+    values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Missing keys are dropped, matching groupby
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    if len(order) == 0:
+        return {}
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+    k = k_for_epsilon(epsilon)
+
+    sketches = {}
+    for chunk in np.split(order, boundaries):
+        group_key = uniques[codes[chunk[0]]]
+        sketches[group_key] = KLLSketch(k=k).update(values[chunk])
+    return sketches
+
+
+def merge_sketch_maps(maps: Iterable[Dict[Hashable, KLLSketch]]) -> Dict[Hashable, KLLSketch]:
+    """Merge per-group sketch dicts from several chunks/processes"""
+    merged: Dict[Hashable, KLLSketch] = {}
+    for sketch_map in maps:
+        for group_key, sketch in sketch_map.items():
+            if group_key in merged:
+                merged[group_key].merge(sketch)
+            else:
+                merged[group_key] = sketch.copy()
+    return merged
+
+
+# ===== PACKED SKETCH MAPS =====
+# A per-group sketch dict flattened into a few arrays: cheap to store and to
+# merge across many chunks (e.g. one per day) with one pass per group,
+# instead of one merge per group per chunk.
+
+def pack_sketch_map(sketches: Dict[Hashable, KLLSketch]) -> Dict[str, Any]:
+    """Flatten a per-group sketch dict (see merge_packed_sketch_maps)"""
+    keys = list(sketches)
+    groups, depths, values = [], [], []
+    for position, group_key in enumerate(keys):
+        for depth, items in enumerate(sketches[group_key].levels):
+            if len(items):
+                groups.append(np.full(len(items), position, dtype=np.int32))
+                depths.append(np.full(len(items), depth, dtype=np.int8))
+                values.append(items)
+
+    def flat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    return {
+        'k': sketches[keys[0]].k if keys else None,
+        'keys': keys,
+        'count': np.array([sketches[key].count for key in keys], dtype=np.int64),
+        'min': np.array([sketches[key].min for key in keys], dtype=np.float64),
+        'max': np.array([sketches[key].max for key in keys], dtype=np.float64),
+        'group': flat(groups, np.int32),
+        'depth': flat(depths, np.int8),
+        'values': flat(values, np.float64),
+    }
+
+
+def merge_packed_sketch_maps(packs: Iterable[Dict[str, Any]]) -> Dict[Hashable, KLLSketch]:
+    """
+    Merge packed sketch maps into per-group sketches.
+
+    Each group's items from every pack are placed on their levels together
+    and compacted once, which is a valid KLL merge of all of them.
+    """
+    packs = [pack for pack in packs if pack['keys']]
+    if not packs:
+        return {}
+    k = packs[0]['k']
+    if any(pack['k'] != k for pack in packs):
+        raise ValueError("Cannot merge sketches with different k")
+
+    codes: Dict[Hashable, int] = {}
+    key_codes, item_codes = [], []
+    for pack in packs:
+        pack_codes = np.array([codes.setdefault(key, len(codes)) for key in pack['keys']], dtype=np.int64)
+        key_codes.append(pack_codes)
+        item_codes.append(pack_codes[pack['group']])
+    key_codes = np.concatenate(key_codes)
+    item_codes = np.concatenate(item_codes)
+    depths = np.concatenate([pack['depth'] for pack in packs])
+    values = np.concatenate([pack['values'] for pack in packs])
+
+    groups = len(codes)
+    count = np.bincount(key_codes, weights=np.concatenate([p['count'] for p in packs]), minlength=groups)
+    low = np.full(groups, math.inf)
+    np.minimum.at(low, key_codes, np.concatenate([p['min'] for p in packs]))
+    high = np.full(groups, -math.inf)
+    np.maximum.at(high, key_codes, np.concatenate([p['max'] for p in packs]))
+
+    # Items grouped by key, then by level
+    order = np.lexsort((depths, item_codes))
+    item_codes, depths, values = item_codes[order], depths[order], values[order]
+    starts = np.searchsorted(item_codes, np.arange(groups + 1))
+
+    merged = {}
+    for group_key, code in codes.items():
+        sketch = KLLSketch(k=k)
+        group_depths = depths[starts[code]:starts[code + 1]]
+        group_values = values[starts[code]:starts[code + 1]]
+        height = int(group_depths[-1]) + 1 if len(group_depths) else 1
+        bounds = np.searchsorted(group_depths, np.arange(height + 1))
+        sketch.levels = [group_values[bounds[d]:bounds[d + 1]] for d in range(height)]
+        sketch.count = int(count[code])
+        sketch.min = float(low[code])
+        sketch.max = float(high[code])
+        sketch._compress()
+        merged[group_key] = sketch
+    return merged
@@ -9,27 +9,21 @@ import json
 import pandas as pd
 import numpy as np
 
-def analyze_returns_breakdown(csv_path, top_n=10):
-    """Analyze routes with highest returns and identify patterns"""
+from profiling import StageProfiler
+from route_loader import load_routes, json_default, widen_floats, date_window
+from multi_file import resolve_inputs, map_files
+from metrics import derive
+from stratified_sample import (
+    DEFAULT_FRACTION, DEFAULT_MIN_PER_STORE, DEFAULT_CONFIDENCE,
+    load_sample, window_mask, estimate, with_intervals,
+)
 
-    # Read the CSV
-    df = pd.read_csv(csv_path)
-
-    # Filter only routes with returns
-    routes_with_returns = df[df['Returned Orders'] > 0].copy()
-
-    if routes_with_returns.empty:
-        return {
-            'top_return_routes': [],
-            'total_routes_with_returns': 0,
-            'total_returns': 0,
-            'patterns': {}
-        }
+def flag_return_routes(routes_with_returns, profiler=None):
+    """Add contributing-factor flags and likely causes to routes that had returns (in place)"""
+    profiler = profiler or StageProfiler()
 
     # Calculate key metrics for analysis
-    routes_with_returns['return_rate'] = (routes_with_returns['Returned Orders'] / routes_with_returns['Total Orders'] * 100).round(2)
-    routes_with_returns['variance_pct'] = ((routes_with_returns['Trip Actual Time'] - routes_with_returns['Estimated Duration']) / routes_with_returns['Estimated Duration'] * 100).round(2)
-    routes_with_returns['drops_per_hour'] = (routes_with_returns['Total Orders'] / routes_with_returns['Trip Actual Time']).round(2)
+    derive(routes_with_returns, ['return_rate', 'variance_pct', 'drops_per_hour'])
 
     # Thresholds for analysis
     extended_dwell_threshold = 30  # minutes
@@ -44,40 +38,96 @@ def analyze_returns_breakdown(csv_path, top_n=10):
     routes_with_returns['low_efficiency'] = routes_with_returns['drops_per_hour'] < low_efficiency_threshold
     routes_with_returns['very_high_volume'] = routes_with_returns['Total Orders'] > 80
 
-    # Identify likely root causes
-    def identify_causes(row):
-        causes = []
+    # Identify likely root causes (in this order; customer access when nothing else fits)
+    profiler.begin('identify_causes', rows=len(routes_with_returns))
+    actual = routes_with_returns['Trip Actual Time']
+    causes = {
+        'CATASTROPHIC_FAILURE': routes_with_returns['return_rate'] > 50,
+        'EXTENDED_BREAK': routes_with_returns['extended_dwell'],
+        'LOAD_ISSUES': routes_with_returns['extended_load'],
+        'TIME_MANAGEMENT_FAILURE': routes_with_returns['high_variance'] & (actual > 15),
+        'LOW_EFFICIENCY': routes_with_returns['low_efficiency'],
+        'VOLUME_OVERLOAD': routes_with_returns['very_high_volume'],
+        'GAVE_UP_EARLY': (actual < routes_with_returns['Estimated Duration']) & (routes_with_returns['return_rate'] > 20),
+    }
+    flags = np.column_stack([flag.to_numpy(dtype=bool) for flag in causes.values()])
+    # Few distinct flag combinations occur, so build each cause list once
+    combinations, which = np.unique(flags, axis=0, return_inverse=True)
+    names = np.array(list(causes), dtype=object)
+    cause_lists = [list(names[combination]) or ['CUSTOMER_ACCESS_ISSUES'] for combination in combinations]
+    routes_with_returns['likely_causes'] = pd.Series(
+        [list(cause_lists[i]) for i in which.ravel()], index=routes_with_returns.index, dtype=object
+    )
+    return routes_with_returns
+
+def partial_returns_breakdown(csv_path, keep=None, profiler=None, top_n=10, start_date=None, end_date=None):
+    """Mergeable returns aggregates for one export (None if it has no returns)"""
+    profiler = profiler or StageProfiler()
+
+    # Read the CSV (only the requested date window)
+    df = load_routes(csv_path, profiler=profiler, keep=keep, start_date=start_date, end_date=end_date)
 
-        if row['return_rate'] > 50:
-            causes.append('CATASTROPHIC_FAILURE')
+    # Filter only routes with returns
+    profiler.begin('filter_returns', rows=len(df))
+    routes_with_returns = df[df['Returned Orders'] > 0].copy()
+    profiler.end()
 
-        if row['extended_dwell']:
-            causes.append('EXTENDED_BREAK')
+    if routes_with_returns.empty:
+        return None
 
-        if row['extended_load']:
-            causes.append('LOAD_ISSUES')
+    profiler.begin('derive_columns', rows=len(routes_with_returns))
+    flag_return_routes(routes_with_returns, profiler)
 
-        if row['high_variance'] and row['Trip Actual Time'] > 15:
-            causes.append('TIME_MANAGEMENT_FAILURE')
+    # Top N candidates by number of returns
+    profiler.begin('top_routes', rows=len(routes_with_returns))
+    candidates = routes_with_returns.nlargest(top_n, 'Returned Orders')
 
-        if row['low_efficiency']:
-            causes.append('LOW_EFFICIENCY')
+    # Pattern counts
+    profiler.begin('patterns', rows=len(routes_with_returns))
+    all_causes = [cause for causes in routes_with_returns['likely_causes'] for cause in causes]
+    routes_with_pending = routes_with_returns[routes_with_returns['Pending Orders'] > 0]
 
-        if row['very_high_volume']:
-            causes.append('VOLUME_OVERLOAD')
+    sums = {
+        'routes': len(routes_with_returns),
+        'return_rate_sum': float(routes_with_returns['return_rate'].sum()),
+        'return_rate_count': int(routes_with_returns['return_rate'].count()),
+        'total_returns': int(routes_with_returns['Returned Orders'].sum()),
+        'total_orders': int(routes_with_returns['Total Orders'].sum()),
+        'extended_dwell': int(routes_with_returns['extended_dwell'].sum()),
+        'extended_load': int(routes_with_returns['extended_load'].sum()),
+        'high_variance': int(routes_with_returns['high_variance'].sum()),
+        'low_efficiency': int(routes_with_returns['low_efficiency'].sum()),
+        'routes_with_pending': len(routes_with_pending),
+        'pending_sum': int(routes_with_returns['Pending Orders'].sum()),
+        'pending_when_returns_sum': float(routes_with_pending['Pending Orders'].sum()),
+    }
+    profiler.end()
 
-        if row['Trip Actual Time'] < row['Estimated Duration'] and row['return_rate'] > 20:
-            causes.append('GAVE_UP_EARLY')
+    return {
+        'candidates': candidates,
+        'cause_counts': pd.Series(all_causes).value_counts(),
+        'sums': sums,
+    }
 
-        if not causes:
-            causes.append('CUSTOMER_ACCESS_ISSUES')
+def merge_returns_breakdown(partials, top_n=10):
+    """Combine per-file partials into one, as if the files were concatenated"""
+    partials = [p for p in partials if p is not None]
+    if len(partials) <= 1:
+        return partials[0] if partials else None
 
-        return causes
+    # Concatenating in file order keeps nlargest's first-occurrence tie-breaking
+    candidates = pd.concat([p['candidates'] for p in partials], ignore_index=True)
+    cause_counts = pd.concat([p['cause_counts'] for p in partials]).groupby(level=0, sort=False).sum()
 
-    routes_with_returns['likely_causes'] = routes_with_returns.apply(identify_causes, axis=1)
+    return {
+        'candidates': candidates.nlargest(top_n, 'Returned Orders'),
+        'cause_counts': cause_counts.sort_values(ascending=False, kind='stable'),
+        'sums': {key: sum(p['sums'][key] for p in partials) for key in partials[0]['sums']},
+    }
 
-    # Get top N routes by number of returns
-    top_n_routes = routes_with_returns.nlargest(top_n, 'Returned Orders')
+def top_route_records(candidates):
+    """Response records for the top return routes"""
+    top_n_routes = widen_floats(candidates)
 
     top_routes = []
     for _, row in top_n_routes.iterrows():
@@ -106,51 +156,168 @@ def analyze_returns_breakdown(csv_path, top_n=10):
                 'very_high_volume': bool(row['very_high_volume'])
             }
         })
+    return top_routes
 
-    # Pattern analysis
-    all_causes = [cause for causes in routes_with_returns['likely_causes'] for cause in causes]
-    cause_counts = pd.Series(all_causes).value_counts().to_dict()
+def finalize_returns_breakdown(partial, profiler=None):
+    """Build the returns response from merged aggregates"""
+    profiler = profiler or StageProfiler()
 
-    # Pending orders analysis (correlation with returns)
-    routes_with_both_pending_and_returns = routes_with_returns[routes_with_returns['Pending Orders'] > 0]
-    total_pending_in_return_routes = int(routes_with_returns['Pending Orders'].sum())
+    if partial is None:
+        return {
+            'top_return_routes': [],
+            'total_routes_with_returns': 0,
+            'total_returns': 0,
+            'patterns': {}
+        }
+
+    profiler.begin('finalize', rows=len(partial['candidates']))
+    top_routes = top_route_records(partial['candidates'])
 
+    # Pattern analysis
+    sums = partial['sums']
     patterns = {
-        'most_common_causes': cause_counts,
-        'avg_return_rate': float(routes_with_returns['return_rate'].mean()),
-        'total_routes_with_returns': len(routes_with_returns),
-        'total_returns': int(routes_with_returns['Returned Orders'].sum()),
-        'total_orders': int(routes_with_returns['Total Orders'].sum()),
-        'routes_with_extended_dwell': int(routes_with_returns['extended_dwell'].sum()),
-        'routes_with_extended_load': int(routes_with_returns['extended_load'].sum()),
-        'routes_with_high_variance': int(routes_with_returns['high_variance'].sum()),
-        'routes_with_low_efficiency': int(routes_with_returns['low_efficiency'].sum()),
-
-        # Pending orders context
-        'routes_with_both_pending_and_returns': len(routes_with_both_pending_and_returns),
-        'total_pending_in_return_routes': total_pending_in_return_routes,
-        'avg_pending_when_returns_present': float(routes_with_both_pending_and_returns['Pending Orders'].mean()) if len(routes_with_both_pending_and_returns) > 0 else 0,
+        'most_common_causes': partial['cause_counts'].to_dict(),
+        'avg_return_rate': sums['return_rate_sum'] / sums['return_rate_count'] if sums['return_rate_count'] else float('nan'),
+        'total_routes_with_returns': sums['routes'],
+        'total_returns': sums['total_returns'],
+        'total_orders': sums['total_orders'],
+        'routes_with_extended_dwell': sums['extended_dwell'],
+        'routes_with_extended_load': sums['extended_load'],
+        'routes_with_high_variance': sums['high_variance'],
+        'routes_with_low_efficiency': sums['low_efficiency'],
+
+        # Pending orders context (correlation with returns)
+        'routes_with_both_pending_and_returns': sums['routes_with_pending'],
+        'total_pending_in_return_routes': sums['pending_sum'],
+        'avg_pending_when_returns_present': sums['pending_when_returns_sum'] / sums['routes_with_pending'] if sums['routes_with_pending'] > 0 else 0,
     }
+    profiler.end()
 
     return {
         'top_return_routes': top_routes,
         'patterns': patterns
     }
 
+def analyze_returns_breakdown(csv_path, top_n=10, profiler=None, workers=None, start_date=None, end_date=None):
+    """Analyze routes with highest returns and identify patterns (one file, a glob or a list)"""
+    profiler = profiler or StageProfiler()
+
+    partials = map_files(resolve_inputs(csv_path), partial_returns_breakdown, workers=workers,
+                         profiler=profiler, top_n=top_n, start_date=start_date, end_date=end_date)
+    with profiler.stage('merge_partials', rows=len(partials)):
+        merged = merge_returns_breakdown(partials, top_n)
+    return finalize_returns_breakdown(merged, profiler)
+
+def preview_returns_breakdown(csv_path, top_n=10, profiler=None, start_date=None, end_date=None,
+                              fraction=DEFAULT_FRACTION, min_per_store=DEFAULT_MIN_PER_STORE,
+                              confidence=DEFAULT_CONFIDENCE):
+    """
+    Approximate returns patterns from a stratified sample (see stratified_sample.py).
+
+    Pattern counts and averages are scaled-up estimates, each with a
+    `<field>_ci` interval; top_return_routes are the sampled routes with the
+    most returns, not necessarily the export's top routes.
+    """
+    profiler = profiler or StageProfiler()
+    paths = resolve_inputs(csv_path)
+    if len(paths) != 1:
+        raise ValueError("Preview mode reads a single export")
+
+    sample = load_sample(paths[0], fraction, min_per_store, profiler=profiler)
+
+    profiler.begin('filter_returns', rows=len(sample))
+    in_domain = window_mask(sample, start_date, end_date) & (sample['Returned Orders'] > 0).to_numpy()
+    routes_with_returns = flag_return_routes(sample[in_domain].copy(), profiler)
+
+    profiler.begin('estimate', rows=len(routes_with_returns))
+
+    def domain_values(values):
+        # Per sampled route, 0 outside the domain
+        return pd.Series(values, index=routes_with_returns.index).reindex(sample.index, fill_value=0).astype('float64')
+
+    routes = domain_values(1.0)
+    pending = routes_with_returns['Pending Orders']
+    kpis = {
+        'routes': (routes, None, 1),
+        'return_rate': (domain_values(routes_with_returns['return_rate'].fillna(0)),
+                        domain_values(routes_with_returns['return_rate'].notna()), 1),
+        'returns': (domain_values(routes_with_returns['Returned Orders']), None, 1),
+        'orders': (domain_values(routes_with_returns['Total Orders']), None, 1),
+        'extended_dwell': (domain_values(routes_with_returns['extended_dwell']), None, 1),
+        'extended_load': (domain_values(routes_with_returns['extended_load']), None, 1),
+        'high_variance': (domain_values(routes_with_returns['high_variance']), None, 1),
+        'low_efficiency': (domain_values(routes_with_returns['low_efficiency']), None, 1),
+        'with_pending': (domain_values(pending > 0), None, 1),
+        'pending': (domain_values(pending), None, 1),
+        'pending_when_returns': (domain_values(pending), domain_values(pending > 0), 1),
+    }
+    causes = sorted({cause for route_causes in routes_with_returns['likely_causes'] for cause in route_causes})
+    for cause in causes:
+        kpis[f'cause:{cause}'] = (domain_values(routes_with_returns['likely_causes'].map(lambda c: cause in c)), None, 1)
+    overall, _ = estimate(sample, kpis, confidence=confidence)
+
+    cause_counts = with_intervals(overall, {cause: f'cause:{cause}' for cause in causes})
+    patterns = {
+        'most_common_causes': dict(sorted(
+            ((cause, cause_counts[cause]) for cause in causes), key=lambda item: item[1], reverse=True
+        )),
+        'most_common_causes_ci': {cause: cause_counts[f'{cause}_ci'] for cause in causes},
+        **with_intervals(overall, {
+            'avg_return_rate': 'return_rate',
+            'total_routes_with_returns': 'routes',
+            'total_returns': 'returns',
+            'total_orders': 'orders',
+            'routes_with_extended_dwell': 'extended_dwell',
+            'routes_with_extended_load': 'extended_load',
+            'routes_with_high_variance': 'high_variance',
+            'routes_with_low_efficiency': 'low_efficiency',
+            'routes_with_both_pending_and_returns': 'with_pending',
+            'total_pending_in_return_routes': 'pending',
+            'avg_pending_when_returns_present': 'pending_when_returns',
+        }),
+    }
+    top_routes = top_route_records(routes_with_returns.nlargest(top_n, 'Returned Orders'))
+    profiler.end()
+
+    return {
+        'top_return_routes': top_routes,
+        'patterns': patterns,
+        'preview': {
+            'sampled_routes': len(sample),
+            'sampled_routes_with_returns': len(routes_with_returns),
+            'fraction': fraction,
+            'min_per_store': min_per_store,
+            'confidence': confidence,
+        },
+    }
+
 def main():
     # Read request from stdin
     request = json.loads(sys.stdin.read())
     csv_path = request.get('csv_path') or request.get('csvPath')
     top_n = request.get('topN', 10)  # Default to 10 if not provided
+    start_date, end_date = date_window(request)
+    profiler = StageProfiler.from_request(request)
 
-    # Analyze
-    result = analyze_returns_breakdown(csv_path, top_n)
+    with profiler.run():
+        # Analyze (or estimate from a sample, for quick previews)
+        if request.get('preview'):
+            result = preview_returns_breakdown(
+                csv_path, top_n, profiler, start_date=start_date, end_date=end_date,
+                fraction=float(request.get('sample_fraction', DEFAULT_FRACTION)),
+                min_per_store=int(request.get('min_per_store', DEFAULT_MIN_PER_STORE)),
+                confidence=float(request.get('confidence', DEFAULT_CONFIDENCE)),
+            )
+        else:
+            result = analyze_returns_breakdown(csv_path, top_n, profiler, workers=request.get('workers'),
+                                               start_date=start_date, end_date=end_date)
 
-    # Replace NaN and Infinity with 0 for JSON serialization
-    result_json = json.dumps(result, indent=2)
-    result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+        # Replace NaN and Infinity with 0 for JSON serialization
+        with profiler.stage('json_encode'):
+            result_json = json.dumps(result, indent=2, default=json_default)
+            result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
 
-    print(result_json)
+    print(profiler.attach(result_json))
 
 if __name__ == "__main__":
     main()
@@ -4,14 +4,41 @@ Route Performance Analyzer
 Analyzes Dedicated Van Delivery routes to identify:
 - Routes deviating from target hours (8.33hr @ 10AM, 7.33hr @ 12PM departures)
 - Extended breaks and idle time outliers
+- Routes unusual for their own store and departure time (robust median/MAD z-scores)
 - Carrier performance issues
 """
 
 import sys
 import json
+import numpy as np
 import pandas as pd
 from datetime import datetime, time
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Union
+
+from profiling import StageProfiler
+from route_loader import load_routes, parse_dates, json_default, widen_floats, date_window
+from multi_file import resolve_inputs, map_files
+from metrics import derive
+
+# Target trip hours by departure time
+TARGET_10AM = 8.33  # 8.33 hours = 500 minutes
+TARGET_12PM = 7.33  # 7.33 hours = 440 minutes
+
+# Robust outliers: |z| above this, with z = 0.6745 * (x - median) / MAD
+# computed within each store × departure category (Iglewicz & Hoaglin)
+ROBUST_Z_THRESHOLD = 3.5
+# Groups smaller than this are too thin to have a baseline and aren't scored
+MIN_GROUP_ROUTES = 5
+MAD_SCALE = 0.6745
+# Fallback when over half a group shares one value (MAD = 0): mean absolute
+# deviation scaled to match the standard deviation of normal data
+MEAN_AD_SCALE = 1.2533
+# z column -> metric scored against its store × departure baseline
+ROBUST_METRICS = {
+    'robust_z_actual_hours': 'trip_actual_hours',
+    'robust_z_dwell': 'Driver Dwell Time',
+    'robust_z_load': 'Driver Load Time',
+}
 
 
 def parse_datetime(dt_str: str) -> datetime:
@@ -25,37 +52,121 @@ def get_hour_from_datetime(dt_str: str) -> int:
     return dt.hour
 
 
-def analyze_routes(csv_path: str) -> Dict[str, Any]:
+ROUTE_COLUMNS = [
+    'Carrier', 'Courier Name', 'Date', 'departure_category',
+    'target_hours', 'trip_actual_hours', 'variance_percentage',
+    'Driver Dwell Time', 'Driver Load Time', 'Total Orders'
+]
+# Per-route columns a partial carries for robust scoring after the merge
+ROBUST_ROW_COLUMNS = ['Store Id'] + ROUTE_COLUMNS
+ROBUST_COLUMNS = ROBUST_ROW_COLUMNS + ['robust_score'] + list(ROBUST_METRICS)
+
+# Route lists: name -> (DataFrame method, ranking column, output columns)
+ROUTE_RANKINGS = {
+    'worst_performing_routes': ('nsmallest', 'variance_percentage', ROUTE_COLUMNS),
+    'over_target_routes': ('nlargest', 'variance_percentage', ROUTE_COLUMNS),
+}
+ROBUST_RANKING = 'robust_outlier_routes'
+TOP_N = 10
+
+
+def robust_zscores(df: pd.DataFrame, group_columns: List[str], columns: List[str],
+                   min_routes: int = MIN_GROUP_ROUTES) -> pd.DataFrame:
     """
-    Analyze route data and identify outliers
+    Robust z-score of each value against its own group's median and MAD.
+
+    Group statistics come from grouped aggregations over all columns at once
+    and are broadcast back to rows by group code, so there is no per-group
+    Python work however many stores there are.
+
+    Args:
+        df: Route rows
+        group_columns: Columns defining a baseline group (e.g. store + departure)
+        columns: Numeric columns to score
+        min_routes: Groups with fewer non-null values get NaN scores
+
+    Returns:
+        Frame aligned to df with one z column per input column
+    """
+    codes = df.groupby(group_columns, observed=True, sort=False).ngroup()
+    codes = codes.fillna(-1).to_numpy(dtype=np.int64)
+    grouped = codes >= 0
+    group_codes = codes[grouped]
+    n_groups = int(group_codes.max()) + 1 if len(group_codes) else 0
+
+    values = df[columns].to_numpy(dtype=np.float64)[grouped]
+    frame = pd.DataFrame(values)
+
+    # Pass 1: group medians and sizes, broadcast back to every row
+    centre = frame.groupby(group_codes).agg(['median', 'count']).reindex(range(n_groups))
+    medians = centre.xs('median', axis=1, level=1).to_numpy()[group_codes]
+    counts = centre.xs('count', axis=1, level=1).to_numpy()[group_codes]
+
+    # Pass 2: median (and mean) absolute deviation from the group median
+    deviations = np.abs(values - medians)
+    spread = pd.DataFrame(deviations).groupby(group_codes).agg(['median', 'mean']).reindex(range(n_groups))
+    mad = spread.xs('median', axis=1, level=1).to_numpy()[group_codes]
+    mean_ad = spread.xs('mean', axis=1, level=1).to_numpy()[group_codes]
+
+    scale = np.where(mad > 0, mad / MAD_SCALE, mean_ad * MEAN_AD_SCALE)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (values - medians) / scale
+    # A flat group (every value identical) has no outliers
+    z[scale == 0] = 0
+    z[np.isnan(values) | (counts < min_routes)] = np.nan
+
+    scores = np.full((len(df), len(columns)), np.nan)
+    scores[grouped] = z
+    return pd.DataFrame(scores, index=df.index, columns=columns)
+
+
+def partial_routes(csv_path: str, keep: Optional[np.ndarray] = None,
+                   profiler: Optional[StageProfiler] = None,
+                   start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Score one export's routes and reduce them to mergeable counts and sums
+
+    Medians and MADs don't merge, so robust scoring isn't done here: the
+    partial carries the few columns it needs per route (robust_rows), and
+    score_robust() baselines each store × departure category over every
+    file's routes together, exactly as for one concatenated export.
 
     Args:
         csv_path: Path to CSV file with route data
+        keep: Optional row mask (drops trips duplicated in earlier files)
+        profiler: Optional stage profiler (see profiling.py)
+        start_date: Only routes on/after this day (YYYY-MM-DD)
+        end_date: Only routes on/before this day (YYYY-MM-DD)
 
     Returns:
-        Dictionary with analysis results
+        Per-departure-category and per-carrier aggregates, ranking candidates
+        and the rows to score for robust outliers
     """
+    profiler = profiler or StageProfiler()
+
     # Read CSV
-    df = pd.read_csv(csv_path)
+    df = load_routes(csv_path, profiler=profiler, keep=keep, start_date=start_date, end_date=end_date)
 
-    # Convert time columns to minutes for easier calculation
-    df['trip_actual_hours'] = df['Trip Actual Time'] / 60
-    df['driver_total_hours'] = df['Driver Total Time'] / 60
-    df['estimated_hours'] = df['Estimated Duration'] / 60
+    # Trip time in hours (metrics.py), under the name the route lists report
+    derive(df, ['Actual Time Hours'])
+    df['trip_actual_hours'] = df['Actual Time Hours']
 
     # Determine departure time category (10AM vs 12PM)
-    df['pickup_hour'] = df['Trip Planned Start'].apply(get_hour_from_datetime)
-    df['departure_category'] = df['pickup_hour'].apply(
-        lambda h: '10AM' if h == 10 else ('12PM' if h >= 11 and h <= 12 else 'Other')
+    profiler.begin('parse_dates', rows=len(df))
+    # Vectorized parse (Trip Planned Start is categorical after compaction)
+    df['pickup_hour'] = parse_dates(df['Trip Planned Start'], format="%m/%d/%Y %I:%M:%S %p").dt.hour
+    df['departure_category'] = np.select(
+        [df['pickup_hour'] == 10, df['pickup_hour'].between(11, 12)],
+        ['10AM', '12PM'],
+        default='Other'
     )
 
     # Define target hours based on departure time
-    target_10am = 8.33  # 8.33 hours = 500 minutes
-    target_12pm = 7.33  # 7.33 hours = 440 minutes
-
-    df['target_hours'] = df['departure_category'].apply(
-        lambda cat: target_10am if cat == '10AM' else (target_12pm if cat == '12PM' else 0)
-    )
+    profiler.begin('score_routes', rows=len(df))
+    df['target_hours'] = df['departure_category'].map(
+        {'10AM': TARGET_10AM, '12PM': TARGET_12PM}
+    ).fillna(0)
 
     # Calculate variance from target
     df['hours_variance'] = df['trip_actual_hours'] - df['target_hours']
@@ -73,86 +184,219 @@ def analyze_routes(csv_path: str) -> Dict[str, Any]:
     extended_load_threshold = 60  # minutes
     df['has_extended_load'] = df['Driver Load Time'] > extended_load_threshold
 
-    # Overall statistics
-    total_routes = len(df)
-    outlier_routes = df['is_outlier'].sum()
-    routes_with_extended_dwell = df['has_extended_dwell'].sum()
-    routes_with_extended_load = df['has_extended_load'].sum()
-
-    # Breakdown by departure time
-    departure_stats = df.groupby('departure_category').agg({
-        'trip_actual_hours': ['mean', 'median', 'min', 'max'],
-        'target_hours': 'first',
-        'variance_percentage': 'mean',
-        'is_outlier': 'sum'
-    }).round(2)
+    # Breakdown by departure time - sums and counts so files merge exactly
+    profiler.begin('groupby_stats', rows=len(df))
+    departure_stats = df.groupby('departure_category').agg(
+        count=('is_outlier', 'size'),
+        outliers=('is_outlier', 'sum'),
+        extended_dwell=('has_extended_dwell', 'sum'),
+        extended_load=('has_extended_load', 'sum'),
+        actual_hours_sum=('trip_actual_hours', 'sum'),
+        actual_hours_count=('trip_actual_hours', 'count'),
+        target_hours_sum=('target_hours', 'sum'),
+        target_hours_count=('target_hours', 'count'),
+        variance_pct_sum=('variance_percentage', 'sum'),
+        variance_pct_count=('variance_percentage', 'count'),
+    )
 
     # Carrier performance
-    carrier_stats = df.groupby('Carrier').agg({
+    carrier_stats = df.groupby('Carrier', observed=True).agg({
         'is_outlier': 'sum',
         'has_extended_dwell': 'sum',
         'has_extended_load': 'sum',
         'Carrier': 'count'
     }).rename(columns={'Carrier': 'total_routes'})
+
+    # Top 10 candidates on each side of the target
+    profiler.begin('rankings', rows=len(df))
+    candidates = {
+        name: getattr(df, method)(TOP_N, column)[columns]
+        for name, (method, column, columns) in ROUTE_RANKINGS.items()
+    }
+    profiler.end()
+
+    return {
+        'departure_stats': departure_stats,
+        'carrier_stats': carrier_stats,
+        'candidates': candidates,
+        'robust_rows': df[ROBUST_ROW_COLUMNS],
+    }
+
+
+def score_robust(partial: Dict[str, Any], robust_threshold: float = ROBUST_Z_THRESHOLD,
+                 profiler: Optional[StageProfiler] = None) -> Dict[str, Any]:
+    """
+    Robust outliers over the merged routes: each route against its own store
+    and departure slot. Adds the robust counts to the departure and carrier
+    stats and the most unusual routes to the candidates.
+    """
+    profiler = profiler or StageProfiler()
+    rows = partial['robust_rows']
+    profiler.begin('robust_scores', rows=len(rows))
+
+    scores = robust_zscores(rows, ['Store Id', 'departure_category'], list(ROBUST_METRICS.values()))
+    scored = rows.copy()
+    for z_column, column in ROBUST_METRICS.items():
+        scored[z_column] = scores[column]
+    scored['robust_score'] = scores.abs().max(axis=1)
+    flags = pd.DataFrame({
+        'robust_outliers': scored['robust_score'] > robust_threshold,
+        'robust_actual_hours': scored['robust_z_actual_hours'].abs() > robust_threshold,
+        'robust_dwell': scored['robust_z_dwell'].abs() > robust_threshold,
+        'robust_load': scored['robust_z_load'].abs() > robust_threshold,
+        'robust_scored': scored['robust_score'].notna(),
+    })
+
+    departure_stats = partial['departure_stats'].join(
+        flags.groupby(scored['departure_category'].to_numpy()).sum()
+    )
+    carrier_stats = partial['carrier_stats'].copy()
+    carrier_stats.insert(
+        carrier_stats.columns.get_loc('total_routes'), 'is_robust_outlier',
+        flags['robust_outliers'].groupby(scored['Carrier'].to_numpy()).sum()
+        .reindex(carrier_stats.index, fill_value=0)
+    )
+    candidates = dict(partial['candidates'])
+    candidates[ROBUST_RANKING] = scored.nlargest(TOP_N, 'robust_score')[ROBUST_COLUMNS]
+    profiler.end()
+
+    return {
+        'departure_stats': departure_stats,
+        'carrier_stats': carrier_stats,
+        'candidates': candidates,
+    }
+
+
+def merge_routes(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-file partials into one, as if the files were concatenated"""
+    if len(partials) == 1:
+        return partials[0]
+
+    candidates = {}
+    for name, (method, column, _) in ROUTE_RANKINGS.items():
+        # Concatenating in file order keeps nlargest's first-occurrence tie-breaking
+        combined = pd.concat([p['candidates'][name] for p in partials], ignore_index=True)
+        candidates[name] = getattr(combined, method)(TOP_N, column)
+
+    return {
+        'departure_stats': pd.concat([p['departure_stats'] for p in partials]).groupby(level=0).sum(),
+        'carrier_stats': pd.concat([p['carrier_stats'] for p in partials]).groupby(level=0).sum(),
+        'candidates': candidates,
+        # In file order, so ties rank as in the concatenated export
+        'robust_rows': pd.concat([p['robust_rows'] for p in partials], ignore_index=True),
+    }
+
+
+def finalize_routes(partial: Dict[str, Any], profiler: Optional[StageProfiler] = None,
+                    robust_threshold: float = ROBUST_Z_THRESHOLD) -> Dict[str, Any]:
+    """Build the analysis response from merged aggregates"""
+    profiler = profiler or StageProfiler()
+    partial = score_robust(partial, robust_threshold, profiler)
+    profiler.begin('finalize', rows=len(partial['carrier_stats']))
+
+    departure_stats = partial['departure_stats']
+    overall = departure_stats.sum()
+
+    # Overall statistics
+    total_routes = int(overall.get('count', 0))
+    outlier_routes = int(overall.get('outliers', 0))
+
+    def mean(stats: pd.Series, prefix: str) -> float:
+        count = stats.get(f'{prefix}_count', 0)
+        return stats[f'{prefix}_sum'] / count if count else np.nan
+
+    def departure_summary(category: str, target_hours: float) -> Dict[str, Any]:
+        stats = departure_stats.loc[category] if category in departure_stats.index else pd.Series(dtype='float64')
+        return {
+            'count': int(stats.get('count', 0)),
+            'target_hours': target_hours,
+            'avg_actual_hours': round(mean(stats, 'actual_hours') or 0, 2),
+            'avg_variance_pct': round(mean(stats, 'variance_pct') or 0, 2),
+            'outliers': int(stats.get('outliers', 0)),
+            'robust_outliers': int(stats.get('robust_outliers', 0))
+        }
+
+    # Carrier performance
+    carrier_stats = partial['carrier_stats'].copy()
     carrier_stats['outlier_rate'] = (carrier_stats['is_outlier'] / carrier_stats['total_routes'] * 100).round(2)
+    carrier_stats['robust_outlier_rate'] = (
+        carrier_stats['is_robust_outlier'] / carrier_stats['total_routes'] * 100
+    ).round(2)
 
     # Replace NaN and Infinity with 0 for JSON serialization
     carrier_stats = carrier_stats.fillna(0)
     carrier_stats = carrier_stats.replace([float('inf'), float('-inf')], 0)
 
-    # Top 10 worst performing routes (biggest negative variance from target)
-    worst_routes = df.nsmallest(10, 'variance_percentage')[[
-        'Carrier', 'Courier Name', 'Date', 'departure_category',
-        'target_hours', 'trip_actual_hours', 'variance_percentage',
-        'Driver Dwell Time', 'Driver Load Time', 'Total Orders'
-    ]]
-
-    # Top 10 routes exceeding target the most (positive outliers)
-    over_target_routes = df.nlargest(10, 'variance_percentage')[[
-        'Carrier', 'Courier Name', 'Date', 'departure_category',
-        'target_hours', 'trip_actual_hours', 'variance_percentage',
-        'Driver Dwell Time', 'Driver Load Time', 'Total Orders'
-    ]]
-
     # Clean DataFrames for JSON serialization - replace NaN and Inf
-    worst_routes = worst_routes.fillna(0).replace([float('inf'), float('-inf')], 0)
-    over_target_routes = over_target_routes.fillna(0).replace([float('inf'), float('-inf')], 0)
+    routes = {
+        name: widen_floats(partial['candidates'][name]).fillna(0).replace([float('inf'), float('-inf')], 0)
+        for name in [*ROUTE_RANKINGS, ROBUST_RANKING]
+    }
+    robust_outliers = int(overall.get('robust_outliers', 0))
+    robust_scored = int(overall.get('robust_scored', 0))
 
     # Build results
     results = {
         'summary': {
-            'total_routes': int(total_routes),
-            'outlier_routes': int(outlier_routes),
+            'total_routes': total_routes,
+            'outlier_routes': outlier_routes,
             'outlier_percentage': round(outlier_routes / total_routes * 100, 2) if total_routes > 0 else 0,
-            'routes_with_extended_dwell': int(routes_with_extended_dwell),
-            'routes_with_extended_load': int(routes_with_extended_load),
-            'avg_actual_hours': round(df['trip_actual_hours'].mean() or 0, 2),
-            'avg_target_hours': round(df['target_hours'].mean() or 0, 2)
+            'routes_with_extended_dwell': int(overall.get('extended_dwell', 0)),
+            'routes_with_extended_load': int(overall.get('extended_load', 0)),
+            'avg_actual_hours': round(mean(overall, 'actual_hours') or 0, 2),
+            'avg_target_hours': round(mean(overall, 'target_hours') or 0, 2)
+        },
+        'robust_outliers': {
+            'threshold': robust_threshold,
+            'min_group_routes': MIN_GROUP_ROUTES,
+            'routes_scored': robust_scored,
+            'outlier_routes': robust_outliers,
+            'outlier_percentage': round(robust_outliers / robust_scored * 100, 2) if robust_scored > 0 else 0,
+            'actual_hours_outliers': int(overall.get('robust_actual_hours', 0)),
+            'dwell_outliers': int(overall.get('robust_dwell', 0)),
+            'load_outliers': int(overall.get('robust_load', 0)),
         },
         'departure_time_analysis': {
-            '10AM_routes': {
-                'count': int((df['departure_category'] == '10AM').sum()),
-                'target_hours': target_10am,
-                'avg_actual_hours': round(df[df['departure_category'] == '10AM']['trip_actual_hours'].mean() or 0, 2),
-                'avg_variance_pct': round(df[df['departure_category'] == '10AM']['variance_percentage'].mean() or 0, 2),
-                'outliers': int(df[df['departure_category'] == '10AM']['is_outlier'].sum())
-            },
-            '12PM_routes': {
-                'count': int((df['departure_category'] == '12PM').sum()),
-                'target_hours': target_12pm,
-                'avg_actual_hours': round(df[df['departure_category'] == '12PM']['trip_actual_hours'].mean() or 0, 2),
-                'avg_variance_pct': round(df[df['departure_category'] == '12PM']['variance_percentage'].mean() or 0, 2),
-                'outliers': int(df[df['departure_category'] == '12PM']['is_outlier'].sum())
-            }
+            '10AM_routes': departure_summary('10AM', TARGET_10AM),
+            '12PM_routes': departure_summary('12PM', TARGET_12PM),
         },
         'carrier_performance': carrier_stats.to_dict('index'),
-        'worst_performing_routes': worst_routes.to_dict('records'),
-        'over_target_routes': over_target_routes.to_dict('records')
+        'worst_performing_routes': routes['worst_performing_routes'].to_dict('records'),
+        'over_target_routes': routes['over_target_routes'].to_dict('records'),
+        'robust_outlier_routes': routes['robust_outlier_routes'].to_dict('records')
     }
+    profiler.end()
 
     return results
 
 
+def analyze_routes(csv_path: Union[str, List[str]], profiler: Optional[StageProfiler] = None,
+                   workers: Optional[int] = None, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None,
+                   robust_threshold: float = ROBUST_Z_THRESHOLD) -> Dict[str, Any]:
+    """
+    Analyze route data and identify outliers
+
+    Args:
+        csv_path: Path to CSV file with route data (or a glob / list of files)
+        profiler: Optional stage profiler (see profiling.py)
+        workers: Process pool size for multi-file input (default: CPU count)
+        start_date: Only routes on/after this day (YYYY-MM-DD)
+        end_date: Only routes on/before this day (YYYY-MM-DD)
+        robust_threshold: |z| above which a route is a robust outlier
+
+    Returns:
+        Dictionary with analysis results
+    """
+    profiler = profiler or StageProfiler()
+
+    partials = map_files(resolve_inputs(csv_path), partial_routes, workers=workers, profiler=profiler,
+                         start_date=start_date, end_date=end_date)
+    with profiler.stage('merge_partials', rows=len(partials)):
+        merged = merge_routes(partials)
+    return finalize_routes(merged, profiler, robust_threshold)
+
+
 def main():
     """Main entry point - reads from stdin, writes to stdout"""
     try:
@@ -163,11 +407,20 @@ def main():
         if not csv_path:
             raise ValueError("csv_path is required in input JSON")
 
-        # Analyze routes
-        results = analyze_routes(csv_path)
+        start_date, end_date = date_window(input_data)
+        profiler = StageProfiler.from_request(input_data)
+
+        with profiler.run():
+            # Analyze routes
+            results = analyze_routes(csv_path, profiler, workers=input_data.get('workers'),
+                                     start_date=start_date, end_date=end_date,
+                                     robust_threshold=float(input_data.get('robust_threshold', ROBUST_Z_THRESHOLD)))
+
+            with profiler.stage('json_encode'):
+                result_json = json.dumps(results, indent=2, default=json_default)
 
         # Write results to stdout as JSON
-        print(json.dumps(results, indent=2))
+        print(profiler.attach(result_json))
         sys.exit(0)
 
     except Exception as e:
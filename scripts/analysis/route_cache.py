@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Columnar Route Cache
+Optional Parquet copy of a route export, partitioned by day so date-window
+requests only read the days they cover. Each day is sorted by Store Id in
+small row groups, so single-store reads skip everything else. Built on first
+load when pyarrow is installed and reused until the source CSV changes.
+
+Without pyarrow, single-store reads use a Store Id -> byte offset index
+into the CSV itself (plain CSVs only - compressed exports can't be seeked).
+
+Layout (next to the export unless ROUTE_ANALYZER_CACHE_DIR is set):
+    .route_cache/<export>-<hash>/manifest.json
+    .route_cache/<export>-<hash>/date=2025-10-04.parquet
+    ...
+    .route_cache/<export>-<hash>/store_index.npz
+    .route_cache/<export>-<hash>/source.json      the export it belongs to
+
+Every build sweeps the cache root: entries whose export is gone (e.g. a
+deleted upload) are removed, then the least recently used ones until the
+root fits in ROUTE_ANALYZER_CACHE_MAX_MB (default 2048).
+
+Disable with ROUTE_ANALYZER_CACHE=0.
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from compressed_input import is_compressed
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # cache is an optional speed-up
+    pa = pq = None
+
+CACHE_ENV = 'ROUTE_ANALYZER_CACHE'
+CACHE_DIR_ENV = 'ROUTE_ANALYZER_CACHE_DIR'
+MAX_MB_ENV = 'ROUTE_ANALYZER_CACHE_MAX_MB'
+CACHE_VERSION = 1
+
+DEFAULT_MAX_MB = 2048
+# Entries used this recently are never evicted for size: another analysis may be reading them
+EVICT_GRACE_SECONDS = 600
+SOURCE_FILE = 'source.json'
+
+# Original CSV row number, kept so cached reads return rows in export order
+ROW_COLUMN = '_row'
+NULL_PARTITION = '__null__'
+
+STORE_COLUMN = 'Store Id'
+# Rows per Parquet row group. Days are sorted by store, so a single-store
+# read only decodes the few groups whose Store Id min/max cover it
+ROW_GROUP_ROWS = 2048
+
+# Block size for scanning line offsets when building the CSV store index
+_SCAN_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def _switched_on() -> bool:
+    return os.getenv(CACHE_ENV, '1').lower() not in ('0', 'false', 'no')
+
+
+def cache_enabled() -> bool:
+    """True when pyarrow is available and the cache isn't switched off"""
+    return pq is not None and _switched_on()
+
+
+def store_index_enabled() -> bool:
+    """The CSV store index needs no extra dependencies"""
+    return _switched_on()
+
+
+def cache_dir_for(csv_path: str) -> Path:
+    """Cache directory for an export (keyed by its absolute path)"""
+    source = Path(csv_path).resolve()
+    root = Path(os.getenv(CACHE_DIR_ENV) or source.parent / '.route_cache')
+    digest = hashlib.sha1(str(source).encode()).hexdigest()[:10]
+    return root / f'{source.stem}-{digest}'
+
+
+def _entry_dir(csv_path: str) -> Path:
+    """Create an export's cache directory, recording which export it belongs to"""
+    cache_dir = cache_dir_for(csv_path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    source_file = cache_dir / SOURCE_FILE
+    if not source_file.exists():
+        source_file.write_text(json.dumps({'path': str(Path(csv_path).resolve())}))
+    return cache_dir
+
+
+def _mark_used(cache_dir: Path) -> None:
+    """Record a cache hit for least-recently-used eviction"""
+    try:
+        os.utime(cache_dir)
+    except OSError:
+        pass
+
+
+def _entry_bytes(cache_dir: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass  # removed while we looked
+    return total
+
+
+def sweep_cache(keep: Path, max_mb: Optional[float] = None) -> int:
+    """
+    Evict entries from the cache root that holds keep (which always stays).
+
+    Entries whose export no longer exists go first, then the least recently
+    used ones until the root fits in max_mb (ROUTE_ANALYZER_CACHE_MAX_MB).
+
+    Returns:
+        Number of entries removed
+    """
+    max_bytes = float(max_mb if max_mb is not None else os.getenv(MAX_MB_ENV, DEFAULT_MAX_MB)) * 1024 * 1024
+    now = time.time()
+    entries = []
+    for entry in keep.parent.iterdir():
+        if not entry.is_dir() or entry == keep:
+            continue
+        try:
+            source = json.loads((entry / SOURCE_FILE).read_text())['path']
+            orphaned = not os.path.exists(source)
+            last_used = entry.stat().st_mtime
+        except (OSError, ValueError, KeyError):
+            # No record of its export (or gone already): size-based eviction only
+            orphaned = False
+            last_used = entry.stat().st_mtime if entry.exists() else 0
+        entries.append({'path': entry, 'orphaned': orphaned, 'last_used': last_used,
+                        'bytes': _entry_bytes(entry)})
+
+    total = _entry_bytes(keep) + sum(e['bytes'] for e in entries)
+    removed = 0
+    for entry in sorted(entries, key=lambda e: (not e['orphaned'], e['last_used'])):
+        over = total > max_bytes and now - entry['last_used'] > EVICT_GRACE_SECONDS
+        if not (entry['orphaned'] or over):
+            continue
+        shutil.rmtree(entry['path'], ignore_errors=True)
+        total -= entry['bytes']
+        removed += 1
+    return removed
+
+
+def _source_signature(csv_path: str) -> Dict[str, Any]:
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'version': CACHE_VERSION}
+
+
+def open_cache(csv_path: str) -> Optional[Dict[str, Any]]:
+    """Manifest of a cache that is still fresh for csv_path (None otherwise)"""
+    manifest_path = cache_dir_for(csv_path) / 'manifest.json'
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get('source') != _source_signature(csv_path):
+        return None
+    _mark_used(manifest_path.parent)
+    return manifest
+
+
+def _partition_days(df: pd.DataFrame, date_column: Optional[str]) -> pd.Series:
+    """Partition name (YYYY-MM-DD or NULL_PARTITION) for every row"""
+    if date_column:
+        return pd.to_datetime(df[date_column], errors='coerce').dt.strftime('%Y-%m-%d').fillna(NULL_PARTITION)
+    return pd.Series(NULL_PARTITION, index=df.index)
+
+
+def build_cache(df: pd.DataFrame, csv_path: str, date_column: Optional[str]) -> Dict[str, Any]:
+    """
+    Write a freshly read (uncompacted) export into the day-partitioned cache.
+
+    Args:
+        df: The full export, in CSV row order
+        csv_path: Source export (its size/mtime mark the cache fresh)
+        date_column: Column to partition on (None puts everything in one partition)
+    """
+    cache_dir = _entry_dir(csv_path)
+    for stale in cache_dir.glob('*.parquet'):
+        stale.unlink()
+
+    df = df.assign(**{ROW_COLUMN: np.arange(len(df), dtype=np.int64)})
+    days = _partition_days(df, date_column)
+
+    # One schema for every partition, so a day where a column is all-null
+    # still reads back alongside the others
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    partitions = {}
+    for day, rows in df.groupby(days.to_numpy(), sort=True):
+        if STORE_COLUMN in rows.columns:
+            rows = rows.sort_values(STORE_COLUMN, kind='stable')
+        table = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+        pq.write_table(table, cache_dir / f'date={day}.parquet', row_group_size=ROW_GROUP_ROWS)
+        partitions[day] = len(rows)
+
+    manifest = {
+        'source': _source_signature(csv_path),
+        'rows': len(df),
+        'date_column': date_column,
+        'partitions': partitions,
+    }
+    # Manifest last, so a half-written cache is never picked up
+    (cache_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+    sweep_cache(cache_dir)
+    return manifest
+
+
+class CacheWriter:
+    """
+    build_cache for exports written chunk by chunk (e.g. the data cleaner's
+    output), without holding the whole export. Each chunk's rows for a day
+    are sorted by Store Id and appended to that day's file as row groups.
+
+    The schema comes from the first chunk; a later chunk that doesn't fit it
+    raises, and the caller should abort(). Call close() only once the CSV is
+    fully written - the manifest records its size/mtime.
+    """
+
+    def __init__(self, csv_path: str, date_column: Optional[str]):
+        self.csv_path = csv_path
+        self.date_column = date_column
+        self.cache_dir = _entry_dir(csv_path)
+        # Clear the old cache first, so it's never read alongside new partitions
+        (self.cache_dir / 'manifest.json').unlink(missing_ok=True)
+        for stale in self.cache_dir.glob('*.parquet'):
+            stale.unlink()
+        self.schema = None
+        self.writers = {}
+        self.partitions = {}
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Append the next chunk (in export order)"""
+        df = df.assign(**{ROW_COLUMN: np.arange(self.rows, self.rows + len(df), dtype=np.int64)})
+        self.rows += len(df)
+        if self.schema is None:
+            self.schema = pa.Schema.from_pandas(df, preserve_index=False)
+
+        for day, rows in df.groupby(_partition_days(df, self.date_column).to_numpy(), sort=True):
+            if STORE_COLUMN in rows.columns:
+                rows = rows.sort_values(STORE_COLUMN, kind='stable')
+            table = pa.Table.from_pandas(rows, schema=self.schema, preserve_index=False)
+            if day not in self.writers:
+                self.writers[day] = pq.ParquetWriter(self.cache_dir / f'date={day}.parquet', self.schema)
+                self.partitions[day] = 0
+            self.writers[day].write_table(table, row_group_size=ROW_GROUP_ROWS)
+            self.partitions[day] += len(rows)
+
+    def close(self) -> Dict[str, Any]:
+        """Finish every partition and write the manifest"""
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        manifest = {
+            'source': _source_signature(self.csv_path),
+            'rows': self.rows,
+            'date_column': self.date_column,
+            'partitions': dict(sorted(self.partitions.items())),
+        }
+        (self.cache_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+        sweep_cache(self.cache_dir)
+        return manifest
+
+    def abort(self) -> None:
+        """Drop a partly written cache"""
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        for partial in self.cache_dir.glob('*.parquet'):
+            partial.unlink()
+
+
+def select_partitions(manifest: Dict[str, Any], start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> List[str]:
+    """Partition names overlapping [start_date, end_date] (inclusive days)"""
+    days = list(manifest['partitions'])
+    if start_date is None and end_date is None:
+        return days
+    if not manifest.get('date_column'):
+        # Nothing to prune on; the caller filters rows after reading
+        return days
+
+    start = pd.Timestamp(start_date).strftime('%Y-%m-%d') if start_date else None
+    end = pd.Timestamp(end_date).strftime('%Y-%m-%d') if end_date else None
+    return [
+        day for day in days
+        if day != NULL_PARTITION
+        and (start is None or day >= start)
+        and (end is None or day <= end)
+    ]
+
+
+def read_cache(csv_path: str, manifest: Dict[str, Any], start_date: Optional[str] = None,
+               end_date: Optional[str] = None, store_ids: Optional[Sequence[int]] = None) -> pd.DataFrame:
+    """
+    Read the days covering a date window (optionally only some stores), in
+    original export order. The frame keeps ROW_COLUMN so callers can apply row masks.
+    """
+    cache_dir = cache_dir_for(csv_path)
+    days = select_partitions(manifest, start_date, end_date)
+    if not days:
+        # Empty window: keep the schema from any partition
+        first = next(iter(manifest['partitions']))
+        return pq.read_table(cache_dir / f'date={first}.parquet').to_pandas().iloc[0:0]
+
+    filters = [(STORE_COLUMN, 'in', list(store_ids))] if store_ids is not None else None
+    table = pq.read_table([str(cache_dir / f'date={day}.parquet') for day in days], filters=filters)
+    df = table.to_pandas()
+    return df.sort_values(ROW_COLUMN, kind='stable').reset_index(drop=True)
+
+
+# ===== CSV STORE INDEX =====
+
+def _line_bounds(csv_path: str) -> np.ndarray:
+    """Byte offset of every line start, plus the file size as a final sentinel"""
+    starts = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+    with open(csv_path, 'rb') as f:
+        while True:
+            block = f.read(_SCAN_BLOCK_BYTES)
+            if not block:
+                break
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+            starts.append(newlines.astype(np.int64) + offset + 1)
+            offset += len(block)
+    bounds = np.concatenate(starts)
+    if bounds[-1] != offset:
+        # Last line has no trailing newline
+        bounds = np.append(bounds, offset)
+    return bounds
+
+
+def build_store_index(csv_path: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Map each Store Id to the byte ranges of its rows in the CSV.
+
+    Returns None when the file can't be indexed by line (no Store Id column,
+    quoted newlines or blank lines make line and row counts disagree).
+    """
+    try:
+        stores = pd.read_csv(csv_path, usecols=[STORE_COLUMN])[STORE_COLUMN]
+    except ValueError:
+        return None
+    stores = pd.to_numeric(stores, errors='coerce').to_numpy(dtype=np.float64)
+
+    bounds = _line_bounds(csv_path)
+    if len(bounds) - 2 != len(stores):
+        return None
+
+    known = ~np.isnan(stores)
+    rows = np.flatnonzero(known)
+    order = rows[np.argsort(stores[known], kind='stable')]
+    store_ids, starts = np.unique(stores[order], return_index=True)
+    signature = _source_signature(csv_path)
+
+    index = {
+        'store_ids': store_ids,
+        'starts': np.append(starts, len(order)).astype(np.int64),
+        'rows': order.astype(np.int64),
+        'bounds': bounds,
+        'signature': np.array([signature['size'], signature['mtime_ns'], CACHE_VERSION], dtype=np.int64),
+    }
+    cache_dir = _entry_dir(csv_path)
+    np.savez(cache_dir / 'store_index.npz', **index)
+    sweep_cache(cache_dir)
+    return index
+
+
+def open_store_index(csv_path: str) -> Optional[Dict[str, np.ndarray]]:
+    """Store index for csv_path, building it if missing or stale (None for compressed exports)"""
+    if is_compressed(csv_path):
+        return None
+    index_path = cache_dir_for(csv_path) / 'store_index.npz'
+    if index_path.exists():
+        with np.load(index_path) as data:
+            index = {name: data[name] for name in data.files}
+        signature = _source_signature(csv_path)
+        if index['signature'].tolist() == [signature['size'], signature['mtime_ns'], CACHE_VERSION]:
+            _mark_used(index_path.parent)
+            return index
+    return build_store_index(csv_path)
+
+
+def read_store_rows(csv_path: str, index: Dict[str, np.ndarray],
+                    store_ids: Sequence[int]) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Read only the given stores' rows (export order) and their row numbers"""
+    wanted = np.asarray(sorted(set(store_ids)), dtype=np.float64)
+    positions = np.searchsorted(index['store_ids'], wanted)
+    found = positions < len(index['store_ids'])
+    found[found] = index['store_ids'][positions[found]] == wanted[found]
+
+    starts = index['starts']
+    rows = np.sort(np.concatenate(
+        [index['rows'][starts[p]:starts[p + 1]] for p in positions[found]] or [np.empty(0, dtype=np.int64)]
+    ))
+
+    bounds = index['bounds']
+    begins, ends = bounds[rows + 1], bounds[rows + 2]
+    # Coalesce adjacent rows into single reads
+    breaks = np.flatnonzero(begins[1:] != ends[:-1]) + 1
+    range_begins = begins[np.r_[0, breaks]] if len(rows) else begins
+    range_ends = ends[np.r_[breaks - 1, len(rows) - 1]] if len(rows) else ends
+
+    with open(csv_path, 'rb') as f:
+        parts = [f.read(int(bounds[1]))]
+        for begin, end in zip(range_begins, range_ends):
+            f.seek(int(begin))
+            part = f.read(int(end - begin))
+            parts.append(part if part.endswith(b'\n') else part + b'\n')
+
+    df = pd.read_csv(io.BytesIO(b''.join(parts)))
+    return df, rows
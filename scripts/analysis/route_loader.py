@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Route Data Loader
+Shared loading path for the analysis scripts. Reads a route export (only
+the requested date window when one is given) and compacts it in memory:
+low-cardinality strings become categoricals and order counts the smallest
+integer type. Durations stay float64: every derived metric and average is
+computed from them, and float32 inputs shift DPH, hours and rounded means.
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+
+from profiling import StageProfiler
+from compressed_input import read_csv
+from route_cache import (
+    ROW_COLUMN, STORE_COLUMN, cache_enabled, open_cache, build_cache, read_cache,
+    store_index_enabled, open_store_index, read_store_rows,
+)
+
+# Order/route counts - downcast to the smallest integer type that fits
+COUNT_COLUMNS = [
+    'Total Orders', 'Delivered Orders', 'Returned Orders', 'Pending Orders',
+    'Failed Orders', 'Failed Pickups', 'Store Id', 'Is Pickup Arrived Ontime',
+]
+
+# Durations in minutes - parsed as float64 (text/object columns only), never
+# narrowed: float32(42.1) / 60 is not 42.1 / 60
+DURATION_COLUMNS = [
+    'Driver Dwell Time', 'Driver Load Time', 'Driver Sort Time',
+    'Driver Store Time', 'Trip Actual Time', 'Driver Total Time',
+    'Estimated Duration', 'Headroom',
+]
+
+# Object columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Without the columnar cache, date windows are applied chunk by chunk so only
+# matching rows are ever held in memory
+CSV_CHUNK_ROWS = 500_000
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Deep memory usage of a frame in MB"""
+    return round(df.memory_usage(deep=True).sum() / 1024 / 1024, 2)
+
+
+def parse_dates(values: pd.Series, **kwargs) -> pd.Series:
+    """pd.to_datetime that parses each distinct value of a categorical once"""
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.to_datetime(values, **kwargs)
+
+    parsed = pd.to_datetime(pd.Series(np.asarray(values.cat.categories, dtype=object)), **kwargs).to_numpy()
+    codes = values.cat.codes.to_numpy()
+    result = parsed[codes]
+    result[codes == -1] = np.datetime64('NaT')
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def find_date_column(columns) -> Optional[str]:
+    """Route date column - BigQuery uses slot_dt, Tableau Report Date or Date"""
+    if 'slot_dt' in columns:
+        return 'slot_dt'
+    if 'Report Date' in columns and 'Date' not in columns:
+        return 'Report Date'
+    if 'Date' in columns:
+        return 'Date'
+    return None
+
+
+def date_window(request: Dict[str, Any], default_start: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """(start_date, end_date) from a stdin request; accepts snake_case or the UI's camelCase"""
+    start_date = request.get('start_date') or request.get('startDate') or default_start
+    end_date = request.get('end_date') or request.get('endDate') or None
+    for value in (start_date, end_date):
+        if value is not None:
+            pd.Timestamp(value)  # raises ValueError on a malformed date
+    return start_date, end_date
+
+
+def date_window_mask(values: pd.Series, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> np.ndarray:
+    """Rows dated within [start_date, end_date] (whole days; unparseable dates never match)"""
+    dates = parse_dates(values, errors='coerce')
+    mask = np.ones(len(values), dtype=bool)
+    if start_date is not None:
+        mask &= (dates >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        mask &= (dates < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy()
+    return mask
+
+
+def json_default(obj: Any) -> Any:
+    """json.dumps hook for the numpy scalars that compact dtypes produce"""
+    if isinstance(obj, np.floating):
+        # str() gives the shortest repr, so float32(13.1) encodes as 13.1
+        return float(str(obj))
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def widen_floats(df: pd.DataFrame) -> pd.DataFrame:
+    """Upcast float32 columns of a small output frame to float64 without binary noise"""
+    float32_columns = df.columns[df.dtypes == 'float32']
+    if len(float32_columns) == 0:
+        return df
+    df = df.copy()
+    for col in float32_columns:
+        df[col] = df[col].astype(str).astype('float64')
+    return df
+
+
+def compact_routes(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """
+    Convert route columns to compact dtypes in place.
+
+    Returns:
+        The compacted frame and a {column: new dtype} map of what changed
+    """
+    changed = {}
+
+    for col in COUNT_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if values.isna().any():
+            # Missing counts can't live in a plain integer column
+            values = values.astype('float32')
+        else:
+            values = pd.to_numeric(values, downcast='integer')
+        if values.dtype != df[col].dtype:
+            df[col] = values
+            changed[col] = str(values.dtype)
+
+    for col in DURATION_COLUMNS:
+        if col not in df.columns:
+            continue
+        if df[col].dtype != 'float64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+            changed[col] = 'float64'
+
+    row_count = len(df)
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if row_count and df[col].nunique(dropna=True) / row_count <= CATEGORY_MAX_UNIQUE_RATIO:
+            df[col] = df[col].astype('category')
+            changed[col] = 'category'
+
+    return df, changed
+
+
+def _filter_rows(df: pd.DataFrame, start_date: Optional[str], end_date: Optional[str],
+                 store_ids: Optional[List[int]]) -> Optional[np.ndarray]:
+    """Row mask for a date window and/or store list (None when nothing is filtered)"""
+    mask = None
+    if start_date is not None or end_date is not None:
+        date_column = find_date_column(df.columns)
+        if date_column is None:
+            raise ValueError("CSV must have either 'Date', 'Report Date', or 'slot_dt' column to filter by date")
+        mask = date_window_mask(df[date_column], start_date, end_date)
+    if store_ids is not None:
+        store_mask = pd.to_numeric(df[STORE_COLUMN], errors='coerce').isin(store_ids).to_numpy()
+        mask = store_mask if mask is None else mask & store_mask
+    return mask
+
+
+def _apply_mask(df: pd.DataFrame, rows: np.ndarray, mask: Optional[np.ndarray]) -> Tuple[pd.DataFrame, np.ndarray]:
+    if mask is None:
+        return df, rows
+    return df[mask].reset_index(drop=True), rows[mask]
+
+
+def _read_csv_filtered(csv_path: str, start_date: Optional[str], end_date: Optional[str],
+                       store_ids: Optional[List[int]]) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Chunked CSV read keeping only matching rows (and their row numbers)"""
+    frames: List[pd.DataFrame] = []
+    row_numbers: List[np.ndarray] = []
+    offset = 0
+    for chunk in read_csv(csv_path, chunksize=CSV_CHUNK_ROWS):
+        rows = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        chunk, rows = _apply_mask(chunk, rows, _filter_rows(chunk, start_date, end_date, store_ids))
+        frames.append(chunk)
+        row_numbers.append(rows)
+    if not frames:
+        # Header-only export: no chunks, but keep its columns
+        return read_csv(csv_path, nrows=0), np.empty(0, dtype=np.int64)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return df, np.concatenate(row_numbers)
+
+
+def read_routes(csv_path: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                store_ids: Optional[List[int]] = None) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Rows of an export inside a date window (and optionally only some stores),
+    with their original row numbers.
+
+    Uses the day-partitioned columnar cache when available (building it on
+    first use), so a narrow window only reads the days it covers and a store
+    list only the row groups holding those stores. Without pyarrow, store
+    lists go through the CSV byte-offset index and date windows stream the
+    CSV in chunks.
+    """
+    filtered = start_date is not None or end_date is not None or store_ids is not None
+
+    if cache_enabled():
+        manifest = open_cache(csv_path)
+        if manifest is not None and manifest['rows'] > 0:
+            df = read_cache(csv_path, manifest, start_date, end_date, store_ids)
+            rows = df.pop(ROW_COLUMN).to_numpy()
+            if manifest['date_column'] is None:
+                # One undated partition: the window is applied here, as on a cold read
+                return _apply_mask(df, rows, _filter_rows(df, start_date, end_date, None))
+            return df, rows
+
+        df = read_csv(csv_path)
+        try:
+            build_cache(df, csv_path, find_date_column(df.columns))
+        except Exception as e:
+            # The cache only saves time; never fail an analysis over it
+            print(f"⚠️  Route cache not written for {csv_path}: {e}", file=sys.stderr)
+        return _apply_mask(df, np.arange(len(df)), _filter_rows(df, start_date, end_date, store_ids))
+
+    if store_ids is not None and store_index_enabled():
+        index = open_store_index(csv_path)
+        if index is not None:
+            df, rows = read_store_rows(csv_path, index, store_ids)
+            return _apply_mask(df, rows, _filter_rows(df, start_date, end_date, None))
+
+    if filtered:
+        return _read_csv_filtered(csv_path, start_date, end_date, store_ids)
+    df = read_csv(csv_path)
+    return df, np.arange(len(df))
+
+
+def load_routes(csv_path: str, compact: bool = True,
+                profiler: Optional[StageProfiler] = None,
+                keep: Optional[np.ndarray] = None,
+                start_date: Optional[str] = None,
+                end_date: Optional[str] = None,
+                store_ids: Optional[List[int]] = None) -> pd.DataFrame:
+    """
+    Load a route export for analysis.
+
+    Args:
+        csv_path: Path to the CSV export
+        compact: Convert to compact dtypes after reading (default: True)
+        profiler: Optional stage profiler; when enabled, memory before and
+                  after compaction is recorded under `_profile.memory`
+        keep: Optional boolean mask over the export's rows
+              (used to drop trips duplicated across multi-file inputs)
+        start_date: Only rows dated on/after this day (YYYY-MM-DD)
+        end_date: Only rows dated on/before this day (YYYY-MM-DD)
+        store_ids: Only these stores' rows (read via the store index / sorted
+                   cache instead of scanning the whole export)
+    """
+    profiler = profiler or StageProfiler()
+    if store_ids is not None:
+        store_ids = [int(store_id) for store_id in store_ids]
+
+    profiler.begin('read_csv')
+    df, row_numbers = read_routes(csv_path, start_date, end_date, store_ids)
+    if keep is not None:
+        df = df[keep[row_numbers]].reset_index(drop=True)
+    profiler.end(rows=len(df))
+
+    if not compact:
+        return df
+
+    profiler.begin('compact', rows=len(df))
+    # Deep memory accounting walks every string, so only pay for it when profiling
+    before_mb = frame_memory_mb(df) if profiler.enabled else None
+    df, changed = compact_routes(df)
+    if profiler.enabled:
+        after_mb = frame_memory_mb(df)
+        profiler.extra['memory'] = {
+            'before_mb': before_mb,
+            'after_mb': after_mb,
+            'saved_pct': round((1 - after_mb / before_mb) * 100, 1) if before_mb else 0,
+            'converted_columns': changed,
+        }
+        print(f"Compacted route frame: {before_mb} MB → {after_mb} MB", file=sys.stderr)
+    profiler.end()
+
+    return df
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Store Period-over-Period Comparison
+Compares every store's KPIs (DPH, batch density, returns and pending rates,
+dwell, variance) between two periods - two date windows of one export or
+two exports. Both periods go through store metrics' grouped aggregation in
+a single groupby keyed by (period, Store Id); the two sides are aligned on
+Store Id with an index join and deltas / percent changes are computed for
+all stores at once.
+
+Without explicit windows the current period is the last 7 days in the data
+and the previous period the 7 days before it.
+"""
+
+import sys
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+
+from profiling import StageProfiler
+from route_loader import load_routes, parse_dates, json_default, find_date_column, date_window
+from store_metrics_breakdown import prepare_routes, aggregate_routes
+
+# KPI -> (numerator sum, denominator sum, scale, higher_is_better), from the AGGREGATES sums
+KPIS = {
+    'dph': ('dph_sum', 'dph_count', 1, True),
+    'batch_density': ('total_orders', 'route_count', 1, True),
+    'returns_rate': ('returned_orders', 'total_orders', 100, False),
+    'pending_rate': ('pending_orders', 'total_orders', 100, False),
+    'dwell_time': ('dwell_sum', 'dwell_count', 1, False),
+    'variance_hours': ('variance_sum', 'variance_count', 1, False),
+}
+
+PERIODS = ('previous', 'current')
+DEFAULT_PERIOD_DAYS = 7
+
+# Stores need this many routes in each period to be ranked as movers
+DEFAULT_MIN_ROUTES = 10
+
+
+# ===== PERIODS =====
+
+def period_requests(request: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    {csv_path, start_date, end_date} for each period.
+
+    A period may be given as {"csv_path", "start_date", "end_date"} under
+    "current" / "previous"; missing csv_paths fall back to the request's.
+    """
+    periods = {}
+    for name in PERIODS:
+        spec = request.get(name) or {}
+        start_date, end_date = date_window(spec)
+        csv_path = spec.get('csv_path') or request.get('csv_path')
+        if not csv_path:
+            raise ValueError(f"No csv_path for the {name} period")
+        periods[name] = {'csv_path': csv_path, 'start_date': start_date, 'end_date': end_date}
+    return periods
+
+
+def _day(value: Optional[str]) -> Optional[pd.Timestamp]:
+    return pd.Timestamp(value).normalize() if value is not None else None
+
+
+def fill_windows(periods: Dict[str, Dict[str, Any]], last_day: pd.Timestamp,
+                 days: int = DEFAULT_PERIOD_DAYS) -> None:
+    """
+    Complete the windows of two periods over one export, in place.
+
+    The current window defaults to the `days` days ending on the last day in
+    the data; the previous window to the same number of days just before it.
+    """
+    current, previous = periods['current'], periods['previous']
+    end = _day(current['end_date']) or last_day
+    start = _day(current['start_date']) or end - pd.Timedelta(days=days - 1)
+    current['start_date'], current['end_date'] = start, end
+
+    length = end - start + pd.Timedelta(days=1)
+    prev_end = _day(previous['end_date']) or start - pd.Timedelta(days=1)
+    prev_start = _day(previous['start_date']) or prev_end - length + pd.Timedelta(days=1)
+    previous['start_date'], previous['end_date'] = prev_start, prev_end
+
+
+def _route_days(df: pd.DataFrame) -> pd.Series:
+    date_column = find_date_column(df.columns)
+    if date_column is None:
+        raise ValueError("CSV must have either 'Date', 'Report Date', or 'slot_dt' column")
+    return parse_dates(df[date_column], errors='coerce').dt.normalize()
+
+
+def _in_window(days: pd.Series, window: Dict[str, Any]) -> np.ndarray:
+    mask = days.notna().to_numpy().copy()
+    if window['start_date'] is not None:
+        mask &= (days >= window['start_date']).to_numpy()
+    if window['end_date'] is not None:
+        mask &= (days <= window['end_date']).to_numpy()
+    return mask
+
+
+def load_periods(periods: Dict[str, Dict[str, Any]], days: int = DEFAULT_PERIOD_DAYS,
+                 profiler: Optional[StageProfiler] = None) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Routes of both periods in one frame, with each row's period
+    (0 = previous, 1 = current).
+
+    Two windows of the same export are read in a single load covering both.
+    """
+    profiler = profiler or StageProfiler()
+    current, previous = periods['current'], periods['previous']
+
+    if current['csv_path'] == previous['csv_path']:
+        bounds = [_day(window[bound]) for window in (current, previous) for bound in ('start_date', 'end_date')]
+        start = end = None
+        # Only narrow the read when both windows are fully known
+        if None not in bounds:
+            start = min(bounds[0], bounds[2]).strftime('%Y-%m-%d')
+            end = max(bounds[1], bounds[3]).strftime('%Y-%m-%d')
+        df = load_routes(current['csv_path'], profiler=profiler, start_date=start, end_date=end)
+
+        profiler.begin('assign_periods', rows=len(df))
+        route_days = _route_days(df)
+        fill_windows(periods, route_days.max(), days)
+        in_current = _in_window(route_days, current)
+        # A day in both windows counts towards the current period
+        in_previous = _in_window(route_days, previous) & ~in_current
+        keep = in_current | in_previous
+        profiler.end()
+        return df[keep].reset_index(drop=True), in_current[keep].astype(np.int8)
+
+    frames = []
+    for label, name in enumerate(PERIODS):
+        window = periods[name]
+        df = load_routes(window['csv_path'], profiler=profiler,
+                         start_date=window['start_date'], end_date=window['end_date'])
+        # Report the days the file actually covers when no window was given
+        route_days = _route_days(df)
+        window['start_date'] = _day(window['start_date']) or route_days.min()
+        window['end_date'] = _day(window['end_date']) or route_days.max()
+        frames.append(df.assign(_period=np.int8(label)))
+
+    # Categoricals with different categories concatenate as object columns
+    df = pd.concat(frames, ignore_index=True)
+    return df, df.pop('_period').to_numpy()
+
+
+# ===== COMPARISON =====
+
+def kpi_values(sums: pd.DataFrame) -> pd.DataFrame:
+    """KPI values from aggregate sums, one column per KPI (NaN without a denominator)"""
+    values = {}
+    for kpi, (numerator, denominator, scale, _) in KPIS.items():
+        den = sums[denominator]
+        values[kpi] = sums[numerator] / den.where(den != 0) * scale
+    return pd.DataFrame(values, index=sums.index)
+
+
+def compare_frames(current: pd.DataFrame, previous: pd.DataFrame) -> pd.DataFrame:
+    """
+    Index-aligned comparison of two aggregate frames.
+
+    Columns: routes_current/previous and, per KPI, {kpi}_current,
+    {kpi}_previous, {kpi}_delta and {kpi}_change_pct (relative to |previous|).
+    """
+    joined = kpi_values(current).join(kpi_values(previous), how='outer', lsuffix='_current', rsuffix='_previous')
+    routes = pd.DataFrame({'routes_current': current['route_count'], 'routes_previous': previous['route_count']})
+    routes = routes.reindex(joined.index).fillna(0).astype(int)
+
+    columns = {}
+    for kpi in KPIS:
+        now, before = joined[f'{kpi}_current'], joined[f'{kpi}_previous']
+        delta = now - before
+        change_pct = delta / before.abs().where(before != 0) * 100
+        columns.update({
+            f'{kpi}_current': now,
+            f'{kpi}_previous': before,
+            f'{kpi}_delta': delta,
+            f'{kpi}_change_pct': change_pct,
+        })
+    return pd.concat([routes, pd.DataFrame(columns, index=joined.index)], axis=1)
+
+
+def _period_sums(aggregates: pd.DataFrame, label: int) -> pd.DataFrame:
+    """One period's rows of a (period, key) aggregate (empty when it had no routes)"""
+    if label in aggregates.index.get_level_values(0):
+        return aggregates.xs(label, level=0)
+    return aggregates.iloc[0:0].droplevel(0)
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rounded records with None for values a period doesn't have"""
+    frame = frame.copy()
+    for column in frame.columns[frame.dtypes == 'float64']:
+        frame[column] = frame[column].round(2)
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def finalize_comparison(stores: pd.DataFrame, overall: pd.DataFrame, periods: Dict[str, Dict[str, Any]],
+                        top_n: int = 10, min_routes: int = DEFAULT_MIN_ROUTES) -> Dict[str, Any]:
+    """Response from the store and overall comparison frames"""
+    summary = {}
+    for name in PERIODS:
+        window = periods[name]
+        summary[name] = {
+            'csv_path': window['csv_path'],
+            'start': window['start_date'].strftime('%Y-%m-%d') if pd.notna(window['start_date']) else None,
+            'end': window['end_date'].strftime('%Y-%m-%d') if pd.notna(window['end_date']) else None,
+            'routes': int(overall[f'routes_{name}'].iloc[0]) if len(overall) else 0,
+            'stores': int((stores[f'routes_{name}'] > 0).sum()),
+        }
+
+    fleet = {}
+    for kpi in KPIS:
+        row = _records(overall[[f'{kpi}_current', f'{kpi}_previous', f'{kpi}_delta', f'{kpi}_change_pct']])
+        fleet[kpi] = {key.rsplit(f'{kpi}_', 1)[1]: value for key, value in row[0].items()} if row else {}
+
+    # Movers: stores with enough routes on both sides
+    ranked = stores[(stores['routes_current'] >= min_routes) & (stores['routes_previous'] >= min_routes)]
+    kpis = {}
+    for kpi, (_, _, _, higher_is_better) in KPIS.items():
+        movers = ranked[['routes_current', 'routes_previous', f'{kpi}_current', f'{kpi}_previous',
+                         f'{kpi}_delta', f'{kpi}_change_pct']].dropna(subset=[f'{kpi}_change_pct'])
+        movers = movers.rename(columns=lambda column: column.replace(f'{kpi}_', '')).rename_axis('store_id').reset_index()
+        # "Improving" means moving in the KPI's good direction
+        best, worst = ('nlargest', 'nsmallest') if higher_is_better else ('nsmallest', 'nlargest')
+        kpis[kpi] = {
+            'higher_is_better': higher_is_better,
+            'stores_ranked': len(movers),
+            'improving': _records(getattr(movers, best)(top_n, 'change_pct')),
+            'declining': _records(getattr(movers, worst)(top_n, 'change_pct')),
+        }
+
+    return {
+        **summary,
+        'min_routes': min_routes,
+        'overall': fleet,
+        'kpis': kpis,
+        'new_stores': stores.index[stores['routes_previous'] == 0].astype(int).tolist(),
+        'dropped_stores': stores.index[stores['routes_current'] == 0].astype(int).tolist(),
+        'store_comparison': _records(stores.rename_axis('store_id').reset_index()),
+    }
+
+
+def compare_store_periods(request: Dict[str, Any], top_n: int = 10, min_routes: int = DEFAULT_MIN_ROUTES,
+                          days: int = DEFAULT_PERIOD_DAYS,
+                          profiler: Optional[StageProfiler] = None) -> Dict[str, Any]:
+    """Compare store KPIs between the request's two periods"""
+    profiler = profiler or StageProfiler()
+
+    periods = period_requests(request)
+    df, period = load_periods(periods, days, profiler)
+    df = prepare_routes(df, profiler)
+
+    profiler.begin('period_groupby', rows=len(df))
+    # One grouped pass for both periods; store rows are then split by period
+    by_store = aggregate_routes(df, [period, df['Store Id'].to_numpy()])
+    by_fleet = aggregate_routes(df, [period, np.zeros(len(df), dtype=np.int8)])
+
+    profiler.begin('compare', rows=len(by_store))
+    stores = compare_frames(_period_sums(by_store, 1), _period_sums(by_store, 0))
+    stores.index = stores.index.astype(int)
+    overall = compare_frames(_period_sums(by_fleet, 1), _period_sums(by_fleet, 0))
+    profiler.end()
+
+    return finalize_comparison(stores, overall, periods, top_n, min_routes)
+
+
+def main():
+    input_data = json.load(sys.stdin)
+    top_n = int(input_data.get('topN', 10))
+    min_routes = int(input_data.get('min_routes', DEFAULT_MIN_ROUTES))
+    days = int(input_data.get('days', DEFAULT_PERIOD_DAYS))
+    profiler = StageProfiler.from_request(input_data)
+
+    with profiler.run():
+        results = compare_store_periods(input_data, top_n, min_routes, days, profiler)
+
+        with profiler.stage('json_encode'):
+            result_json = json.dumps(results, indent=2, default=json_default)
+            result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+
+    print(profiler.attach(result_json))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Store KPI Trends
+Builds the store × day KPI matrix (DPH, batch density, returns rate, dwell,
+variance) and computes 7- and 28-day rolling means and least-squares slopes
+for every store at once with cumulative-sum window operations. Returns the
+stores whose KPIs moved the most in the latest week against their 28-day
+baseline.
+"""
+
+import sys
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Union
+
+from profiling import StageProfiler
+from route_loader import load_routes, parse_dates, json_default, find_date_column, date_window
+from multi_file import resolve_inputs, map_files
+from metrics import derive
+
+SHORT_WINDOW = 7
+LONG_WINDOW = 28
+
+# KPI -> (numerator sum, denominator sum, scale, higher_is_better)
+# Daily KPI = numerator / denominator * scale for each store-day
+KPIS = {
+    'dph': ('dph_sum', 'dph_count', 1, True),
+    'batch_density': ('total_orders', 'route_count', 1, True),
+    'returns_rate': ('returned_orders', 'total_orders', 100, False),
+    'dwell_time': ('dwell_sum', 'dwell_count', 1, False),
+    'variance_hours': ('variance_sum', 'variance_count', 1, False),
+}
+
+# Stores need this many routes in the long window to be ranked
+DEFAULT_MIN_ROUTES = 10
+
+
+def partial_store_days(csv_path: str, keep: Optional[np.ndarray] = None,
+                       profiler: Optional[StageProfiler] = None,
+                       start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> pd.DataFrame:
+    """Mergeable store/day sums and counts for one export"""
+    profiler = profiler or StageProfiler()
+
+    df = load_routes(csv_path, profiler=profiler, keep=keep, start_date=start_date, end_date=end_date)
+
+    profiler.begin('derive_columns', rows=len(df))
+    date_column = find_date_column(df.columns)
+    if date_column is None:
+        raise ValueError("CSV must have either 'Date', 'Report Date', or 'slot_dt' column")
+    days = parse_dates(df[date_column], errors='coerce').dt.normalize()
+
+    # Same DPH and variance definitions as store metrics
+    derive(df, ['DPH', 'Variance Hours'])
+
+    values = pd.DataFrame({
+        'Store Id': df['Store Id'],
+        'Date': days,
+        'route_count': 1,
+        'total_orders': df['Total Orders'].astype('float64'),
+        'returned_orders': df['Returned Orders'].astype('float64'),
+        'dph': df['DPH'],
+        'dwell': df['Driver Dwell Time'].astype('float64'),
+        'variance': df['Variance Hours'].astype('float64'),
+    })
+
+    profiler.begin('store_day_groupby', rows=len(values))
+    store_days = values.groupby(['Store Id', 'Date']).agg(
+        route_count=('route_count', 'sum'),
+        total_orders=('total_orders', 'sum'),
+        returned_orders=('returned_orders', 'sum'),
+        dph_sum=('dph', 'sum'),
+        dph_count=('dph', 'count'),
+        dwell_sum=('dwell', 'sum'),
+        dwell_count=('dwell', 'count'),
+        variance_sum=('variance', 'sum'),
+        variance_count=('variance', 'count'),
+    )
+    profiler.end()
+
+    return store_days
+
+
+def merge_store_days(partials: List[pd.DataFrame]) -> pd.DataFrame:
+    """Combine per-file store/day sums (all columns are additive)"""
+    if len(partials) == 1:
+        return partials[0]
+    return pd.concat(partials).groupby(level=[0, 1], sort=True).sum()
+
+
+def _window_sums(matrix: np.ndarray, window: int) -> np.ndarray:
+    """Trailing-window sums along the day axis via cumulative sums (NaN counts as 0)"""
+    filled = np.nan_to_num(matrix, nan=0.0)
+    cumulative = np.cumsum(filled, axis=1)
+    shifted = np.zeros_like(cumulative)
+    shifted[:, window:] = cumulative[:, :-window]
+    return cumulative - shifted
+
+
+def rolling_stats(matrix: np.ndarray, window: int, min_periods: int) -> Dict[str, np.ndarray]:
+    """
+    Rolling mean and least-squares slope (per day) for every row at once.
+
+    Args:
+        matrix: stores × days KPI values, NaN where a store had no routes
+        window: Trailing window length in days
+        min_periods: Days with data required for a value (NaN otherwise)
+    """
+    present = ~np.isnan(matrix)
+    t = np.arange(matrix.shape[1], dtype=np.float64)[np.newaxis, :]
+
+    n = _window_sums(present.astype(np.float64), window)
+    sum_y = _window_sums(matrix, window)
+    sum_t = _window_sums(np.where(present, t, np.nan), window)
+    sum_tt = _window_sums(np.where(present, t * t, np.nan), window)
+    sum_ty = _window_sums(matrix * t, window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sum_y / n
+        denominator = n * sum_tt - sum_t * sum_t
+        slope = (n * sum_ty - sum_t * sum_y) / denominator
+
+    mean[n < min_periods] = np.nan
+    slope[(n < max(min_periods, 2)) | (denominator == 0)] = np.nan
+    return {'mean': mean, 'slope': slope, 'days': n}
+
+
+def store_day_matrix(store_days: pd.DataFrame, column: str,
+                     end_date: Optional[str] = None) -> pd.DataFrame:
+    """
+    Pivot one store/day column to stores × calendar days (missing days are NaN).
+    The calendar runs to end_date when that is later than the last day with routes.
+    """
+    matrix = store_days[column].unstack('Date')
+    last_day = matrix.columns.max()
+    if end_date is not None:
+        last_day = max(last_day, pd.Timestamp(end_date).normalize())
+    calendar = pd.date_range(matrix.columns.min(), last_day, freq='D')
+    return matrix.reindex(columns=calendar)
+
+
+def finalize_trends(store_days: pd.DataFrame, top_n: int = 10, min_routes: int = DEFAULT_MIN_ROUTES,
+                    profiler: Optional[StageProfiler] = None,
+                    end_date: Optional[str] = None) -> Dict[str, Any]:
+    """Rolling KPI trends and biggest movers from merged store/day sums, as of end_date if set"""
+    profiler = profiler or StageProfiler()
+
+    if store_days.empty:
+        return {'as_of': None, 'stores': 0, 'days': 0, 'kpis': {}}
+
+    profiler.begin('kpi_matrix', rows=len(store_days))
+    sums = {column: store_day_matrix(store_days, column, end_date) for column in store_days.columns}
+    routes = sums['route_count']
+    stores = routes.index
+    calendar = routes.columns
+
+    routes_long = _window_sums(routes.to_numpy(dtype=np.float64), LONG_WINDOW)[:, -1]
+    eligible = routes_long >= min_routes
+
+    profiler.begin('rolling_windows', rows=routes.size)
+    kpis = {}
+    for kpi, (numerator, denominator, scale, higher_is_better) in KPIS.items():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            daily = sums[numerator].to_numpy(dtype=np.float64) / sums[denominator].to_numpy(dtype=np.float64) * scale
+        daily[~np.isfinite(daily)] = np.nan
+
+        short = rolling_stats(daily, SHORT_WINDOW, min_periods=SHORT_WINDOW // 2)
+        long = rolling_stats(daily, LONG_WINDOW, min_periods=LONG_WINDOW // 2)
+
+        # Latest day only: this week's level against the 28-day baseline
+        mean_short, mean_long = short['mean'][:, -1], long['mean'][:, -1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_pct = (mean_short - mean_long) / np.abs(mean_long) * 100
+        change_pct[~np.isfinite(change_pct)] = np.nan
+
+        movers = pd.DataFrame({
+            'store_id': stores,
+            'mean_7d': mean_short,
+            'mean_28d': mean_long,
+            'slope_7d': short['slope'][:, -1],
+            'slope_28d': long['slope'][:, -1],
+            'change_pct': change_pct,
+            'days_7d': short['days'][:, -1].astype(int),
+            'routes_28d': routes_long.astype(int),
+        })[eligible].dropna(subset=['change_pct'])
+
+        # "Improving" means moving in the KPI's good direction
+        improving = movers.nlargest(top_n, 'change_pct') if higher_is_better else movers.nsmallest(top_n, 'change_pct')
+        declining = movers.nsmallest(top_n, 'change_pct') if higher_is_better else movers.nlargest(top_n, 'change_pct')
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fleet_daily = sums[numerator].sum(axis=0).to_numpy() / sums[denominator].sum(axis=0).to_numpy() * scale
+        fleet_short = rolling_stats(fleet_daily[np.newaxis, :], SHORT_WINDOW, SHORT_WINDOW // 2)
+        fleet_long = rolling_stats(fleet_daily[np.newaxis, :], LONG_WINDOW, LONG_WINDOW // 2)
+
+        kpis[kpi] = {
+            'higher_is_better': higher_is_better,
+            'fleet': {
+                'mean_7d': round(float(fleet_short['mean'][0, -1]), 2),
+                'mean_28d': round(float(fleet_long['mean'][0, -1]), 2),
+                'slope_7d': round(float(fleet_short['slope'][0, -1]), 4),
+                'slope_28d': round(float(fleet_long['slope'][0, -1]), 4),
+            },
+            'stores_ranked': len(movers),
+            'declining': _mover_records(declining),
+            'improving': _mover_records(improving),
+        }
+    profiler.end()
+
+    return {
+        'as_of': calendar[-1].strftime('%Y-%m-%d'),
+        'start': calendar[0].strftime('%Y-%m-%d'),
+        'stores': len(stores),
+        'days': len(calendar),
+        'windows': {'short_days': SHORT_WINDOW, 'long_days': LONG_WINDOW},
+        'min_routes': min_routes,
+        'kpis': kpis,
+    }
+
+
+def _mover_records(movers: pd.DataFrame) -> List[Dict[str, Any]]:
+    movers = movers.copy()
+    movers['store_id'] = movers['store_id'].astype(int)
+    for column in ('mean_7d', 'mean_28d', 'change_pct'):
+        movers[column] = movers[column].round(2)
+    for column in ('slope_7d', 'slope_28d'):
+        movers[column] = movers[column].round(4)
+    return movers.to_dict('records')
+
+
+def analyze_store_trends(csv_path: Union[str, List[str]], top_n: int = 10,
+                         min_routes: int = DEFAULT_MIN_ROUTES,
+                         profiler: Optional[StageProfiler] = None,
+                         workers: Optional[int] = None,
+                         start_date: Optional[str] = None,
+                         end_date: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rolling store KPI trends over one or more exports.
+
+    end_date (or else the latest day in the data) is the "as of" day, so
+    days without routes before it count against the recent windows; each
+    KPI lists the stores that moved most between the 7- and 28-day means.
+    """
+    profiler = profiler or StageProfiler()
+
+    partials = map_files(resolve_inputs(csv_path), partial_store_days, workers=workers,
+                         profiler=profiler, start_date=start_date, end_date=end_date)
+    with profiler.stage('merge_partials', rows=len(partials)):
+        store_days = merge_store_days(partials)
+    return finalize_trends(store_days, top_n, min_routes, profiler, end_date=end_date)
+
+
+def main():
+    input_data = json.load(sys.stdin)
+    csv_path = input_data['csv_path']
+    top_n = int(input_data.get('topN', 10))
+    min_routes = int(input_data.get('min_routes', DEFAULT_MIN_ROUTES))
+    start_date, end_date = date_window(input_data)
+    profiler = StageProfiler.from_request(input_data)
+
+    with profiler.run():
+        results = analyze_store_trends(csv_path, top_n, min_routes, profiler,
+                                       workers=input_data.get('workers'),
+                                       start_date=start_date, end_date=end_date)
+
+        with profiler.stage('json_encode'):
+            result_json = json.dumps(results, indent=2, default=json_default)
+            result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+
+    print(profiler.attach(result_json))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,44 @@
 Store-Level Metrics Breakdown Analysis
 Provides CPD, Batch Density, Returns, Dwell, and Loading Time metrics
 at overall and store-level granularity.
+
+With "partitions" set, a single export's rows are hash-partitioned by Store
+Id and aggregated on that many cores; store results are identical to a
+single pass since each store lives in one partition.
 """
 
 import sys
 import json
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
-
-def calculate_dph(delivered: int, total_time_hours: float) -> float:
-    """Calculate Deliveries Per Hour (DPH)"""
-    if total_time_hours == 0:
-        return 0
-    return delivered / total_time_hours
+from typing import Dict, Any, List, Optional, Union
+
+from profiling import StageProfiler
+from route_loader import load_routes, parse_dates, json_default, widen_floats, find_date_column, date_window
+from quantile_sketch import KLLSketch, DEFAULT_EPSILON, EXACT, group_sketches, merge_sketch_maps
+from multi_file import resolve_inputs, map_files, map_partitions, partition_count
+from metrics import derive
+from stratified_sample import (
+    DEFAULT_FRACTION, DEFAULT_MIN_PER_STORE, DEFAULT_CONFIDENCE,
+    load_sample, window_mask, estimate, with_intervals,
+)
+
+# Medians and tail percentiles come from KLL sketches so the same numbers
+# can be produced by chunked / multi-file runs that merge partial results.
+# A single export is held in memory anyway, so its sketches keep every
+# value (quantile_sketch.EXACT) and match pandas' median/quantile.
+PERCENTILES = [0.5, 0.9, 0.95]
+
+# Routes before this date are excluded unless the request sets start_date
+DEFAULT_START_DATE = '2025-10-04'
+
+# Overall percentile sketches: name -> route column
+OVERALL_SKETCHES = {
+    'dph': 'DPH',
+    'dwell_time': 'Driver Dwell Time',
+    'load_time': 'Driver Load Time',
+    'variance_hours': 'Variance Hours',
+}
 
 def calculate_batch_density(total_orders: int, route_count: int) -> float:
     """Calculate Batch Density (total orders per route)"""
@@ -22,24 +48,84 @@ def calculate_batch_density(total_orders: int, route_count: int) -> float:
         return 0
     return total_orders / route_count
 
-def analyze_store_metrics(csv_path: str) -> Dict[str, Any]:
-    """Analyze store-level metrics from CSV data"""
-
-    df = pd.read_csv(csv_path)
+def sketch_percentiles(sketch: KLLSketch, prefix: str) -> Dict[str, float]:
+    """median_/p90_/p95_ fields for one sketched column"""
+    median, p90, p95 = sketch.quantiles(PERCENTILES)
+    return {
+        f'median_{prefix}': round(median, 2),
+        f'p90_{prefix}': round(p90, 2),
+        f'p95_{prefix}': round(p95, 2),
+    }
 
+# ===== PARTIAL AGGREGATES =====
+# Output column -> (source column, reduction). Every reduction merges exactly
+# across files: sums/counts/sizes add up, mins/maxes take the min/max.
+AGGREGATES = {
+    'route_count': ('Total Orders', 'size'),
+    'total_orders': ('Total Orders', 'sum'),
+    'delivered_orders': ('Delivered Orders', 'sum'),
+    'returned_orders': ('Returned Orders', 'sum'),
+    'failed_orders': ('Failed Orders', 'sum'),
+    'pending_orders': ('Pending Orders', 'sum'),
+    'dph_sum': ('DPH', 'sum'),
+    'dph_count': ('DPH', 'count'),
+    'dph_min': ('DPH', 'min'),
+    'dph_max': ('DPH', 'max'),
+    'returns_rate_sum': ('Returns Rate', 'sum'),
+    'returns_rate_count': ('Returns Rate', 'count'),
+    'pending_rate_sum': ('Pending Rate', 'sum'),
+    'pending_rate_count': ('Pending Rate', 'count'),
+    'routes_with_pending': ('Has Pending', 'sum'),
+    'routes_with_high_pending': ('High Pending', 'sum'),
+    'dwell_sum': ('Driver Dwell Time', 'sum'),
+    'dwell_count': ('Driver Dwell Time', 'count'),
+    'dwell_max': ('Driver Dwell Time', 'max'),
+    'load_sum': ('Driver Load Time', 'sum'),
+    'load_count': ('Driver Load Time', 'count'),
+    'load_max': ('Driver Load Time', 'max'),
+    'variance_sum': ('Variance Hours', 'sum'),
+    'variance_count': ('Variance Hours', 'count'),
+    'planned_sum': ('Planned Time Hours', 'sum'),
+    'planned_count': ('Planned Time Hours', 'count'),
+    'actual_sum': ('Actual Time Hours', 'sum'),
+    'actual_count': ('Actual Time Hours', 'count'),
+}
+
+# Derived per-route columns the aggregates and route lists read (dependencies
+# such as Total Time Hours are planned in by metrics.derive)
+ROUTE_METRICS = ['DPH', 'Actual Time Hours', 'Planned Time Hours', 'Variance Hours',
+                 'Returns Rate', 'Pending Rate', 'Has Pending', 'High Pending']
+
+MERGE_REDUCTIONS = {'size': 'sum', 'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+TOP_N = 10
+ROUTE_COLUMNS = ['Date', 'Store Id', 'Courier Name', 'Carrier', 'DPH', 'Delivered Orders',
+                 'Total Orders', 'Driver Dwell Time', 'Driver Load Time', 'Driver Total Time',
+                 'Planned Time Hours', 'Actual Time Hours', 'Variance Hours']
+RETURNS_COLUMNS = ['Date', 'Store Id', 'Courier Name', 'Carrier', 'Returned Orders', 'Total Orders',
+                   'Returns Rate', 'Delivered Orders']
+PENDING_COLUMNS = ['Date', 'Store Id', 'Courier Name', 'Carrier', 'Pending Orders', 'Total Orders',
+                   'Pending Rate', 'Delivered Orders']
+
+# Route lists: name -> (DataFrame method, sort column, output columns)
+ROUTE_RANKINGS = {
+    'best_dph_routes': ('nlargest', 'DPH', ROUTE_COLUMNS),
+    'worst_dph_routes': ('nsmallest', 'DPH', ROUTE_COLUMNS),
+    'highest_returns': ('nlargest', 'Returned Orders', RETURNS_COLUMNS),
+    'highest_pending': ('nlargest', 'Pending Orders', PENDING_COLUMNS),
+}
+
+def prepare_routes(df: pd.DataFrame, profiler: StageProfiler) -> pd.DataFrame:
+    """Parse dates and derive the per-route metrics"""
+    profiler.begin('parse_dates', rows=len(df))
     # Handle different date column names
     # Tableau uses "Report Date", BigQuery uses "slot_dt"
-    if 'slot_dt' in df.columns:
-        df['Date'] = pd.to_datetime(df['slot_dt'], errors='coerce')
-    elif 'Report Date' in df.columns and 'Date' not in df.columns:
-        df['Date'] = pd.to_datetime(df['Report Date'], errors='coerce')
-    elif 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    else:
+    date_column = find_date_column(df.columns)
+    if date_column is None:
         raise ValueError("CSV must have either 'Date', 'Report Date', or 'slot_dt' column")
+    df['Date'] = parse_dates(df[date_column], errors='coerce')
 
-    df = df[df['Date'] >= '2025-10-04']
-
+    profiler.begin('derive_columns', rows=len(df))
     # Convert time columns to numeric (minutes)
     df['Driver Dwell Time'] = pd.to_numeric(df['Driver Dwell Time'], errors='coerce')
     df['Driver Load Time'] = pd.to_numeric(df['Driver Load Time'], errors='coerce')
@@ -47,132 +133,234 @@ def analyze_store_metrics(csv_path: str) -> Dict[str, Any]:
     df['Trip Actual Time'] = pd.to_numeric(df['Trip Actual Time'], errors='coerce')
     df['Estimated Duration'] = pd.to_numeric(df['Estimated Duration'], errors='coerce')
 
-    # Convert to hours for DPH calculation
-    df['Total Time Hours'] = df['Driver Total Time'] / 60
-    df['Actual Time Hours'] = df['Trip Actual Time'] / 60
-    df['Planned Time Hours'] = df['Estimated Duration'] / 60
-
-    # Calculate DPH (Deliveries Per Hour)
-    df['DPH'] = df.apply(
-        lambda row: calculate_dph(row['Delivered Orders'], row['Total Time Hours']),
-        axis=1
-    )
+    # Hours, DPH, variance and rates (see metrics.py for the definitions)
+    derive(df, ROUTE_METRICS)
+    profiler.end()
+
+    return df
+
+def aggregate_routes(df: pd.DataFrame, key) -> pd.DataFrame:
+    """One row of mergeable AGGREGATES per group (float64 so downcast counts sum without overflow)"""
+    sources = sorted({column for column, _ in AGGREGATES.values()})
+    values = df[sources].astype('float64')
+    return values.groupby(key, sort=True).agg(**{
+        name: (column, func) for name, (column, func) in AGGREGATES.items()
+    })
+
+def partial_store_metrics(csv_path: str, keep: Optional[np.ndarray] = None,
+                          profiler: Optional[StageProfiler] = None,
+                          quantile_epsilon: float = DEFAULT_EPSILON,
+                          start_date: Optional[str] = DEFAULT_START_DATE,
+                          end_date: Optional[str] = None) -> Dict[str, Any]:
+    """Mergeable store-metrics aggregates for one export"""
+    profiler = profiler or StageProfiler()
+
+    df = load_routes(csv_path, profiler=profiler, keep=keep, start_date=start_date, end_date=end_date)
+    return partial_store_frame(df, profiler, quantile_epsilon)
+
+def overall_sketches(df: pd.DataFrame, quantile_epsilon: float = DEFAULT_EPSILON) -> Dict[str, KLLSketch]:
+    return {name: KLLSketch(quantile_epsilon).update(df[column]) for name, column in OVERALL_SKETCHES.items()}
+
+def partial_store_frame(df: pd.DataFrame, profiler: Optional[StageProfiler] = None,
+                        quantile_epsilon: float = DEFAULT_EPSILON,
+                        sketch_overall: bool = True) -> Dict[str, Any]:
+    """
+    Mergeable store-metrics aggregates for loaded routes (a whole export or one partition).
+
+    sketch_overall=False returns the sketched columns as 'overall_values'
+    instead, so the partitions of one export can be sketched together.
+    """
+    profiler = profiler or StageProfiler()
+    df = prepare_routes(df, profiler)
+
+    profiler.begin('overall_metrics', rows=len(df))
+    overall = aggregate_routes(df, np.zeros(len(df), dtype=np.int8))
+    sketches = overall_sketches(df, quantile_epsilon) if sketch_overall else {}
+
+    profiler.begin('store_groupby', rows=len(df))
+    stores = aggregate_routes(df, df['Store Id'])
+    store_sketches = {
+        'dph': group_sketches(df, 'Store Id', 'DPH', quantile_epsilon),
+        'dwell_time': group_sketches(df, 'Store Id', 'Driver Dwell Time', quantile_epsilon),
+        'variance_hours': group_sketches(df, 'Store Id', 'Variance Hours', quantile_epsilon),
+    }
+    # Carriers in order of first appearance, like Series.unique()
+    store_carriers = df[['Store Id', 'Carrier']].drop_duplicates()
+
+    profiler.begin('route_candidates', rows=len(df))
+    # The overall top 10 is always among the per-file top 10s
+    candidates = {
+        name: getattr(df, method)(TOP_N, column)[columns]
+        for name, (method, column, columns) in ROUTE_RANKINGS.items()
+    }
+    profiler.end()
 
-    # Calculate Variance (Actual - Planned)
-    df['Variance Minutes'] = df['Trip Actual Time'] - df['Estimated Duration']
-    df['Variance Hours'] = df['Variance Minutes'] / 60
+    partial = {
+        'overall': overall,
+        'overall_sketches': sketches,
+        'stores': stores,
+        'store_sketches': store_sketches,
+        'store_carriers': store_carriers,
+        'candidates': candidates,
+    }
+    if not sketch_overall:
+        partial['overall_values'] = df[list(OVERALL_SKETCHES.values())]
+    return partial
+
+def merge_store_metrics(partials: List[Dict[str, Any]], by_label: bool = False) -> Dict[str, Any]:
+    """
+    Combine per-file partials into one, as if the files were concatenated.
+
+    by_label: the partials are partitions of one export that kept its row
+    labels; route candidates are put back in export order before ranking.
+    """
+    if len(partials) == 1:
+        return partials[0]
+
+    reductions = {name: MERGE_REDUCTIONS[func] for name, (_, func) in AGGREGATES.items()}
+
+    def merge_frames(frames):
+        return pd.concat(frames).groupby(level=0, sort=True).agg(reductions)
+
+    overall_sketches = {name: sketch.copy() for name, sketch in partials[0]['overall_sketches'].items()}
+    for partial in partials[1:]:
+        for name, sketch in partial['overall_sketches'].items():
+            overall_sketches[name].merge(sketch)
+
+    candidates = {}
+    for name, (method, column, _) in ROUTE_RANKINGS.items():
+        # Concatenating in file order keeps nlargest's first-occurrence tie-breaking
+        combined = pd.concat([p['candidates'][name] for p in partials], ignore_index=not by_label)
+        if by_label:
+            combined = combined.sort_index(kind='stable').reset_index(drop=True)
+        candidates[name] = getattr(combined, method)(TOP_N, column)
 
-    # Returns Rate
-    df['Returns Rate'] = (df['Returned Orders'] / df['Total Orders']).fillna(0)
+    return {
+        'overall': merge_frames([p['overall'] for p in partials]),
+        'overall_sketches': overall_sketches,
+        'stores': merge_frames([p['stores'] for p in partials]),
+        'store_sketches': {
+            name: merge_sketch_maps(p['store_sketches'][name] for p in partials)
+            for name in partials[0]['store_sketches']
+        },
+        'store_carriers': pd.concat([p['store_carriers'] for p in partials], ignore_index=True).drop_duplicates(),
+        'candidates': candidates,
+    }
 
-    # Pending Rate
-    df['Pending Rate'] = (df['Pending Orders'] / df['Total Orders']).fillna(0)
+def finalize_store_metrics(partial: Dict[str, Any], profiler: Optional[StageProfiler] = None) -> Dict[str, Any]:
+    """Turn merged aggregates into the store metrics response"""
+    profiler = profiler or StageProfiler()
 
     # ===== OVERALL METRICS =====
-    total_routes = len(df)
-    total_orders = int(df['Total Orders'].sum())
-
-    # Calculate pending orders statistics
-    routes_with_pending = df[df['Pending Orders'] > 0]
-    high_pending_routes = df[df['Pending Rate'] > 0.20]  # >20% pending
+    profiler.begin('finalize_overall')
+    # An empty export has no overall row; sums/counts are then 0 and extremes NaN
+    o = partial['overall'].reindex([0]).iloc[0]
+    o = o.fillna({name: 0 for name, (_, func) in AGGREGATES.items() if func in ('size', 'sum', 'count')})
+    sketches = partial['overall_sketches']
+    total_routes = int(o['route_count'])
+    total_orders = int(o['total_orders'])
 
     overall = {
         'total_routes': total_routes,
         'total_orders': total_orders,
-        'total_delivered': int(df['Delivered Orders'].sum()),
-        'total_returned': int(df['Returned Orders'].sum()),
-        'total_failed': int(df['Failed Orders'].sum()),
-        'total_pending': int(df['Pending Orders'].sum()),
+        'total_delivered': int(o['delivered_orders']),
+        'total_returned': int(o['returned_orders']),
+        'total_failed': int(o['failed_orders']),
+        'total_pending': int(o['pending_orders']),
 
         # DPH (Deliveries Per Hour)
-        'avg_dph': round(df['DPH'].mean(), 2),
-        'median_dph': round(df['DPH'].median(), 2),
-        'min_dph': round(df['DPH'].min(), 2),
-        'max_dph': round(df['DPH'].max(), 2),
+        'avg_dph': round(_mean(o, 'dph'), 2),
+        **sketch_percentiles(sketches['dph'], 'dph'),
+        'min_dph': round(o['dph_min'], 2),
+        'max_dph': round(o['dph_max'], 2),
 
         # Batch Density (total orders / total routes)
         'overall_batch_density': round(total_orders / total_routes, 2) if total_routes > 0 else 0,
 
         # Returns
-        'avg_returns_rate': round(df['Returns Rate'].mean() * 100, 2),
-        'total_returns_rate': round((df['Returned Orders'].sum() / df['Total Orders'].sum()) * 100, 2),
+        'avg_returns_rate': round(_mean(o, 'returns_rate') * 100, 2),
+        'total_returns_rate': round(_ratio(o['returned_orders'], o['total_orders']) * 100, 2),
 
         # Pending Orders
-        'avg_pending_rate': round(df['Pending Rate'].mean() * 100, 2),
-        'total_pending_rate': round((df['Pending Orders'].sum() / df['Total Orders'].sum()) * 100, 2),
-        'routes_with_pending': len(routes_with_pending),
-        'routes_with_high_pending': len(high_pending_routes),  # >20% pending
+        'avg_pending_rate': round(_mean(o, 'pending_rate') * 100, 2),
+        'total_pending_rate': round(_ratio(o['pending_orders'], o['total_orders']) * 100, 2),
+        'routes_with_pending': int(o['routes_with_pending']),
+        'routes_with_high_pending': int(o['routes_with_high_pending']),  # >20% pending
 
         # Dwell Time
-        'avg_dwell_time': round(df['Driver Dwell Time'].mean(), 2),
-        'median_dwell_time': round(df['Driver Dwell Time'].median(), 2),
-        'max_dwell_time': round(df['Driver Dwell Time'].max(), 2),
+        'avg_dwell_time': round(_mean(o, 'dwell'), 2),
+        **sketch_percentiles(sketches['dwell_time'], 'dwell_time'),
+        'max_dwell_time': round(o['dwell_max'], 2),
 
         # Load Time
-        'avg_load_time': round(df['Driver Load Time'].mean(), 2),
-        'median_load_time': round(df['Driver Load Time'].median(), 2),
-        'max_load_time': round(df['Driver Load Time'].max(), 2),
+        'avg_load_time': round(_mean(o, 'load'), 2),
+        'median_load_time': round(sketches['load_time'].median(), 2),
+        'max_load_time': round(o['load_max'], 2),
 
         # Variance (Planned vs Actual)
-        'avg_variance_hours': round(df['Variance Hours'].mean(), 2),
-        'median_variance_hours': round(df['Variance Hours'].median(), 2),
-        'total_variance_hours': round(df['Variance Hours'].sum(), 2),
-        'avg_planned_hours': round(df['Planned Time Hours'].mean(), 2),
-        'avg_actual_hours': round(df['Actual Time Hours'].mean(), 2),
+        'avg_variance_hours': round(_mean(o, 'variance'), 2),
+        **sketch_percentiles(sketches['variance_hours'], 'variance_hours'),
+        'total_variance_hours': round(o['variance_sum'], 2),
+        'avg_planned_hours': round(_mean(o, 'planned'), 2),
+        'avg_actual_hours': round(_mean(o, 'actual'), 2),
     }
 
     # ===== STORE-LEVEL METRICS =====
-    store_groups = df.groupby('Store Id')
+    profiler.begin('finalize_stores', rows=len(partial['stores']))
+    store_sketches = partial['store_sketches']
+    carriers = {}
+    for store_id, carrier in zip(partial['store_carriers']['Store Id'], partial['store_carriers']['Carrier']):
+        carriers.setdefault(store_id, []).append(carrier)
 
     store_metrics = []
-    for store_id, store_data in store_groups:
-        # Calculate pending metrics for this store
-        store_pending_routes = store_data[store_data['Pending Orders'] > 0]
-        store_high_pending = store_data[store_data['Pending Rate'] > 0.20]
+    for store_id, s in partial['stores'].iterrows():
+        store_orders = s['total_orders']
 
         store_metric = {
             'store_id': int(store_id),
-            'route_count': len(store_data),
+            'route_count': int(s['route_count']),
 
             # Volume
-            'total_orders': int(store_data['Total Orders'].sum()),
-            'delivered_orders': int(store_data['Delivered Orders'].sum()),
-            'returned_orders': int(store_data['Returned Orders'].sum()),
-            'failed_orders': int(store_data['Failed Orders'].sum()),
-            'pending_orders': int(store_data['Pending Orders'].sum()),
+            'total_orders': int(store_orders),
+            'delivered_orders': int(s['delivered_orders']),
+            'returned_orders': int(s['returned_orders']),
+            'failed_orders': int(s['failed_orders']),
+            'pending_orders': int(s['pending_orders']),
 
             # DPH (Deliveries Per Hour)
-            'avg_dph': round(store_data['DPH'].mean(), 2),
-            'median_dph': round(store_data['DPH'].median(), 2),
-            'best_dph': round(store_data['DPH'].max(), 2),
-            'worst_dph': round(store_data['DPH'].min(), 2),
+            'avg_dph': round(_mean(s, 'dph'), 2),
+            **sketch_percentiles(store_sketches['dph'][store_id], 'dph'),
+            'best_dph': round(s['dph_max'], 2),
+            'worst_dph': round(s['dph_min'], 2),
 
             # Batch Density (total orders / route count for this store)
-            'batch_density': round(store_data['Total Orders'].sum() / len(store_data), 2),
+            'batch_density': round(store_orders / s['route_count'], 2),
 
             # Returns
-            'returns_rate': round((store_data['Returned Orders'].sum() / store_data['Total Orders'].sum()) * 100, 2) if store_data['Total Orders'].sum() > 0 else 0,
+            'returns_rate': round((s['returned_orders'] / store_orders) * 100, 2) if store_orders > 0 else 0,
 
             # Pending
-            'pending_rate': round((store_data['Pending Orders'].sum() / store_data['Total Orders'].sum()) * 100, 2) if store_data['Total Orders'].sum() > 0 else 0,
-            'routes_with_pending': len(store_pending_routes),
-            'routes_with_high_pending': len(store_high_pending),
+            'pending_rate': round((s['pending_orders'] / store_orders) * 100, 2) if store_orders > 0 else 0,
+            'routes_with_pending': int(s['routes_with_pending']),
+            'routes_with_high_pending': int(s['routes_with_high_pending']),
 
             # Dwell Time
-            'avg_dwell_time': round(store_data['Driver Dwell Time'].mean(), 2),
-            'max_dwell_time': round(store_data['Driver Dwell Time'].max(), 2),
+            'avg_dwell_time': round(_mean(s, 'dwell'), 2),
+            **sketch_percentiles(store_sketches['dwell_time'][store_id], 'dwell_time'),
+            'max_dwell_time': round(s['dwell_max'], 2),
 
             # Load Time
-            'avg_load_time': round(store_data['Driver Load Time'].mean(), 2),
-            'max_load_time': round(store_data['Driver Load Time'].max(), 2),
+            'avg_load_time': round(_mean(s, 'load'), 2),
+            'max_load_time': round(s['load_max'], 2),
 
             # Variance
-            'avg_variance_hours': round(store_data['Variance Hours'].mean(), 2),
-            'avg_planned_hours': round(store_data['Planned Time Hours'].mean(), 2),
-            'avg_actual_hours': round(store_data['Actual Time Hours'].mean(), 2),
+            'avg_variance_hours': round(_mean(s, 'variance'), 2),
+            'median_variance_hours': round(store_sketches['variance_hours'][store_id].median(), 2),
+            'avg_planned_hours': round(_mean(s, 'planned'), 2),
+            'avg_actual_hours': round(_mean(s, 'actual'), 2),
 
             # Carriers at this store
-            'carriers': store_data['Carrier'].unique().tolist(),
+            'carriers': carriers.get(store_id, []),
         }
         store_metrics.append(store_metric)
 
@@ -180,34 +368,16 @@ def analyze_store_metrics(csv_path: str) -> Dict[str, Any]:
     store_metrics.sort(key=lambda x: x['avg_dph'])
 
     # ===== TOP/BOTTOM PERFORMERS =====
-    # Convert Date to string for JSON serialization
-    df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
-
-    # Best DPH routes (highest deliveries per hour)
-    best_dph_routes = df.nlargest(10, 'DPH')[
-        ['Date', 'Store Id', 'Courier Name', 'Carrier', 'DPH', 'Delivered Orders',
-         'Total Orders', 'Driver Dwell Time', 'Driver Load Time', 'Driver Total Time',
-         'Planned Time Hours', 'Actual Time Hours', 'Variance Hours']
-    ].to_dict('records')
-
-    # Worst DPH routes (lowest deliveries per hour)
-    worst_dph_routes = df.nsmallest(10, 'DPH')[
-        ['Date', 'Store Id', 'Courier Name', 'Carrier', 'DPH', 'Delivered Orders',
-         'Total Orders', 'Driver Dwell Time', 'Driver Load Time', 'Driver Total Time',
-         'Planned Time Hours', 'Actual Time Hours', 'Variance Hours']
-    ].to_dict('records')
-
-    # Highest returns routes
-    highest_returns = df.nlargest(10, 'Returned Orders')[
-        ['Date', 'Store Id', 'Courier Name', 'Carrier', 'Returned Orders', 'Total Orders',
-         'Returns Rate', 'Delivered Orders']
-    ].to_dict('records')
-
-    # Highest pending routes
-    highest_pending = df.nlargest(10, 'Pending Orders')[
-        ['Date', 'Store Id', 'Courier Name', 'Carrier', 'Pending Orders', 'Total Orders',
-         'Pending Rate', 'Delivered Orders']
-    ].to_dict('records')
+    profiler.begin('rankings', rows=len(store_metrics))
+
+    def route_records(frame):
+        # to_dict hands out Python floats, which json_default never sees
+        frame = widen_floats(frame).copy()
+        # Convert Date to string for JSON serialization
+        frame['Date'] = frame['Date'].dt.strftime('%Y-%m-%d')
+        return frame.to_dict('records')
+
+    candidates = partial['candidates']
 
     # ===== TOP/BOTTOM STORES BY PERFORMANCE =====
     # Create a copy of store_metrics for ranking
@@ -227,14 +397,15 @@ def analyze_store_metrics(csv_path: str) -> Dict[str, Any]:
 
     # Top 10 Stores by Best Variance (closest to or under planned time)
     best_variance_stores = sorted(stores_ranked, key=lambda x: x['avg_variance_hours'])[:10]
+    profiler.end()
 
     return {
         'overall': overall,
         'store_metrics': store_metrics,
-        'best_dph_routes': best_dph_routes,
-        'worst_dph_routes': worst_dph_routes,
-        'highest_returns': highest_returns,
-        'highest_pending': highest_pending,
+        'best_dph_routes': route_records(candidates['best_dph_routes']),
+        'worst_dph_routes': route_records(candidates['worst_dph_routes']),
+        'highest_returns': route_records(candidates['highest_returns']),
+        'highest_pending': route_records(candidates['highest_pending']),
         # New store-level rankings
         'top_10_stores': top_10_stores,
         'bottom_10_stores': bottom_10_stores,
@@ -243,17 +414,201 @@ def analyze_store_metrics(csv_path: str) -> Dict[str, Any]:
         'best_variance_stores': best_variance_stores,
     }
 
-def main():
-    input_data = json.load(sys.stdin)
-    csv_path = input_data['csv_path']
+def _mean(row: pd.Series, prefix: str) -> float:
+    """Mean from a {prefix}_sum / {prefix}_count pair (NaN when nothing was counted)"""
+    return _ratio(row[f'{prefix}_sum'], row[f'{prefix}_count'])
+
+def _ratio(numerator: float, denominator: float) -> float:
+    return numerator / denominator if denominator else np.nan
+
+def analyze_store_metrics(csv_path: Union[str, List[str]], profiler: Optional[StageProfiler] = None,
+                          quantile_epsilon: float = DEFAULT_EPSILON,
+                          workers: Optional[int] = None,
+                          start_date: Optional[str] = DEFAULT_START_DATE,
+                          end_date: Optional[str] = None,
+                          partitions: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Analyze store-level metrics from one or more CSV exports.
+
+    csv_path may be a path, a glob or a list; several files are aggregated
+    in parallel and merged (trips repeated across files count once).
+    start_date/end_date bound the routes analyzed (inclusive days).
+    quantile_epsilon is the rank error allowed for medians/percentiles of
+    several files; a single export (partitioned or not) is always exact.
+    partitions > 1 spreads a single export over that many processes,
+    hash-partitioned by Store Id.
+    """
+    profiler = profiler or StageProfiler()
+    paths = resolve_inputs(csv_path)
+
+    if len(paths) == 1 and partitions and partitions > 1:
+        df = load_routes(paths[0], profiler=profiler, start_date=start_date, end_date=end_date)
+        partials = map_partitions(df, 'Store Id', partial_store_frame, partitions, workers=workers,
+                                  profiler=profiler, quantile_epsilon=EXACT, sketch_overall=False)
+        del df
+        with profiler.stage('merge_partials', rows=len(partials)):
+            # Overall percentiles over every partition's values, exactly as a single pass would
+            values = pd.concat([p.pop('overall_values') for p in partials])
+            merged = merge_store_metrics(partials, by_label=True)
+            merged['overall_sketches'] = overall_sketches(values, EXACT)
+        return finalize_store_metrics(merged, profiler)
+
+    partials = map_files(paths, partial_store_metrics, workers=workers,
+                         profiler=profiler, quantile_epsilon=quantile_epsilon if len(paths) > 1 else EXACT,
+                         start_date=start_date, end_date=end_date)
+    with profiler.stage('merge_partials', rows=len(partials)):
+        merged = merge_store_metrics(partials)
+    return finalize_store_metrics(merged, profiler)
+
+# ===== PREVIEW (STRATIFIED SAMPLE) =====
+# Overall response field -> estimated KPI
+PREVIEW_OVERALL_FIELDS = {
+    'total_routes': 'route_count',
+    'total_orders': 'total_orders',
+    'total_delivered': 'delivered_orders',
+    'total_returned': 'returned_orders',
+    'total_failed': 'failed_orders',
+    'total_pending': 'pending_orders',
+    'avg_dph': 'avg_dph',
+    'overall_batch_density': 'batch_density',
+    'avg_returns_rate': 'avg_returns_rate',
+    'total_returns_rate': 'returns_rate',
+    'avg_pending_rate': 'avg_pending_rate',
+    'total_pending_rate': 'pending_rate',
+    'routes_with_pending': 'routes_with_pending',
+    'routes_with_high_pending': 'routes_with_high_pending',
+    'avg_dwell_time': 'avg_dwell_time',
+    'avg_load_time': 'avg_load_time',
+    'avg_variance_hours': 'avg_variance_hours',
+    'avg_planned_hours': 'avg_planned_hours',
+    'avg_actual_hours': 'avg_actual_hours',
+}
+PREVIEW_STORE_FIELDS = [
+    'route_count', 'total_orders', 'delivered_orders', 'returned_orders', 'failed_orders',
+    'pending_orders', 'avg_dph', 'batch_density', 'returns_rate', 'pending_rate',
+    'routes_with_pending', 'routes_with_high_pending', 'avg_dwell_time', 'avg_load_time',
+    'avg_variance_hours', 'avg_planned_hours', 'avg_actual_hours',
+]
+
+def preview_kpis(df: pd.DataFrame, in_window: np.ndarray) -> Dict[str, Any]:
+    """KPI name -> (numerator, denominator, scale) per sampled route, for stratified_sample.estimate"""
+    def total(column):
+        return df[column].astype('float64').where(in_window, 0)
+
+    def counted(column):
+        # Means skip missing values, like the exact *_count aggregates
+        return (df[column].notna() & in_window).astype('float64')
+
+    routes = pd.Series(in_window.astype('float64'), index=df.index)
+    kpis = {
+        'route_count': (routes, None, 1),
+        'batch_density': (total('Total Orders'), routes, 1),
+        'returns_rate': (total('Returned Orders'), total('Total Orders'), 100),
+        'pending_rate': (total('Pending Orders'), total('Total Orders'), 100),
+        'avg_returns_rate': (total('Returns Rate'), counted('Returns Rate'), 100),
+        'avg_pending_rate': (total('Pending Rate'), counted('Pending Rate'), 100),
+    }
+    for name, column in [('total_orders', 'Total Orders'), ('delivered_orders', 'Delivered Orders'),
+                         ('returned_orders', 'Returned Orders'), ('failed_orders', 'Failed Orders'),
+                         ('pending_orders', 'Pending Orders'), ('routes_with_pending', 'Has Pending'),
+                         ('routes_with_high_pending', 'High Pending')]:
+        kpis[name] = (total(column), None, 1)
+    for name, column in [('avg_dph', 'DPH'), ('avg_dwell_time', 'Driver Dwell Time'),
+                         ('avg_load_time', 'Driver Load Time'), ('avg_variance_hours', 'Variance Hours'),
+                         ('avg_planned_hours', 'Planned Time Hours'), ('avg_actual_hours', 'Actual Time Hours')]:
+        kpis[name] = (total(column), counted(column), 1)
+    return kpis
+
+def preview_store_metrics(csv_path: Union[str, List[str]], profiler: Optional[StageProfiler] = None,
+                          start_date: Optional[str] = DEFAULT_START_DATE,
+                          end_date: Optional[str] = None,
+                          fraction: float = DEFAULT_FRACTION,
+                          min_per_store: int = DEFAULT_MIN_PER_STORE,
+                          confidence: float = DEFAULT_CONFIDENCE) -> Dict[str, Any]:
+    """
+    Approximate store metrics from a stratified sample of one export.
+
+    Every estimated KPI has a `<field>_ci` [low, high] interval at the given
+    confidence. Intervals are normal approximations: for a store with only
+    min_per_store sampled routes and a few extreme values (e.g. DPH on
+    near-zero driver time) they cover the exact value less often than stated.
+    Percentiles and route lists need every route and are left to the exact
+    analysis.
+    """
+    profiler = profiler or StageProfiler()
+    paths = resolve_inputs(csv_path)
+    if len(paths) != 1:
+        raise ValueError("Preview mode reads a single export")
+
+    sample = load_sample(paths[0], fraction, min_per_store, profiler=profiler)
+    sample = prepare_routes(sample, profiler)
+    in_window = window_mask(sample, start_date, end_date)
+
+    profiler.begin('estimate', rows=len(sample))
+    overall, stores = estimate(sample, preview_kpis(sample, in_window), by=sample['Store Id'],
+                               confidence=confidence)
+
+    profiler.begin('finalize_stores', rows=len(stores))
+    sampled = pd.Series(in_window, index=sample.index).groupby(sample['Store Id']).sum()
+    observed = stores[stores['route_count'] > 0].astype('float64').round(2)
+    store_metrics = []
+    for store_id, s in zip(observed.index, observed.to_dict('records')):
+        store_metric = {'store_id': int(store_id), 'sampled_routes': int(sampled[store_id])}
+        for field in PREVIEW_STORE_FIELDS:
+            store_metric[field] = s[field]
+            store_metric[f'{field}_ci'] = [s[f'{field}_low'], s[f'{field}_high']]
+        store_metrics.append(store_metric)
 
-    results = analyze_store_metrics(csv_path)
+    # Same orderings as the exact response
+    store_metrics.sort(key=lambda x: x['avg_dph'])
+    profiler.end()
 
-    # Convert to JSON string and replace NaN/Infinity values
-    result_json = json.dumps(results, indent=2)
-    result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+    return {
+        'overall': with_intervals(overall, PREVIEW_OVERALL_FIELDS),
+        'store_metrics': store_metrics,
+        'top_10_stores': sorted(store_metrics, key=lambda x: x['avg_dph'], reverse=True)[:10],
+        'bottom_10_stores': store_metrics[:10],
+        'best_returns_stores': sorted(store_metrics, key=lambda x: x['returns_rate'])[:10],
+        'best_pending_stores': sorted(store_metrics, key=lambda x: x['pending_rate'])[:10],
+        'best_variance_stores': sorted(store_metrics, key=lambda x: x['avg_variance_hours'])[:10],
+        'preview': {
+            'sampled_routes': int(in_window.sum()),
+            'fraction': fraction,
+            'min_per_store': min_per_store,
+            'confidence': confidence,
+        },
+    }
 
-    print(result_json)
+def main():
+    input_data = json.load(sys.stdin)
+    csv_path = input_data['csv_path']
+    start_date, end_date = date_window(input_data, default_start=DEFAULT_START_DATE)
+    profiler = StageProfiler.from_request(input_data)
+
+    with profiler.run():
+        if input_data.get('preview'):
+            # Quick estimate from a stratified sample; run without "preview" for exact numbers
+            results = preview_store_metrics(
+                csv_path, profiler, start_date=start_date, end_date=end_date,
+                fraction=float(input_data.get('sample_fraction', DEFAULT_FRACTION)),
+                min_per_store=int(input_data.get('min_per_store', DEFAULT_MIN_PER_STORE)),
+                confidence=float(input_data.get('confidence', DEFAULT_CONFIDENCE))
+            )
+        else:
+            results = analyze_store_metrics(
+                csv_path, profiler,
+                quantile_epsilon=float(input_data.get('quantile_epsilon', DEFAULT_EPSILON)),
+                workers=input_data.get('workers'),
+                start_date=start_date, end_date=end_date,
+                partitions=partition_count(input_data.get('partitions'))
+            )
+
+        # Convert to JSON string and replace NaN/Infinity values
+        with profiler.stage('json_encode'):
+            result_json = json.dumps(results, indent=2, default=json_default)
+            result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+
+    print(profiler.attach(result_json))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Incremental Store Metrics
+Store metrics over a rolling window of days (90 by default) for an export
+that grows by a day at a time. Each day's routes are reduced once to the
+same mergeable aggregates store_metrics_breakdown builds per file, and kept
+on disk. A rerun only reads and aggregates the days it hasn't seen.
+
+Windowed sums and counts are kept as running totals: a new day is added,
+and a day falling out of the window is subtracted. Minimums/maximums can't
+be subtracted, so they are re-taken from the per-day aggregates, and
+medians/percentiles come from merging the per-day KLL sketches.
+
+Sums, counts, means and extremes equal a full store_metrics_breakdown run
+over the same days. Medians and p90/p95 don't: they are sketch
+approximations within quantile_epsilon of rank (the full run of one export
+is exact), so they can differ in the second decimal. Route lists are
+ranked from per-day candidates in day order, so routes tied on the
+ranking value may be picked differently than in export order.
+
+Layout (next to the route cache unless the request sets state_dir):
+    .route_cache/<export>-<hash>/store_metrics/manifest.json
+    .route_cache/<export>-<hash>/store_metrics/totals.pkl
+    .route_cache/<export>-<hash>/store_metrics/day=2025-10-04.pkl
+    ...
+
+The newest stored day is always re-aggregated, since an export can end
+part-way through a day. Older days are trusted as-is; send "rebuild": true
+after history in the export has been rewritten. State built from other
+inputs is rebuilt automatically, and a longer window_days than the state
+was built with backfills the older days it now needs.
+"""
+
+import sys
+import json
+import pickle
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+from profiling import StageProfiler
+from route_loader import load_routes, json_default
+from route_cache import cache_dir_for
+from quantile_sketch import DEFAULT_EPSILON, pack_sketch_map, merge_packed_sketch_maps
+from multi_file import resolve_inputs, map_files
+from store_metrics_breakdown import (
+    AGGREGATES, MERGE_REDUCTIONS, ROUTE_RANKINGS, TOP_N,
+    prepare_routes, partial_store_frame, merge_store_metrics, finalize_store_metrics,
+)
+
+STATE_VERSION = 2
+DEFAULT_WINDOW_DAYS = 90
+
+# Aggregates that can be added and subtracted; the rest are min/max extremes
+ADDITIVE = [name for name, (_, func) in AGGREGATES.items() if func in ('size', 'sum', 'count')]
+EXTREMES = {name: MERGE_REDUCTIONS[func] for name, (_, func) in AGGREGATES.items() if name not in ADDITIVE}
+
+
+def state_dir_for(csv_path: str) -> Path:
+    """Default state directory for an export (inside its route cache directory)"""
+    return cache_dir_for(csv_path) / 'store_metrics'
+
+
+# ===== PER-DAY AGGREGATES =====
+
+def partial_store_days(csv_path: str, keep: Optional[np.ndarray] = None,
+                       profiler: Optional[StageProfiler] = None,
+                       quantile_epsilon: float = DEFAULT_EPSILON,
+                       start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Store-metrics partials for one export, one per day in [start_date, end_date]"""
+    profiler = profiler or StageProfiler()
+
+    df = load_routes(csv_path, profiler=profiler, keep=keep, start_date=start_date, end_date=end_date)
+    # Derived columns are computed once here; each day's slice reuses them
+    df = prepare_routes(df, profiler)
+    # Routes without a parseable date can't be placed in a day
+    days = df['Date'].dt.strftime('%Y-%m-%d')
+
+    partials = {}
+    for day, rows in df.groupby(days.to_numpy(), sort=True):
+        partials[day] = partial_store_frame(rows, quantile_epsilon=quantile_epsilon)
+    return partials
+
+
+def aggregate_days(paths: List[str], start_date: Optional[str], quantile_epsilon: float,
+                   workers: Optional[int] = None,
+                   profiler: Optional[StageProfiler] = None,
+                   end_date: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-day partials for every input in [start_date, end_date], merged across files.
+
+    Store sketches are packed (quantile_sketch.pack_sketch_map) so a window
+    of days merges in one pass per store.
+    """
+    per_file = map_files(paths, partial_store_days, workers=workers, profiler=profiler,
+                         quantile_epsilon=quantile_epsilon, start_date=start_date, end_date=end_date)
+    days = sorted({day for partials in per_file for day in partials})
+
+    packed = {}
+    for day in days:
+        partial = merge_store_metrics([partials[day] for partials in per_file if day in partials])
+        partial['store_sketches'] = {
+            name: pack_sketch_map(sketches) for name, sketches in partial['store_sketches'].items()
+        }
+        packed[day] = partial
+    return packed
+
+
+# ===== STATE ON DISK =====
+
+def _day_path(state_dir: Path, day: str) -> Path:
+    return state_dir / f'day={day}.pkl'
+
+
+def _dump(path: Path, data: Any) -> None:
+    # Write then rename, so an interrupted run never leaves a torn file
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+
+
+def _load(path: Path) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_day(state_dir: Path, day: str, partial: Dict[str, Any]) -> None:
+    """Persist one day's partial"""
+    _dump(_day_path(state_dir, day), partial)
+
+
+def load_day(state_dir: Path, day: str) -> Dict[str, Any]:
+    """One stored day's partial"""
+    return _load(_day_path(state_dir, day))
+
+
+def _sources(paths: List[str]) -> List[str]:
+    return sorted(str(Path(path).resolve()) for path in paths)
+
+
+def open_state(state_dir: Path, quantile_epsilon: float, paths: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Manifest of usable state: None when missing, outdated, built with another
+    epsilon, or built from other inputs (whose days don't belong to this export).
+    """
+    manifest_path = state_dir / 'manifest.json'
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != STATE_VERSION or manifest.get('quantile_epsilon') != quantile_epsilon:
+        return None
+    if manifest.get('sources') != _sources(paths):
+        return None
+    return manifest
+
+
+# ===== RUNNING TOTALS =====
+
+# Running totals are kept as (sum, rounding error) pairs per level. Plain
+# float adds and subtracts of decimal durations drift by an ulp or two, which
+# is enough to flip a rounded .xx5 mean; with the error carried alongside,
+# subtracting a day exactly undoes adding it.
+LEVELS = ('overall', 'stores')
+
+
+def empty_totals() -> Dict[str, pd.DataFrame]:
+    frame = pd.DataFrame(columns=ADDITIVE, dtype='float64')
+    totals = {level: frame.copy() for level in LEVELS}
+    totals.update({f'{level}_error': frame.copy() for level in LEVELS})
+    return totals
+
+
+def apply_day(totals: Dict[str, pd.DataFrame], partial: Dict[str, Any], sign: int) -> Dict[str, pd.DataFrame]:
+    """Add (sign=1) or subtract (sign=-1) one day's sums and counts"""
+    updated = {}
+    for level in LEVELS:
+        day = partial[level][ADDITIVE].astype('float64') * sign
+        index = totals[level].index.union(day.index)
+        total = totals[level].reindex(index, fill_value=0)
+        error = totals[f'{level}_error'].reindex(index, fill_value=0)
+        day = day.reindex(index, fill_value=0)
+
+        # TwoSum: total + day == summed + exactly this rounding error
+        summed = total + day
+        day_part = summed - total
+        error = error + (total - (summed - day_part)) + (day - day_part)
+
+        # Groups left with no routes have dropped out of the window entirely
+        keep = (summed['route_count'] > 0).to_numpy()
+        updated[level] = summed[keep].sort_index()
+        updated[f'{level}_error'] = error[keep].sort_index()
+    return updated
+
+
+def window_totals(totals: Dict[str, pd.DataFrame], level: str) -> pd.DataFrame:
+    """Windowed sums and counts for one level, with the carried error folded in"""
+    return totals[level] + totals[f'{level}_error']
+
+
+def window_partial(totals: Dict[str, pd.DataFrame], day_partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    A merged partial (as merge_store_metrics returns) for the days in the window.
+
+    Sums and counts come from the running totals; extremes, sketches, route
+    candidates and carriers are merged from the per-day partials, in day order.
+    """
+    def frame(level):
+        extremes = pd.concat([p[level][list(EXTREMES)] for p in day_partials])
+        extremes = extremes.groupby(level=0, sort=True).agg(EXTREMES)
+        return window_totals(totals, level).join(extremes)[list(AGGREGATES)]
+
+    overall_sketches = {name: sketch.copy() for name, sketch in day_partials[0]['overall_sketches'].items()}
+    for partial in day_partials[1:]:
+        for name, sketch in partial['overall_sketches'].items():
+            overall_sketches[name].merge(sketch)
+
+    candidates = {}
+    for name, (method, column, _) in ROUTE_RANKINGS.items():
+        combined = pd.concat([p['candidates'][name] for p in day_partials], ignore_index=True)
+        candidates[name] = getattr(combined, method)(TOP_N, column)
+
+    return {
+        'overall': frame('overall'),
+        'overall_sketches': overall_sketches,
+        'stores': frame('stores'),
+        'store_sketches': {
+            name: merge_packed_sketch_maps(p['store_sketches'][name] for p in day_partials)
+            for name in day_partials[0]['store_sketches']
+        },
+        'store_carriers': pd.concat([p['store_carriers'] for p in day_partials], ignore_index=True).drop_duplicates(),
+        'candidates': candidates,
+    }
+
+
+# ===== UPDATE =====
+
+def update_store_metrics(csv_path: Union[str, List[str]], state_dir: Optional[str] = None,
+                         window_days: int = DEFAULT_WINDOW_DAYS,
+                         quantile_epsilon: float = DEFAULT_EPSILON,
+                         rebuild: bool = False, workers: Optional[int] = None,
+                         profiler: Optional[StageProfiler] = None) -> Dict[str, Any]:
+    """
+    Bring the stored state up to date with the export and analyze the window.
+
+    Args:
+        csv_path: Export path, glob or list (trips repeated across files count once)
+        state_dir: Where per-day aggregates live (default: next to the route cache)
+        window_days: Days in the rolling window, ending at the newest day seen
+        quantile_epsilon: Rank error for medians/percentiles (a change rebuilds the state)
+        rebuild: Discard stored days and aggregate the export from scratch
+        workers: Processes for multi-file inputs
+        profiler: Optional stage profiler
+
+    Returns:
+        The store metrics response for the window, plus an 'incremental' summary
+    """
+    if window_days < 1:
+        raise ValueError("window_days must be at least 1")
+    profiler = profiler or StageProfiler()
+    paths = resolve_inputs(csv_path)
+    state = Path(state_dir) if state_dir else state_dir_for(paths[0])
+    state.mkdir(parents=True, exist_ok=True)
+
+    manifest = None if rebuild else open_state(state, quantile_epsilon, paths)
+    stored = sorted(manifest['days']) if manifest else []
+    totals = _load(state / 'totals.pkl') if manifest else empty_totals()
+
+    # Only the newest stored day (possibly incomplete last time) and later are read
+    new_days = aggregate_days(paths, stored[-1] if stored else None, quantile_epsilon,
+                              workers=workers, profiler=profiler)
+
+    if stored and window_days > manifest.get('window_days', window_days):
+        # A longer window reaches back past the stored days. The window ends
+        # on or after the newest stored day, so it can't start before this
+        earliest = (pd.Timestamp(stored[-1]) - pd.Timedelta(days=window_days - 1)).strftime('%Y-%m-%d')
+        before_stored = (pd.Timestamp(stored[0]) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        if earliest <= before_stored:
+            new_days.update(aggregate_days(paths, earliest, quantile_epsilon, workers=workers,
+                                           profiler=profiler, end_date=before_stored))
+
+    profiler.begin('update_totals', rows=len(new_days))
+    all_days = sorted(set(stored) | set(new_days))
+    if not all_days:
+        raise ValueError("No dated routes found in the export")
+    window_end = pd.Timestamp(all_days[-1])
+    window_start = (window_end - pd.Timedelta(days=window_days - 1)).strftime('%Y-%m-%d')
+
+    dropped = [day for day in stored if day < window_start]
+    for day in dropped:
+        totals = apply_day(totals, load_day(state, day), -1)
+
+    added = [day for day in sorted(new_days) if day >= window_start]
+    for day in added:
+        if day in stored and day not in dropped:
+            # Re-aggregated day: swap its old contribution for the new one
+            totals = apply_day(totals, load_day(state, day), -1)
+        totals = apply_day(totals, new_days[day], 1)
+
+    # Day files first and the manifest last, so a crash leaves the old state readable
+    for day in added:
+        save_day(state, day, new_days[day])
+    _dump(state / 'totals.pkl', totals)
+    window = sorted((set(stored) - set(dropped)) | set(added))
+    (state / 'manifest.json').write_text(json.dumps({
+        'version': STATE_VERSION,
+        'quantile_epsilon': quantile_epsilon,
+        'sources': _sources(paths),
+        'window_days': window_days,
+        'days': window,
+    }, indent=2))
+    for day in dropped:
+        _day_path(state, day).unlink(missing_ok=True)
+
+    profiler.begin('merge_days', rows=len(window))
+    day_partials = [new_days[day] if day in new_days else load_day(state, day) for day in window]
+    merged = window_partial(totals, day_partials)
+    profiler.end()
+
+    results = finalize_store_metrics(merged, profiler)
+    results['incremental'] = {
+        'window_start': window[0],
+        'window_end': window[-1],
+        'window_days': window_days,
+        'days_in_window': len(window),
+        'days_aggregated': added,
+        'days_dropped': dropped,
+        'state_dir': str(state),
+        # Medians/percentiles are merged sketches, not exact values
+        'quantiles': 'approximate',
+        'quantile_epsilon': quantile_epsilon,
+    }
+    return results
+
+
+def main():
+    input_data = json.load(sys.stdin)
+    profiler = StageProfiler.from_request(input_data)
+
+    with profiler.run():
+        results = update_store_metrics(
+            input_data['csv_path'],
+            state_dir=input_data.get('state_dir'),
+            window_days=int(input_data.get('window_days', DEFAULT_WINDOW_DAYS)),
+            quantile_epsilon=float(input_data.get('quantile_epsilon', DEFAULT_EPSILON)),
+            rebuild=bool(input_data.get('rebuild', False)),
+            workers=input_data.get('workers'),
+            profiler=profiler,
+        )
+
+        # Convert to JSON string and replace NaN/Infinity values
+        with profiler.stage('json_encode'):
+            result_json = json.dumps(results, indent=2, default=json_default)
+            result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+
+    print(profiler.attach(result_json))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Stratified Route Samples
+Approximate ("preview") analyses read a small sample of an export instead
+of every row. Routes are stratified by Store Id, so every store is in the
+sample, and within a store one route is picked at random from each run of
+consecutive days' routes, so every stretch of days is represented in
+proportion.
+
+Each store contributes max(min_per_store, fraction × its routes) routes
+(all of them when it has fewer). The sample is drawn once per export and
+kept next to the route cache until the export changes:
+    .route_cache/<export>-<hash>/sample-f0.01-m30.parquet
+
+Estimates scale each store's sample back up to its route count, and come
+with normal-approximation confidence intervals (stratified SRS variance
+with finite population correction; ratios via linearization).
+"""
+
+import os
+import sys
+import json
+import math
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from typing import Dict, Any, Optional, Tuple
+
+from profiling import StageProfiler
+from route_loader import load_routes, parse_dates, find_date_column, date_window_mask
+from route_cache import cache_enabled, cache_dir_for
+
+DEFAULT_FRACTION = 0.01
+DEFAULT_MIN_PER_STORE = 30
+DEFAULT_CONFIDENCE = 0.95
+
+# Per-row design columns carried in the sample
+STRATUM_COLUMN = '_stratum'
+STRATUM_ROWS_COLUMN = '_stratum_rows'
+
+
+# ===== DRAWING THE SAMPLE =====
+
+def draw_sample(df: pd.DataFrame, fraction: float = DEFAULT_FRACTION,
+                min_per_store: int = DEFAULT_MIN_PER_STORE, seed: int = 0) -> pd.DataFrame:
+    """
+    Stratified sample of loaded routes (by store, spread over dates).
+
+    Args:
+        df: The whole export
+        fraction: Share of each store's routes to keep
+        min_per_store: Routes kept from every store (all of them if it has fewer)
+        seed: Seed for the picks within each zone
+
+    Returns:
+        Sampled rows with STRATUM_COLUMN / STRATUM_ROWS_COLUMN describing the design
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("fraction must be in (0, 1]")
+    if len(df) == 0:
+        return df.assign(**{STRATUM_COLUMN: np.empty(0, dtype=np.int64),
+                            STRATUM_ROWS_COLUMN: np.empty(0, dtype=np.int64)})
+
+    # Routes without a Store Id form one more stratum
+    strata, _ = pd.factorize(df['Store Id'], use_na_sentinel=False)
+    date_column = find_date_column(df.columns)
+    if date_column is not None:
+        days = parse_dates(df[date_column], errors='coerce').to_numpy().astype('datetime64[ns]').view(np.int64)
+    else:
+        days = np.zeros(len(df), dtype=np.int64)
+
+    # Stores in turn, each in date order (then export order)
+    order = np.lexsort((np.arange(len(df)), days, strata))
+    population = np.bincount(strata)
+    starts = np.concatenate([[0], np.cumsum(population)[:-1]])
+    sizes = np.minimum(population, np.maximum(min_per_store, np.ceil(population * fraction))).astype(np.int64)
+
+    # Split each store's date-ordered routes into equal zones and pick one
+    # route at random from every zone. Independent picks (unlike a single
+    # systematic start) can't line up with periodic patterns in the export.
+    step = population / sizes
+    stratum_of_pick = np.repeat(np.arange(len(population)), sizes)
+    pick_number = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    offset = np.random.default_rng(seed).random(len(pick_number))
+    ranks = np.floor(step[stratum_of_pick] * (pick_number + offset)).astype(np.int64)
+    rows = np.sort(order[starts[stratum_of_pick] + np.minimum(ranks, population[stratum_of_pick] - 1)])
+
+    sample = df.iloc[rows].reset_index(drop=True)
+    sample[STRATUM_COLUMN] = strata[rows]
+    sample[STRATUM_ROWS_COLUMN] = population[strata[rows]]
+    return sample
+
+
+def _sample_path(csv_path: str, fraction: float, min_per_store: int):
+    return cache_dir_for(csv_path) / f'sample-f{fraction:g}-m{min_per_store}.parquet'
+
+
+def load_sample(csv_path: str, fraction: float = DEFAULT_FRACTION,
+                min_per_store: int = DEFAULT_MIN_PER_STORE,
+                profiler: Optional[StageProfiler] = None) -> pd.DataFrame:
+    """
+    The stored sample of an export, drawing (and storing) it on first use.
+
+    Drawing reads the whole export once; later previews only read the sample.
+    Without the route cache (no pyarrow, or ROUTE_ANALYZER_CACHE=0) the
+    sample is drawn in memory every time.
+    """
+    profiler = profiler or StageProfiler()
+    path = _sample_path(csv_path, fraction, min_per_store)
+    manifest_path = path.with_suffix('.json')
+    stat = os.stat(csv_path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if cache_enabled() and path.exists() and manifest_path.exists():
+        try:
+            fresh = json.loads(manifest_path.read_text()).get('source') == signature
+        except (OSError, ValueError):
+            fresh = False
+        if fresh:
+            with profiler.stage('read_sample') as stage:
+                sample = pd.read_parquet(path)
+                stage.rows = len(sample)
+            return sample
+
+    df = load_routes(csv_path, profiler=profiler)
+    profiler.begin('draw_sample', rows=len(df))
+    sample = draw_sample(df, fraction, min_per_store)
+    profiler.end()
+    del df
+
+    if cache_enabled():
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            sample.to_parquet(path, index=False)
+            manifest_path.write_text(json.dumps({
+                'source': signature,
+                'fraction': fraction,
+                'min_per_store': min_per_store,
+                'rows': len(sample),
+            }, indent=2))
+        except Exception as e:
+            # Storing only saves the next preview a full read
+            print(f"⚠️  Sample not stored for {csv_path}: {e}", file=sys.stderr)
+    return sample
+
+
+def window_mask(sample: pd.DataFrame, start_date: Optional[str] = None,
+                end_date: Optional[str] = None) -> np.ndarray:
+    """Sampled routes inside a date window (estimates treat the window as a domain)"""
+    if start_date is None and end_date is None:
+        return np.ones(len(sample), dtype=bool)
+    date_column = find_date_column(sample.columns)
+    if date_column is None:
+        raise ValueError("CSV must have either 'Date', 'Report Date', or 'slot_dt' column to filter by date")
+    return np.asarray(date_window_mask(sample[date_column], start_date, end_date))
+
+
+# ===== ESTIMATION =====
+
+def _stratum_totals(values: pd.DataFrame, sample: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Per-stratum estimated totals of each column and their variances"""
+    grouped = values.groupby(sample[STRATUM_COLUMN].to_numpy(), sort=True)
+    mean = grouped.mean()
+    var = grouped.var(ddof=1).fillna(0)
+    sampled = grouped.size()
+    population = sample.groupby(STRATUM_COLUMN, sort=True)[STRATUM_ROWS_COLUMN].first()
+    population = population.reindex(mean.index).astype('float64')
+
+    totals = mean.mul(population, axis=0)
+    # Finite population correction: a fully sampled store contributes no error
+    variances = var.mul(population ** 2 * (1 - sampled / population) / sampled, axis=0)
+    return totals, variances
+
+
+def estimate(sample: pd.DataFrame, kpis: Dict[str, Tuple[pd.Series, Optional[pd.Series], float]],
+             by: Optional[pd.Series] = None,
+             confidence: float = DEFAULT_CONFIDENCE) -> Tuple[Dict[str, Tuple[float, float, float]], Optional[pd.DataFrame]]:
+    """
+    Estimate totals and ratios with confidence intervals.
+
+    Args:
+        sample: Rows from load_sample (with the design columns)
+        kpis: name -> (numerator, denominator, scale). Values are per sampled
+              route and already 0 outside the domain (e.g. the date window).
+              A None denominator estimates a total, otherwise the ratio of
+              the two totals (a mean when the denominator counts routes).
+        by: Optional grouping of strata (e.g. Store Id) for per-group estimates;
+            every stratum must fall in exactly one group
+        confidence: Two-sided confidence level
+
+    Returns:
+        overall: name -> (estimate, low, high)
+        groups: per-group frame with name, name_low and name_high columns (None without `by`)
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    columns = {}
+    for name, (numerator, denominator, _) in kpis.items():
+        columns[(name, 'y')] = numerator.to_numpy(dtype=np.float64, na_value=0)
+        if denominator is not None:
+            columns[(name, 'x')] = denominator.to_numpy(dtype=np.float64, na_value=0)
+    values = pd.DataFrame(columns)
+    totals, _ = _stratum_totals(values, sample)
+    grand = totals.sum()
+
+    # Linearized residuals for ratios: y - R x, with R taken overall or per group
+    strata = sample[STRATUM_COLUMN].to_numpy()
+    group_of_stratum = None
+    if by is not None:
+        group_of_stratum = pd.Series(by.to_numpy(), index=strata).groupby(level=0).first()
+        group_totals = totals.groupby(group_of_stratum.reindex(totals.index).to_numpy()).sum()
+
+    residuals, group_residuals = {}, {}
+    for name, (_, denominator, _) in kpis.items():
+        y = values[(name, 'y')].to_numpy()
+        if denominator is None:
+            residuals[name] = y
+            group_residuals[name] = y
+            continue
+        x = values[(name, 'x')].to_numpy()
+        ratio = grand[(name, 'y')] / grand[(name, 'x')] if grand[(name, 'x')] else np.nan
+        residuals[name] = y - ratio * x
+        if by is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                group_ratio = group_totals[(name, 'y')] / group_totals[(name, 'x')]
+            row_ratio = group_ratio.reindex(by.to_numpy()).to_numpy()
+            group_residuals[name] = y - np.nan_to_num(row_ratio) * x
+
+    _, variances = _stratum_totals(pd.DataFrame(residuals), sample)
+
+    overall = {}
+    for name, (_, denominator, scale) in kpis.items():
+        if denominator is None:
+            value = grand[(name, 'y')]
+            error = z * math.sqrt(variances[name].sum())
+        else:
+            total_x = grand[(name, 'x')]
+            value = grand[(name, 'y')] / total_x if total_x else np.nan
+            error = z * math.sqrt(variances[name].sum()) / abs(total_x) if total_x else np.nan
+        overall[name] = (value * scale, (value - error) * scale, (value + error) * scale)
+
+    if by is None:
+        return overall, None
+
+    _, group_variances = _stratum_totals(pd.DataFrame(group_residuals), sample)
+    group_variances = group_variances.groupby(group_of_stratum.reindex(group_variances.index).to_numpy()).sum()
+    groups = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name, (_, denominator, scale) in kpis.items():
+            if denominator is None:
+                value = group_totals[(name, 'y')]
+                error = z * np.sqrt(group_variances[name])
+            else:
+                total_x = group_totals[(name, 'x')]
+                value = group_totals[(name, 'y')] / total_x
+                error = z * np.sqrt(group_variances[name]) / total_x.abs()
+            groups[name] = value * scale
+            groups[f'{name}_low'] = (value - error) * scale
+            groups[f'{name}_high'] = (value + error) * scale
+    return overall, pd.DataFrame(groups)
+
+
+def with_intervals(estimates: Dict[str, Tuple[float, float, float]], names: Dict[str, str],
+                   digits: int = 2) -> Dict[str, Any]:
+    """Response fields: each KPI rounded, with a [low, high] `<field>_ci` next to it"""
+    fields = {}
+    for field, name in names.items():
+        value, low, high = estimates[name]
+        fields[field] = round(float(value), digits)
+        fields[f'{field}_ci'] = [round(float(low), digits), round(float(high), digits)]
+    return fields
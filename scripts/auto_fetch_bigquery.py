@@ -8,20 +8,63 @@ No manual downloads needed!
 import sys
 import argparse
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from google.cloud import bigquery
 
+from fetch_cache import FetchCache, normalize_filters, cached_fetch
+
 # The table we found!
 PROJECT = "wmt-edw-sandbox"
 DATASET = "LMD_DA"
 TABLE = "PROJECT_CENTRAL_SUMMARY_TABLE_DATE_LEVEL_AGGREGATABLE_KPI"
 
 
+def build_query(days=30, carrier='Nash', client='Walmart',
+                grouped_by='Unscheduled Delivery', oversized='0'):
+    """
+    Parameterized query for the KPI table.
+
+    Returns:
+        (SQL string, list of bigquery.ScalarQueryParameter)
+    """
+    # Build the query with optional oversized filter
+    oversized_filter = ""
+    query_params = [
+        bigquery.ScalarQueryParameter("carrier", "STRING", carrier),
+        bigquery.ScalarQueryParameter("client", "STRING", client),
+        bigquery.ScalarQueryParameter("grouped_by", "STRING", grouped_by),
+        bigquery.ScalarQueryParameter("days", "INT64", days),
+    ]
+
+    # Add oversized filter if not "all"
+    if oversized.lower() != 'all':
+        oversized_filter = "AND OVERSIZED_ITEM_IND = @oversized"
+        # Convert to INT64 for BigQuery type matching
+        oversized_int = int(oversized)
+        query_params.append(bigquery.ScalarQueryParameter("oversized", "INT64", oversized_int))
+
+    query = f"""
+    SELECT *
+    FROM `{PROJECT}.{DATASET}.{TABLE}`
+    WHERE carrier_org_nm = @carrier
+      AND client = @client
+      AND grouped_by = @grouped_by
+      {oversized_filter}
+      AND slot_dt >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+    ORDER BY slot_dt DESC, store_id
+    """
+    return query, query_params
+
+
 def fetch_data(output_file, days=30, carrier='Nash', client='Walmart',
-               grouped_by='Unscheduled Delivery', oversized='0'):
+               grouped_by='Unscheduled Delivery', oversized='0',
+               cache=None, refresh=False):
     """
     Fetch data from BigQuery and save to CSV.
 
+    Identical requests within the fetch cache TTL are copied from disk
+    instead of re-running the query (see fetch_cache.py).
+
     Args:
         output_file: Path to save CSV
         days: Number of days to fetch (default: 30)
@@ -29,7 +72,31 @@ def fetch_data(output_file, days=30, carrier='Nash', client='Walmart',
         client: Client filter (default: Walmart)
         grouped_by: Grouped by filter (default: Unscheduled Delivery)
         oversized: Oversized item indicator - '0' for non-oversized, '1' for oversized, 'all' for both (default: '0')
+        cache: FetchCache to use (default: the shared cache for this table)
+        refresh: Re-run the query even if a cached result is fresh
     """
+    cache = cache or FetchCache('bigquery-api')
+    # "Last N days" is relative to BigQuery's CURRENT_DATE (UTC), so the key
+    # holds the actual date range and rolls over with the day
+    end_date = datetime.now(timezone.utc).date()
+    filters = normalize_filters({
+        'table': f'{PROJECT}.{DATASET}.{TABLE}',
+        'carrier': carrier,
+        'client': client,
+        'grouped_by': grouped_by,
+        'oversized': oversized,
+        'start_date': (end_date - timedelta(days=days)).isoformat(),
+        'end_date': end_date.isoformat(),
+    }, case_insensitive=['oversized'])
+    return cached_fetch(
+        cache, filters, output_file,
+        lambda: _run_query(output_file, days, carrier, client, grouped_by, oversized),
+        refresh=refresh,
+    )
+
+
+def _run_query(output_file, days, carrier, client, grouped_by, oversized):
+    """Run the KPI query and save the result to CSV (no cache)"""
     
     print("\n" + "="*80)
     print("🚀 AUTOMATED BIGQUERY DATA FETCH")
@@ -60,32 +127,7 @@ def fetch_data(output_file, days=30, carrier='Nash', client='Walmart',
         print("   gcloud auth application-default login")
         return None
     
-    # Build the query with optional oversized filter
-    oversized_filter = ""
-    query_params = [
-        bigquery.ScalarQueryParameter("carrier", "STRING", carrier),
-        bigquery.ScalarQueryParameter("client", "STRING", client),
-        bigquery.ScalarQueryParameter("grouped_by", "STRING", grouped_by),
-        bigquery.ScalarQueryParameter("days", "INT64", days),
-    ]
-
-    # Add oversized filter if not "all"
-    if oversized.lower() != 'all':
-        oversized_filter = "AND OVERSIZED_ITEM_IND = @oversized"
-        # Convert to INT64 for BigQuery type matching
-        oversized_int = int(oversized)
-        query_params.append(bigquery.ScalarQueryParameter("oversized", "INT64", oversized_int))
-
-    query = f"""
-    SELECT *
-    FROM `{PROJECT}.{DATASET}.{TABLE}`
-    WHERE carrier_org_nm = @carrier
-      AND client = @client
-      AND grouped_by = @grouped_by
-      {oversized_filter}
-      AND slot_dt >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
-    ORDER BY slot_dt DESC, store_id
-    """
+    query, query_params = build_query(days, carrier, client, grouped_by, oversized)
 
     # Configure query parameters (prevents SQL injection)
     job_config = bigquery.QueryJobConfig(query_parameters=query_params)
@@ -154,6 +196,10 @@ Examples:
 
   # Fetch last 90 days
   python3 scripts/auto_fetch_bigquery.py --output data/quarterly.csv --days 90
+
+  # Same filters as a request in the last hour are copied from data/.fetch_cache;
+  # force a new query with --refresh
+  python3 scripts/auto_fetch_bigquery.py --output data/latest.csv --refresh
         """
     )
     
@@ -189,6 +235,16 @@ Examples:
         default='0',
         help='Oversized item indicator: 0=non-oversized, 1=oversized, all=both (default: 0)'
     )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore a cached copy of this request and query again'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        help='Seconds a cached fetch stays fresh (default: $FETCH_CACHE_TTL or 3600, 0 disables)'
+    )
 
     args = parser.parse_args()
 
@@ -199,7 +255,9 @@ Examples:
         carrier=args.carrier,
         client=args.client,
         grouped_by=args.grouped_by,
-        oversized=args.oversized
+        oversized=args.oversized,
+        cache=FetchCache('bigquery-api', ttl_seconds=args.cache_ttl),
+        refresh=args.refresh
     )
     
     if output_path:
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Analysis Benchmark Harness
+Runs each scripts/analysis entry point against route exports (real or
+synthetic), records wall time and peak RSS, and compares against stored
+baselines.
+
+Every timed run gets its own empty route cache (ROUTE_ANALYZER_CACHE_DIR),
+so results are cold and don't depend on which analysis ran first. With
+--warm, each analysis is also timed against a cache built beforehand and
+reported as "<analysis>@warm".
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from typing import Optional
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+ANALYSIS_DIR = SCRIPTS_DIR / 'analysis'
+DEFAULT_BASELINE = SCRIPTS_DIR.parent / 'benchmarks' / 'baselines.json'
+DEFAULT_DATA_DIR = SCRIPTS_DIR.parent / 'benchmarks' / 'data'
+
+# Analysis name -> (script, extra request fields sent on stdin)
+ANALYSES = {
+    'store-metrics': ('store_metrics_breakdown.py', {}),
+    'batch-by-day': ('batch_density_by_day.py', {}),
+    'returns': ('returns_breakdown.py', {'topN': 10}),
+    'route-analyzer': ('route_analyzer.py', {}),
+    'store-trends': ('store_kpi_trends.py', {'topN': 10}),
+    'store-comparison': ('store_comparison.py', {'topN': 10}),
+}
+
+
+def _rss_to_mb(ru_maxrss: int) -> float:
+    """ru_maxrss is kilobytes on Linux and bytes on macOS"""
+    if sys.platform == 'darwin':
+        return ru_maxrss / 1024 / 1024
+    return ru_maxrss / 1024
+
+
+def run_analysis(script: Path, request: dict, cache_dir: Optional[str] = None) -> dict:
+    """
+    Run one analysis script in a fresh process and measure it.
+
+    cache_dir is the route cache the run uses; None gives it an empty one.
+    """
+    with tempfile.TemporaryDirectory(prefix='benchmark-cache-') as empty_cache, \
+            tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        env = {**os.environ, 'ROUTE_ANALYZER_CACHE_DIR': cache_dir or empty_cache}
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, str(script)],
+            stdin=subprocess.PIPE, stdout=out, stderr=err, env=env
+        )
+        proc.stdin.write(json.dumps(request).encode())
+        proc.stdin.close()
+
+        if hasattr(os, 'wait4'):
+            # wait4 gives the rusage of exactly this child
+            _, status, usage = os.wait4(proc.pid, 0)
+            wall = time.perf_counter() - start
+            returncode = os.waitstatus_to_exitcode(status)
+            proc.returncode = returncode
+            peak_rss_mb = _rss_to_mb(usage.ru_maxrss)
+        else:
+            returncode = proc.wait()
+            wall = time.perf_counter() - start
+            peak_rss_mb = None
+
+        err.seek(0)
+        stderr = err.read().decode(errors='replace')
+
+    return {
+        'ok': returncode == 0,
+        'wall_seconds': round(wall, 3),
+        'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+        'error': stderr.strip().splitlines()[-1] if returncode != 0 and stderr.strip() else None,
+    }
+
+
+def _summarize(name: str, runs: list) -> dict:
+    """Best wall time and highest peak RSS of an analysis's runs"""
+    ok_runs = [r for r in runs if r['ok']]
+    if not ok_runs:
+        print(f"   ❌ {name}: {runs[-1]['error']}")
+        return {'ok': False, 'error': runs[-1]['error']}
+
+    best = min(ok_runs, key=lambda r: r['wall_seconds'])
+    result = {
+        'ok': True,
+        'wall_seconds': best['wall_seconds'],
+        'peak_rss_mb': max((r['peak_rss_mb'] or 0) for r in ok_runs) or None,
+        'runs': len(ok_runs),
+    }
+    print(f"   ✓ {name}: {best['wall_seconds']:.2f}s, peak RSS {result['peak_rss_mb']} MB")
+    return result
+
+
+def benchmark_dataset(csv_path: str, analyses: list, repeat: int, warm: bool = False) -> dict:
+    """Benchmark the selected analyses on one dataset, keeping the best run"""
+    results = {}
+    for name in analyses:
+        script_name, extra = ANALYSES[name]
+        script = ANALYSIS_DIR / script_name
+        request = {'csv_path': csv_path, **extra}
+
+        # Cold: every run builds its own route cache from scratch
+        results[name] = _summarize(name, [run_analysis(script, request) for _ in range(repeat)])
+
+        if warm:
+            with tempfile.TemporaryDirectory(prefix='benchmark-cache-') as cache_dir:
+                # Untimed run to build the cache the timed runs read
+                run_analysis(script, request, cache_dir)
+                runs = [run_analysis(script, request, cache_dir) for _ in range(repeat)]
+            results[f'{name}@warm'] = _summarize(f'{name}@warm', runs)
+
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return regressions where wall time or peak RSS grew beyond tolerance"""
+    regressions = []
+    for dataset, analyses in results.items():
+        for name, current in analyses.items():
+            previous = baseline.get(dataset, {}).get(name)
+            if not previous or not current.get('ok') or not previous.get('ok'):
+                continue
+
+            for metric in ('wall_seconds', 'peak_rss_mb'):
+                before = previous.get(metric)
+                after = current.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                current[f'{metric}_change_pct'] = round(change * 100, 1)
+                if change > tolerance:
+                    regressions.append({
+                        'dataset': dataset,
+                        'analysis': name,
+                        'metric': metric,
+                        'baseline': before,
+                        'current': after,
+                        'change_pct': round(change * 100, 1),
+                    })
+    return regressions
+
+
+def ensure_synthetic_dataset(size: str, data_dir: Path, stores: int, carriers: int) -> str:
+    """Generate (once) a synthetic dataset for a preset size"""
+    from generate_route_data import SIZE_PRESETS, generate_route_csv
+
+    path = data_dir / f'synthetic-{size}-{stores}s-{carriers}c.csv'
+    if not path.exists():
+        print(f"📦 Generating {size} synthetic dataset ({SIZE_PRESETS[size]:,} rows)...")
+        generate_route_csv(str(path), rows=SIZE_PRESETS[size], stores=stores, carriers=carriers)
+    return str(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark analysis scripts (wall time + peak RSS) against baselines',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Record a baseline on the 10k synthetic dataset
+  python3 scripts/benchmark_analyses.py --size small --save-baseline
+
+  # Compare 1M-row performance against the stored baseline, fail on >20% regressions
+  python3 scripts/benchmark_analyses.py --size medium --fail-on-regression
+
+  # Benchmark a real export
+  python3 scripts/benchmark_analyses.py --data data/latest_data.csv --analysis store-metrics
+
+  # Cold runs plus runs against a prebuilt route cache
+  python3 scripts/benchmark_analyses.py --size small --warm --repeat 3
+        """
+    )
+
+    parser.add_argument('--data', action='append', default=[], help='CSV file to benchmark (repeatable)')
+    parser.add_argument('--size', action='append', default=[], choices=['small', 'medium', 'large'],
+                        help='Synthetic dataset size to generate and benchmark (repeatable)')
+    parser.add_argument('--stores', type=int, default=500, help='Stores in synthetic data (default: 500)')
+    parser.add_argument('--carriers', type=int, default=6, help='Carriers in synthetic data (default: 6)')
+    parser.add_argument('--data-dir', default=str(DEFAULT_DATA_DIR), help='Where synthetic datasets are cached')
+    parser.add_argument('--analysis', action='append', choices=sorted(ANALYSES),
+                        help='Analysis to run (repeatable, default: all)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per analysis; best wall time is kept')
+    parser.add_argument('--warm', action='store_true',
+                        help='Also time each analysis with a prebuilt route cache (reported as <analysis>@warm)')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed slowdown before flagging (default: 0.20)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 if any regression is found')
+    parser.add_argument('--output', help='Write the full benchmark report to this JSON file')
+
+    args = parser.parse_args()
+
+    datasets = list(args.data)
+    for size in args.size:
+        datasets.append(ensure_synthetic_dataset(size, Path(args.data_dir), args.stores, args.carriers))
+    if not datasets:
+        datasets.append(ensure_synthetic_dataset('small', Path(args.data_dir), args.stores, args.carriers))
+
+    analyses = args.analysis or list(ANALYSES)
+
+    print("\n" + "="*80)
+    print("⏱️  ANALYSIS BENCHMARK")
+    print("="*80)
+
+    results = {}
+    for csv_path in datasets:
+        label = Path(csv_path).name
+        print(f"\n📂 {label}")
+        results[label] = benchmark_dataset(str(Path(csv_path).absolute()), analyses, args.repeat, args.warm)
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()).get('results', {}) if baseline_path.exists() else {}
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'results': results,
+        'regressions': regressions,
+    }
+
+    print("\n" + "="*80)
+    print("📊 BASELINE COMPARISON")
+    print("="*80)
+    if not baseline:
+        print(f"No baseline at {baseline_path} (use --save-baseline to create one)")
+    elif regressions:
+        for r in regressions:
+            print(f"   🚨 {r['analysis']} on {r['dataset']}: {r['metric']} "
+                  f"{r['baseline']} → {r['current']} (+{r['change_pct']}%)")
+    else:
+        print(f"✅ No regressions beyond {args.tolerance * 100:.0f}%")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Report saved to: {args.output}")
+
+    if args.save_baseline:
+        merged = {**baseline}
+        for dataset, analyses_results in results.items():
+            merged.setdefault(dataset, {}).update(analyses_results)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps({**report, 'results': merged, 'regressions': []}, indent=2))
+        print(f"\n💾 Baseline saved to: {baseline_path}")
+
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
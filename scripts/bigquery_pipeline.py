@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+🚀 BIGQUERY FETCH → CONVERT → ANALYZE PIPELINE
+One command for the UI's BigQuery path. Instead of waiting for the whole
+download, then converting the file, then analyzing it, query pages stream
+through three overlapped stages:
+
+    fetch ──▶ normalize (raw + Tableau-format CSVs) ──▶ aggregate (store KPI sums)
+
+Stages are linked by small bounded queues, so a slow stage makes the fetcher
+wait instead of buffering the whole result in memory. The store KPI analysis
+is finished a moment after the last page arrives, and both CSVs are on disk
+for the other analyses and for download.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'analysis'))
+from convert_bigquery_to_tableau_format import normalize_bigquery_frame  # noqa: E402
+from bigquery_kpi_analysis import partial_store_kpis, merge_store_kpis, finalize_store_kpis  # noqa: E402
+from compressed_input import read_csv  # noqa: E402
+
+# Rows per BigQuery page / replayed CSV chunk
+PAGE_ROWS = 50_000
+# Pages allowed to wait between two stages before the producer blocks
+QUEUE_BATCHES = 4
+# Fold per-page partials into the running totals this often
+MERGE_EVERY = 8
+
+_DONE = object()
+
+
+# ===== SOURCES =====
+
+def bigquery_batches(days=30, carrier='Nash', client='Walmart', grouped_by='Unscheduled Delivery',
+                     oversized='0', page_rows=PAGE_ROWS):
+    """DataFrame pages of the auto-fetch query, as BigQuery returns them"""
+    # Imported here so CSV replays work without the BigQuery client installed
+    from google.cloud import bigquery
+    from auto_fetch_bigquery import PROJECT, build_query
+
+    client_bq = bigquery.Client(project=PROJECT)
+    query, query_params = build_query(days, carrier, client, grouped_by, oversized)
+    job_config = bigquery.QueryJobConfig(query_parameters=query_params)
+    rows = client_bq.query(query, job_config=job_config).result(page_size=page_rows)
+    yield from rows.to_dataframe_iterable()
+
+
+def csv_batches(csv_path, page_rows=PAGE_ROWS):
+    """Replay a saved BigQuery export in pages (no credentials needed; may be compressed)"""
+    yield from read_csv(csv_path, chunksize=page_rows)
+
+
+# ===== STAGES =====
+
+def _append_csv(df, path, first):
+    df.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+
+
+async def fetch_stage(batches, outbound, stats):
+    """Pull pages off the (blocking) source in a worker thread"""
+    pages = iter(batches)
+    while True:
+        batch = await asyncio.to_thread(next, pages, None)
+        if batch is None:
+            break
+        if stats['batches'] == 0:
+            stats['first_batch_seconds'] = round(time.perf_counter() - stats['started'], 3)
+        stats['batches'] += 1
+        stats['rows'] += len(batch)
+        print(f"   📥 Page {stats['batches']}: {len(batch):,} rows ({stats['rows']:,} total)", file=sys.stderr)
+        # Waits here while downstream stages are QUEUE_BATCHES pages behind
+        await outbound.put(batch)
+    stats['fetch_seconds'] = round(time.perf_counter() - stats['started'], 3)
+    await outbound.put(_DONE)
+
+
+async def normalize_stage(inbound, outbound, raw_path, tableau_path):
+    """Write each page to the raw and Tableau-format CSVs, then pass it on"""
+    first = True
+    while True:
+        batch = await inbound.get()
+        if batch is _DONE:
+            break
+
+        def write(batch=batch, first=first):
+            _append_csv(batch, raw_path, first)
+            converted, _ = normalize_bigquery_frame(batch)
+            _append_csv(converted, tableau_path, first)
+
+        await asyncio.to_thread(write)
+        first = False
+        await outbound.put(batch)
+    await outbound.put(_DONE)
+
+
+async def aggregate_stage(inbound):
+    """Fold pages into mergeable store KPI sums"""
+    merged = []
+    pending = []
+    while True:
+        batch = await inbound.get()
+        if batch is _DONE:
+            break
+        pending.append(await asyncio.to_thread(partial_store_kpis, batch))
+        if len(pending) >= MERGE_EVERY:
+            merged = [merge_store_kpis(merged + pending)]
+            pending = []
+
+    partials = merged + pending
+    return merge_store_kpis(partials) if partials else None
+
+
+async def run_pipeline(batches, raw_path, tableau_path, top_n=10, bottom_n=10,
+                       queue_batches=QUEUE_BATCHES):
+    """
+    Stream pages through fetch → normalize → aggregate.
+
+    Args:
+        batches: Iterable of DataFrame pages (bigquery_batches or csv_batches)
+        raw_path: Where to write the BigQuery-format CSV
+        tableau_path: Where to write the Tableau-format CSV
+        top_n / bottom_n: Store ranking sizes (-1 lists every store)
+        queue_batches: Pages buffered between stages
+
+    Returns:
+        Pipeline stats plus the store KPI analysis
+    """
+    fetched = asyncio.Queue(maxsize=queue_batches)
+    normalized = asyncio.Queue(maxsize=queue_batches)
+    stats = {'batches': 0, 'rows': 0, 'started': time.perf_counter()}
+
+    tasks = [
+        asyncio.ensure_future(fetch_stage(batches, fetched, stats)),
+        asyncio.ensure_future(normalize_stage(fetched, normalized, raw_path, tableau_path)),
+        asyncio.ensure_future(aggregate_stage(normalized)),
+    ]
+    try:
+        _, _, merged = await asyncio.gather(*tasks)
+    except BaseException:
+        # One stage failed - stop the others instead of leaving them waiting on a queue
+        for task in tasks:
+            task.cancel()
+        raise
+
+    if merged is None:
+        raise ValueError("Query returned no rows")
+    analysis = finalize_store_kpis(merged, top_n, bottom_n)
+
+    return {
+        'success': True,
+        'filePath': str(Path(raw_path).absolute()),
+        'tableauPath': str(Path(tableau_path).absolute()),
+        'rows': stats['rows'],
+        'batches': stats['batches'],
+        'timings': {
+            'first_batch_seconds': stats.get('first_batch_seconds'),
+            'fetch_seconds': stats.get('fetch_seconds'),
+            'total_seconds': round(time.perf_counter() - stats['started'], 3),
+        },
+        'source': 'bigquery',
+        'analysis': analysis,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='🚀 Fetch, convert and analyze BigQuery data in one streaming pass',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Fetch the last 30 days, write both CSVs and print the store KPI analysis
+  python3 scripts/bigquery_pipeline.py --output data/latest.csv
+
+  # Last 7 days, every store ranked
+  python3 scripts/bigquery_pipeline.py --output data/weekly.csv --days 7 --top-n all
+
+  # Replay an earlier download through the same pipeline (no credentials needed)
+  python3 scripts/bigquery_pipeline.py --from-csv data/latest.csv --output data/replay.csv
+        """
+    )
+
+    parser.add_argument('--output', '-o', default='data/latest_data.csv',
+                        help='BigQuery-format CSV path; the Tableau copy gets a -tableau suffix')
+    parser.add_argument('--days', type=int, default=30, help='Number of days to fetch (default: 30)')
+    parser.add_argument('--carrier', default='Nash', help='Carrier filter (default: Nash)')
+    parser.add_argument('--client', default='Walmart', help='Client filter (default: Walmart)')
+    parser.add_argument('--type', default='Unscheduled Delivery', dest='grouped_by',
+                        help='Delivery type filter (default: Unscheduled Delivery)')
+    parser.add_argument('--oversized', default='0',
+                        help='Oversized item indicator: 0=non-oversized, 1=oversized, all=both (default: 0)')
+    parser.add_argument('--from-csv', help='Read pages from a saved BigQuery CSV instead of querying')
+    parser.add_argument('--page-rows', type=int, default=PAGE_ROWS,
+                        help=f'Rows per page (default: {PAGE_ROWS:,})')
+    parser.add_argument('--queue-batches', type=int, default=QUEUE_BATCHES,
+                        help=f'Pages buffered between stages (default: {QUEUE_BATCHES})')
+    parser.add_argument('--top-n', default='10', help="Stores in the top/bottom lists, or 'all' (default: 10)")
+    parser.add_argument('--bottom-n', type=int, default=10, help='Stores in the bottom list (default: 10)')
+
+    args = parser.parse_args()
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tableau_path = output_path.with_name(f"{output_path.stem}-tableau{output_path.suffix}")
+
+    if str(args.top_n).lower() == 'all':
+        top_n, bottom_n = -1, -1
+    else:
+        top_n, bottom_n = int(args.top_n), args.bottom_n
+
+    if args.from_csv:
+        print(f"📂 Replaying {args.from_csv}...", file=sys.stderr)
+        batches = csv_batches(args.from_csv, args.page_rows)
+    else:
+        print("🔐 Querying BigQuery...", file=sys.stderr)
+        batches = bigquery_batches(args.days, args.carrier, args.client, args.grouped_by,
+                                   args.oversized, args.page_rows)
+
+    try:
+        results = asyncio.run(run_pipeline(batches, output_path, tableau_path, top_n, bottom_n,
+                                           queue_batches=args.queue_batches))
+    except Exception as e:
+        print(f"❌ Pipeline failed: {e}", file=sys.stderr)
+        print("💡 For BigQuery access: gcloud auth application-default login", file=sys.stderr)
+        return 1
+
+    timings = results['timings']
+    print(f"✅ {results['rows']:,} rows in {results['batches']} pages; "
+          f"fetch done at {timings['fetch_seconds']}s, analysis at {timings['total_seconds']}s",
+          file=sys.stderr)
+
+    result_json = json.dumps(results, indent=2, default=str)
+    result_json = result_json.replace('NaN', '0').replace('Infinity', '0').replace('-Infinity', '0')
+    print(result_json)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,59 +2,62 @@
 """
 Convert BigQuery data format to Tableau-compatible format for analysis scripts.
 Maps BigQuery column names to expected Tableau column names.
+Accepts plain, .csv.gz, .csv.zst or .zip exports.
 """
 
 import sys
-import pandas as pd
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'analysis'))
+from compressed_input import read_csv, split_suffix  # noqa: E402
 
-def convert_bigquery_to_tableau(input_csv, output_csv=None):
-    """
-    Convert BigQuery CSV to Tableau-compatible format.
 
-    Args:
-        input_csv: Path to BigQuery CSV file
-        output_csv: Path to output file (defaults to input_csv with -tableau suffix)
-    """
+# Column mapping: BigQuery -> Tableau
+COLUMN_MAPPING = {
+    # Date
+    'slot_dt': 'Report Date',
 
-    print(f"\n📊 Converting BigQuery data to Tableau format...")
-    print(f"   Input: {input_csv}")
+    # Store info
+    'store_id': 'Store ID',
 
-    # Read BigQuery CSV
-    df = pd.read_csv(input_csv)
-    print(f"   Rows: {len(df):,}")
-    print(f"   Columns: {len(df.columns)}")
+    # Orders
+    'Order_Count': 'Total Orders',
+    'Total_Deliveries_Delivered_Returned': 'Delivered Orders',
+    'total_po_return': 'Returned Orders',
+    'total_incomplete_deliveries': 'Failed Orders',
+    # Note: BigQuery doesn't have pending orders directly, we'll calculate if needed
+
+    # Trips
+    'total_trips_completed': 'Total Routes',
+
+    # Time metrics - BigQuery aggregates these differently
+    # We'll create placeholders since BigQuery data is pre-aggregated
+    # Individual route timing isn't available in BigQuery aggregated data
+}
 
-    # Column mapping: BigQuery -> Tableau
-    column_mapping = {
-        # Date
-        'slot_dt': 'Report Date',
+# Time-based metrics aren't in BigQuery aggregated data
+TIME_COLUMNS = ['Driver Dwell Time', 'Driver Load Time', 'Driver Total Time',
+                'Trip Actual Time', 'Estimated Duration']
 
-        # Store info
-        'store_id': 'Store ID',
 
-        # Orders
-        'Order_Count': 'Total Orders',
-        'Total_Deliveries_Delivered_Returned': 'Delivered Orders',
-        'total_po_return': 'Returned Orders',
-        'total_incomplete_deliveries': 'Failed Orders',
-        # Note: BigQuery doesn't have pending orders directly, we'll calculate if needed
+def normalize_bigquery_frame(df):
+    """
+    Map a frame of BigQuery rows to Tableau column names.
 
-        # Trips
-        'total_trips_completed': 'Total Routes',
+    Works on any slice of an export (row-wise only), so the streaming
+    pipeline can normalize pages as they arrive.
 
-        # Time metrics - BigQuery aggregates these differently
-        # We'll create placeholders since BigQuery data is pre-aggregated
-        # Individual route timing isn't available in BigQuery aggregated data
-    }
+    Returns:
+        (converted frame, list of notes describing what was mapped/added)
+    """
+    notes = []
 
     # Rename columns that exist
     df_converted = df.copy()
-    for bq_col, tableau_col in column_mapping.items():
+    for bq_col, tableau_col in COLUMN_MAPPING.items():
         if bq_col in df_converted.columns:
             df_converted.rename(columns={bq_col: tableau_col}, inplace=True)
-            print(f"   ✓ Mapped: {bq_col} → {tableau_col}")
+            notes.append(f"✓ Mapped: {bq_col} → {tableau_col}")
 
     # Add missing columns with default/calculated values
     if 'Pending Orders' not in df_converted.columns:
@@ -63,26 +66,48 @@ def convert_bigquery_to_tableau(input_csv, output_csv=None):
             df_converted['Pending Orders'] = (
                 df['total_deliveries'] - df['Total_Deliveries_Delivered_Returned']
             ).fillna(0).clip(lower=0)
-            print(f"   ✓ Calculated: Pending Orders")
+            notes.append("✓ Calculated: Pending Orders")
 
     # Time-based metrics aren't in BigQuery aggregated data, add placeholders
-    time_columns = ['Driver Dwell Time', 'Driver Load Time', 'Driver Total Time',
-                    'Trip Actual Time', 'Estimated Duration']
-
-    for col in time_columns:
+    for col in TIME_COLUMNS:
         if col not in df_converted.columns:
             df_converted[col] = 0  # Placeholder - BigQuery data is pre-aggregated
-            print(f"   ⚠ Added placeholder: {col} (not in BigQuery aggregated data)")
+            notes.append(f"⚠ Added placeholder: {col} (not in BigQuery aggregated data)")
 
     # Ensure Date column exists
     if 'Report Date' in df_converted.columns and 'Date' not in df_converted.columns:
         df_converted['Date'] = df_converted['Report Date']
-        print(f"   ✓ Created: Date from Report Date")
+        notes.append("✓ Created: Date from Report Date")
+
+    return df_converted, notes
+
+
+def convert_bigquery_to_tableau(input_csv, output_csv=None):
+    """
+    Convert BigQuery CSV to Tableau-compatible format.
+
+    Args:
+        input_csv: Path to BigQuery CSV file (optionally compressed)
+        output_csv: Path to output file (defaults to input_csv with -tableau suffix,
+                    compressed the same way)
+    """
+
+    print(f"\n📊 Converting BigQuery data to Tableau format...")
+    print(f"   Input: {input_csv}")
+
+    # Read BigQuery CSV
+    df = read_csv(input_csv)
+    print(f"   Rows: {len(df):,}")
+    print(f"   Columns: {len(df.columns)}")
+
+    df_converted, notes = normalize_bigquery_frame(df)
+    for note in notes:
+        print(f"   {note}")
 
     # Determine output path
     if output_csv is None:
-        input_path = Path(input_csv)
-        output_csv = input_path.parent / f"{input_path.stem}-tableau{input_path.suffix}"
+        stem, suffix = split_suffix(input_csv)
+        output_csv = Path(input_csv).parent / f"{stem}-tableau{suffix}"
 
     # Save converted CSV
     df_converted.to_csv(output_csv, index=False)
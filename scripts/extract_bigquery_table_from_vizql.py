@@ -12,6 +12,8 @@ import re
 from dotenv import load_dotenv
 import urllib3
 
+from tableau_workbook_reader import summarize_workbook
+
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -145,45 +147,36 @@ def get_view_data_metadata(session, server):
     return None
 
 
-def search_workbook_xml(session, server, auth_token, site_luid):
-    """Download and search the workbook XML for data source info"""
+# Downloaded workbook / datasource files, packaged or not (first one found is used)
+WORKBOOK_FILES = [
+    'data/ProjectCentralSummaryDashboard_.twbx',
+    'data/Project Central Summary Dashboard_.twb',
+    'data/DATE_LEVEL_AGG_PRJ_CENTRAL_SUMM.TB.tdsx',
+]
+
+
+def search_workbook_xml(session, server, auth_token, site_luid, workbook_file=None):
+    """Stream the downloaded workbook's datasources and collect connection details"""
     
     print("\n📥 Downloading workbook to analyze data source connections...")
     
     # We already downloaded it, let's parse it more thoroughly
-    workbook_file = 'data/Project Central Summary Dashboard_.twb'
+    candidates = [workbook_file] if workbook_file else WORKBOOK_FILES
+    workbook_file = next((path for path in candidates if os.path.exists(path)), None)
     
-    if not os.path.exists(workbook_file):
+    if not workbook_file:
         print("  Workbook file not found, skipping")
         return None
     
     print(f"  Reading: {workbook_file}")
     
-    with open(workbook_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Search for BigQuery-related patterns
-    patterns = {
-        'BigQuery Project': r'project["\s]*[:=]["\s]*([a-z0-9-]+)',
-        'BigQuery Dataset': r'dataset["\s]*[:=]["\s]*([A-Z_]+)',
-        'BigQuery Table': r'table["\s]*[:=]["\s]*([A-Z_]+)',
-        'Connection Server': r'server=["\']([^"\'^]+)["\']',
-        'Database Name': r'dbname=["\']([^"\'^]+)["\']',
-        'Data Source Name': r'<datasource[^>]*name=["\']([^"\'^]+)["\']',
-        'Repository Location': r'repository-location[^>]*id=["\']([^"\'^]+)["\']',
-    }
-    
     print("\n🔍 Searching workbook XML for BigQuery references...")
-    found = {}
+    found = summarize_workbook(workbook_file)
     
-    for name, pattern in patterns.items():
-        matches = re.findall(pattern, content, re.IGNORECASE)
-        if matches:
-            unique_matches = list(set(matches))[:10]
-            found[name] = unique_matches
-            print(f"\n  {name}:")
-            for match in unique_matches:
-                print(f"    - {match}")
+    for name, matches in found.items():
+        print(f"\n  {name}:")
+        for match in matches[:10]:
+            print(f"    - {match}")
     
     return found
 
@@ -211,7 +204,8 @@ def main():
     print("\n" + "="*80)
     print("Method 2: Analyzing Workbook XML")
     print("="*80)
-    workbook_data = search_workbook_xml(session, server, auth_token, site_luid)
+    workbook_file = sys.argv[1] if len(sys.argv) > 1 else None
+    workbook_data = search_workbook_xml(session, server, auth_token, site_luid, workbook_file)
     
     # Summary
     print("\n" + "="*80)
@@ -219,6 +213,14 @@ def main():
     print("="*80)
     print()
     
+    if workbook_data and 'BigQuery Table' in workbook_data:
+        print("🎯 Found BigQuery source tables in the datasource connections:")
+        projects = workbook_data.get('BigQuery Project', ['?'])
+        datasets = workbook_data.get('BigQuery Dataset', ['?'])
+        for table in workbook_data['BigQuery Table']:
+            print(f"   - {projects[0]}.{datasets[0]}.{table}")
+        print()
+
     if workbook_data and 'Database Name' in workbook_data:
         db_names = workbook_data['Database Name']
         print("🎯 Found database/data source names from workbook:")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Fetch Result Cache
+Keeps the files written by the Tableau and BigQuery fetchers, keyed by the
+source and its normalized filter set (carrier, client, OS/grouped_by,
+oversized, date range, store). An identical request made within the TTL is
+served by copying the cached file to the requested output, with no sign-in
+or query at all.
+
+Layout (data/.fetch_cache unless FETCH_CACHE_DIR is set):
+    data/.fetch_cache/<key>.data    the fetched file, byte for byte
+    data/.fetch_cache/<key>.json    source, filters, when it was fetched
+
+Settings:
+    FETCH_CACHE_TTL      seconds a result stays fresh (default 3600, 0 disables the cache)
+    FETCH_CACHE_MAX_MB   total size kept; least recently used results go first (default 2048)
+
+Entries are independent files written by rename, so fetchers running at
+the same time (e.g. two UI requests) never see a half-written result.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+CACHE_DIR_ENV = 'FETCH_CACHE_DIR'
+TTL_ENV = 'FETCH_CACHE_TTL'
+MAX_MB_ENV = 'FETCH_CACHE_MAX_MB'
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / 'data' / '.fetch_cache'
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_MB = 2048
+CACHE_VERSION = 1
+
+
+def normalize_filters(filters: Dict[str, Any], case_insensitive: Iterable[str] = ()) -> Dict[str, str]:
+    """
+    Canonical form of a filter set, so equivalent requests share a key.
+
+    Unset filters (None or blank) are dropped, values become trimmed strings,
+    and fields the source matches case-insensitively are lowercased.
+    """
+    lowered = set(case_insensitive)
+    normalized = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        text = str(value).strip()
+        if not text:
+            continue
+        normalized[name] = text.lower() if name in lowered else text
+    return dict(sorted(normalized.items()))
+
+
+class FetchCache:
+    """TTL + size-bounded cache of fetched files for one data source"""
+
+    def __init__(self, source: str, cache_dir: Optional[str] = None,
+                 ttl_seconds: Optional[float] = None, max_mb: Optional[float] = None):
+        self.source = source
+        self.cache_dir = Path(cache_dir or os.getenv(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None
+                                 else os.getenv(TTL_ENV, DEFAULT_TTL_SECONDS))
+        self.max_bytes = float(max_mb if max_mb is not None
+                               else os.getenv(MAX_MB_ENV, DEFAULT_MAX_MB)) * 1024 * 1024
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def key(self, filters: Dict[str, str]) -> str:
+        """Cache key for normalized filters (see normalize_filters)"""
+        payload = json.dumps({'version': CACHE_VERSION, 'source': self.source, 'filters': filters},
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def _paths(self, key: str):
+        return self.cache_dir / f'{key}.data', self.cache_dir / f'{key}.json'
+
+    def _fresh(self, filters: Dict[str, str]) -> Optional[Tuple[Path, Dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._paths(self.key(filters))
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta.get('fetched_at', 0) > self.ttl_seconds or not data_path.exists():
+            return None
+        return data_path, meta
+
+    def lookup(self, filters: Dict[str, str]) -> Optional[Path]:
+        """Cached file for these filters, or None when missing or older than the TTL"""
+        fresh = self._fresh(filters)
+        return fresh[0] if fresh else None
+
+    def serve(self, filters: Dict[str, str], output_file: str) -> Optional[str]:
+        """
+        Copy a fresh cached result to output_file.
+
+        Returns:
+            Absolute output path on a hit, None on a miss
+        """
+        fresh = self._fresh(filters)
+        if fresh is None:
+            return None
+        cached, meta = fresh
+        output_path = Path(output_file)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            shutil.copyfile(cached, output_path)
+            # Marks the result as recently used for eviction
+            os.utime(cached)
+        except OSError:
+            # Evicted by another fetcher between lookup and copy
+            return None
+
+        age_minutes = (time.time() - meta['fetched_at']) / 60
+        print(f"♻️  Served from fetch cache ({age_minutes:.0f} min old, TTL {self.ttl_seconds / 60:.0f} min)")
+        print(f"💾 Data saved to: {output_file}")
+        return str(output_path.absolute())
+
+    def store(self, filters: Dict[str, str], output_file: str) -> None:
+        """Keep a copy of a freshly fetched file, then evict down to the size bound"""
+        if not self.enabled:
+            return
+        source_path = Path(output_file)
+        size = source_path.stat().st_size
+        if size > self.max_bytes:
+            print(f"⚠️  Not cached: {size / 1024 / 1024:.1f} MB exceeds the {self.max_bytes / 1024 / 1024:.0f} MB fetch cache")
+            return
+
+        key = self.key(filters)
+        data_path, meta_path = self._paths(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_dir / f'{key}.{os.getpid()}.tmp'
+            shutil.copyfile(source_path, tmp)
+            tmp.replace(data_path)
+            # Metadata last: a result only counts once its data is complete
+            tmp.write_text(json.dumps({
+                'source': self.source,
+                'filters': filters,
+                'fetched_at': time.time(),
+                'bytes': size,
+            }, indent=2))
+            tmp.replace(meta_path)
+            self.evict(keep=key)
+        except OSError as e:
+            # Caching only saves the next identical request a fetch
+            print(f"⚠️  Fetch result not cached: {e}", file=sys.stderr)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Cached results (all sources) with their size, fetch time and last use"""
+        entries = []
+        if not self.cache_dir.exists():
+            return entries
+        for meta_path in self.cache_dir.glob('*.json'):
+            data_path = meta_path.with_suffix('.data')
+            try:
+                meta = json.loads(meta_path.read_text())
+                stat = data_path.stat()
+            except (OSError, ValueError):
+                meta, stat = {}, None
+            entries.append({
+                'key': meta_path.stem,
+                'fetched_at': meta.get('fetched_at', 0),
+                'last_used': stat.st_mtime if stat else 0,
+                'bytes': stat.st_size if stat else 0,
+            })
+        return entries
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Drop expired results, then least recently used ones until the cache
+        fits in FETCH_CACHE_MAX_MB. Expiry uses this instance's TTL.
+
+        Returns:
+            Number of results removed
+        """
+        now = time.time()
+        entries = sorted(self.entries(), key=lambda e: e['last_used'])
+        total = sum(e['bytes'] for e in entries)
+        removed = 0
+        for entry in entries:
+            expired = now - entry['fetched_at'] > self.ttl_seconds
+            if entry['key'] == keep or not (expired or total > self.max_bytes):
+                continue
+            data_path, meta_path = self._paths(entry['key'])
+            meta_path.unlink(missing_ok=True)
+            data_path.unlink(missing_ok=True)
+            total -= entry['bytes']
+            removed += 1
+        return removed
+
+
+def cached_fetch(cache: FetchCache, filters: Dict[str, str], output_file: str,
+                 fetch: Callable[[], Optional[str]], refresh: bool = False) -> Optional[str]:
+    """
+    Serve output_file from the cache, or run fetch() and cache what it wrote.
+
+    Args:
+        cache: Cache for the fetcher's source
+        filters: Normalized filter set (see normalize_filters)
+        output_file: Where the fetcher writes its result
+        fetch: Performs the real fetch; returns the output path, or None on failure
+        refresh: Skip the lookup and replace any cached result with a new fetch
+
+    Returns:
+        Absolute output path, or None when the fetch failed
+    """
+    if not refresh:
+        served = cache.serve(filters, output_file)
+        if served:
+            return served
+    output_path = fetch()
+    if output_path:
+        cache.store(filters, output_path)
+    return output_path
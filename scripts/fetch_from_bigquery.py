@@ -10,6 +10,8 @@ import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from fetch_cache import FetchCache, normalize_filters, cached_fetch
+
 # The BigQuery table we found!
 TABLE = "wmt-edw-sandbox:LMD_DA.PROJECT_CENTRAL_SUMMARY_TABLE_DATE_LEVEL_AGGREGATABLE_KPI"
 PROJECT = "wmt-edw-sandbox"
@@ -152,6 +154,16 @@ Examples:
         '--store',
         help='Filter by Store ID'
     )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore a cached copy of this request and query again'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        help='Seconds a cached fetch stays fresh (default: $FETCH_CACHE_TTL or 3600, 0 disables)'
+    )
     
     args = parser.parse_args()
     
@@ -195,8 +207,21 @@ Examples:
     if args.store:
         print(f"Store: {args.store}")
     
-    # Run query
-    output_path = run_bq_query(query, args.output)
+    # Run query (or reuse an identical one fetched within the cache TTL)
+    filters = normalize_filters({
+        'table': TABLE,
+        'carrier': args.carrier,
+        'os': args.os,
+        'client': args.client,
+        'start_date': start_date,
+        'end_date': end_date,
+        'store': args.store,
+    }, case_insensitive=['carrier', 'client'])
+    output_path = cached_fetch(
+        FetchCache('bigquery-cli', ttl_seconds=args.cache_ttl), filters, args.output,
+        lambda: run_bq_query(query, args.output),
+        refresh=args.refresh,
+    )
     
     if output_path:
         print("\n" + "="*80)
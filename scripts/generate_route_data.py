@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Synthetic Route Data Generator
+Produces realistic Dedicated Van Delivery exports (same column set as the
+Tableau route download) so analyses can be benchmarked without sharing
+production data.
+"""
+
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# Preset sizes used by the benchmark harness
+SIZE_PRESETS = {
+    'small': 10_000,
+    'medium': 1_000_000,
+    'large': 10_000_000,
+}
+
+CARRIER_NAMES = [
+    'Nash', 'NTG', 'DeliverOL', 'Roadie', 'Veho', 'Dispatch', 'GoShare',
+    'Bringg', 'Frayt', 'Curri', 'Point Pickup', 'Burq',
+]
+
+FIRST_NAMES = [
+    'James', 'Maria', 'Robert', 'Linda', 'Michael', 'Carlos', 'David', 'Ana',
+    'William', 'Jennifer', 'Jose', 'Patricia', 'Daniel', 'Elena', 'Kevin',
+    'Aisha', 'Brian', 'Mei', 'Jamal', 'Sofia', 'Tyler', 'Priya', 'Marcus',
+    'Grace', 'Luis', 'Fatima', 'Anthony', 'Olga', 'Derek', 'Keisha',
+]
+
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+    'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
+    'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark',
+    'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King',
+]
+
+# Planned departure slots (minutes after midnight) and their weights.
+# 10AM and 12PM dominate, matching the 8.33/7.33 hour route targets.
+DEPARTURE_SLOTS = np.array([9 * 60, 10 * 60, 10 * 60 + 30, 11 * 60, 12 * 60, 13 * 60])
+DEPARTURE_WEIGHTS = np.array([0.05, 0.45, 0.05, 0.10, 0.30, 0.05])
+
+# Planned duration targets (minutes) by departure slot
+SLOT_TARGET_MINUTES = np.array([500, 500, 470, 440, 440, 420])
+
+COLUMNS = [
+    'Date', 'Carrier', 'Store Id', 'Walmart Trip Id', 'Courier Name',
+    'Trip Planned Start', 'Pickup Arrived',
+    'Total Orders', 'Delivered Orders', 'Returned Orders', 'Pending Orders',
+    'Failed Orders', 'Failed Pickups',
+    'Driver Dwell Time', 'Driver Load Time', 'Driver Sort Time',
+    'Driver Store Time', 'Trip Actual Time', 'Driver Total Time',
+    'Estimated Duration', 'Headroom',
+    'Is Pickup Arrived Ontime', 'Failed Orders Rate', 'Adjusted Cddr',
+    'Drops Per Hour Trip',
+]
+
+
+class RouteDataGenerator:
+    """Generates route rows chunk by chunk from a fixed store/carrier/courier universe"""
+
+    def __init__(self, stores: int = 500, carriers: int = 6, couriers_per_store: int = 12,
+                 days: int = 30, start_date: str = '2025-10-04', seed: int = 42):
+        self.rng = np.random.default_rng(seed)
+        self.days = days
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
+
+        # Store universe: ids, base volume and carrier assignment
+        self.store_ids = np.sort(self.rng.choice(np.arange(100, 100 + stores * 8), size=stores, replace=False))
+        # Busy stores receive proportionally more routes
+        store_weights = self.rng.lognormal(mean=0.0, sigma=0.6, size=stores)
+        self.store_weights = store_weights / store_weights.sum()
+        self.store_order_mean = self.rng.uniform(35, 85, size=stores)
+        self.store_return_rate = self.rng.beta(2, 60, size=stores)
+
+        carrier_count = max(1, carriers)
+        self.carrier_names = np.array([
+            CARRIER_NAMES[i] if i < len(CARRIER_NAMES) else f'Carrier {i + 1}'
+            for i in range(carrier_count)
+        ], dtype=object)
+        self.store_carrier = self.rng.integers(0, carrier_count, size=stores)
+
+        # Courier pool per store (names are reused across stores like real data)
+        self.couriers_per_store = max(1, couriers_per_store)
+        courier_total = stores * self.couriers_per_store
+        first = self.rng.integers(0, len(FIRST_NAMES), size=courier_total)
+        last = self.rng.integers(0, len(LAST_NAMES), size=courier_total)
+        self.courier_names = np.array(
+            [f'{FIRST_NAMES[f]} {LAST_NAMES[l]}' for f, l in zip(first, last)],
+            dtype=object
+        )
+
+        # Pre-formatted timestamp labels for every (day, slot) combination
+        slot_count = len(DEPARTURE_SLOTS)
+        planned = [
+            self.start_date + timedelta(days=int(d), minutes=int(m))
+            for d in range(days) for m in DEPARTURE_SLOTS
+        ]
+        self.planned_labels = np.array(
+            [ts.strftime('%m/%d/%Y %I:%M:%S %p') for ts in planned], dtype=object
+        ).reshape(days, slot_count)
+        self.date_labels = np.array(
+            [(self.start_date + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(days)],
+            dtype=object
+        )
+        self._next_trip = 0
+
+    def generate_chunk(self, rows: int) -> pd.DataFrame:
+        """Generate one chunk of route rows"""
+        rng = self.rng
+
+        store_idx = rng.choice(len(self.store_ids), size=rows, p=self.store_weights)
+        day_idx = rng.integers(0, self.days, size=rows)
+        slot_idx = rng.choice(len(DEPARTURE_SLOTS), size=rows, p=DEPARTURE_WEIGHTS)
+
+        # A minority of routes at each store are run by a secondary carrier
+        carrier_idx = self.store_carrier[store_idx].copy()
+        secondary = rng.random(rows) < 0.15
+        carrier_idx[secondary] = rng.integers(0, len(self.carrier_names), size=int(secondary.sum()))
+        courier_idx = store_idx * self.couriers_per_store + rng.integers(0, self.couriers_per_store, size=rows)
+
+        # ===== ORDER COUNTS =====
+        total = np.maximum(rng.poisson(self.store_order_mean[store_idx]), 1)
+        failed = rng.binomial(total, 0.004)
+        failed_pickups = rng.binomial(total, 0.002)
+        return_rate = self.store_return_rate[store_idx].copy()
+        # Occasional catastrophic route (vehicle issue, driver gave up)
+        catastrophic = rng.random(rows) < 0.003
+        return_rate[catastrophic] = rng.uniform(0.4, 0.9, size=int(catastrophic.sum()))
+        returned = rng.binomial(total - failed, return_rate)
+        pending = rng.binomial(total - failed - returned, 0.01)
+        delivered = total - failed - returned - pending
+
+        # ===== TIME METRICS (minutes) =====
+        estimated = SLOT_TARGET_MINUTES[slot_idx] * rng.normal(1.0, 0.05, size=rows)
+        actual = estimated * rng.lognormal(mean=0.0, sigma=0.12, size=rows)
+        # Short-trip and bad-data tails that the analyses have to cope with
+        short = rng.random(rows) < 0.01
+        actual[short] = rng.uniform(5, 60, size=int(short.sum()))
+        load = rng.gamma(shape=4.0, scale=6.0, size=rows)
+        dwell = rng.gamma(shape=2.0, scale=7.0, size=rows)
+        long_break = rng.random(rows) < 0.04
+        dwell[long_break] += rng.uniform(30, 120, size=int(long_break.sum()))
+        sort = rng.gamma(shape=2.0, scale=3.0, size=rows)
+        store_time = load + dwell + sort
+        driver_total = actual + store_time
+
+        arrival_offset = rng.normal(-5.0, 12.0, size=rows)
+        ontime = arrival_offset <= 0
+
+        planned_labels = self.planned_labels[day_idx, slot_idx]
+        planned_ts = pd.to_datetime(planned_labels, format='%m/%d/%Y %I:%M:%S %p')
+        arrived = (planned_ts + pd.to_timedelta(np.round(arrival_offset), unit='min')).strftime(
+            '%m/%d/%Y %I:%M:%S %p'
+        )
+
+        trip_numbers = np.arange(self._next_trip, self._next_trip + rows, dtype=np.uint64)
+        self._next_trip += rows
+        trip_ids = pd.Series(trip_numbers * np.uint64(2654435761) % np.uint64(2 ** 48)).map('{:012x}'.format)
+
+        effective_total = total - failed
+        with np.errstate(divide='ignore', invalid='ignore'):
+            adjusted_cddr = np.where(effective_total > 0, delivered / effective_total, 0.0)
+            drops_per_hour = np.where(actual > 0, delivered / (actual / 60), 0.0)
+
+        return pd.DataFrame({
+            'Date': self.date_labels[day_idx],
+            'Carrier': self.carrier_names[carrier_idx],
+            'Store Id': self.store_ids[store_idx],
+            'Walmart Trip Id': trip_ids.values,
+            'Courier Name': self.courier_names[courier_idx],
+            'Trip Planned Start': planned_labels,
+            'Pickup Arrived': np.asarray(arrived, dtype=object),
+            'Total Orders': total,
+            'Delivered Orders': delivered,
+            'Returned Orders': returned,
+            'Pending Orders': pending,
+            'Failed Orders': failed,
+            'Failed Pickups': failed_pickups,
+            'Driver Dwell Time': dwell.round(1),
+            'Driver Load Time': load.round(1),
+            'Driver Sort Time': sort.round(1),
+            'Driver Store Time': store_time.round(1),
+            'Trip Actual Time': actual.round(1),
+            'Driver Total Time': driver_total.round(1),
+            'Estimated Duration': estimated.round(1),
+            'Headroom': (estimated - actual).round(1),
+            'Is Pickup Arrived Ontime': ontime.astype(int),
+            'Failed Orders Rate': (failed / total).round(4),
+            'Adjusted Cddr': adjusted_cddr.round(4),
+            'Drops Per Hour Trip': drops_per_hour.round(2),
+        }, columns=COLUMNS)
+
+
+def generate_route_csv(output_file: str, rows: int, stores: int = 500, carriers: int = 6,
+                       couriers_per_store: int = 12, days: int = 30,
+                       start_date: str = '2025-10-04', seed: int = 42,
+                       chunk_size: int = 500_000) -> str:
+    """
+    Write a synthetic route export to CSV in bounded memory.
+
+    Args:
+        output_file: Path to write the CSV
+        rows: Number of route rows to generate
+        stores: Number of distinct stores (Store Id cardinality)
+        carriers: Number of distinct carriers
+        couriers_per_store: Courier pool size per store
+        days: Number of days covered, starting at start_date
+        start_date: First date in the export (YYYY-MM-DD)
+        seed: Random seed so runs are reproducible
+        chunk_size: Rows generated and written per chunk
+    """
+    generator = RouteDataGenerator(
+        stores=stores, carriers=carriers, couriers_per_store=couriers_per_store,
+        days=days, start_date=start_date, seed=seed
+    )
+
+    output_path = Path(output_file)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    written = 0
+    with open(output_path, 'w', newline='') as f:
+        while written < rows:
+            chunk_rows = min(chunk_size, rows - written)
+            chunk = generator.generate_chunk(chunk_rows)
+            chunk.to_csv(f, index=False, header=(written == 0))
+            written += chunk_rows
+            print(f"   Generated {written:,}/{rows:,} rows", file=sys.stderr)
+
+    return str(output_path.absolute())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic Dedicated Van Delivery route data',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 10k rows for a quick smoke benchmark
+  python3 scripts/generate_route_data.py --size small --output data/synthetic-10k.csv
+
+  # 1M rows across 5,000 stores and 10 carriers
+  python3 scripts/generate_route_data.py --rows 1000000 --stores 5000 --carriers 10 \\
+    --output data/synthetic-1m.csv
+        """
+    )
+
+    parser.add_argument('--output', '-o', required=True, help='Output CSV file path')
+    parser.add_argument('--size', choices=sorted(SIZE_PRESETS), help='Preset row count (small=10k, medium=1M, large=10M)')
+    parser.add_argument('--rows', type=int, help='Number of rows (overrides --size)')
+    parser.add_argument('--stores', type=int, default=500, help='Number of distinct stores (default: 500)')
+    parser.add_argument('--carriers', type=int, default=6, help='Number of distinct carriers (default: 6)')
+    parser.add_argument('--couriers-per-store', type=int, default=12, help='Courier pool size per store (default: 12)')
+    parser.add_argument('--days', type=int, default=30, help='Number of days covered (default: 30)')
+    parser.add_argument('--start-date', default='2025-10-04', help='First date (default: 2025-10-04)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--chunk-size', type=int, default=500_000, help='Rows per write chunk (default: 500000)')
+
+    args = parser.parse_args()
+
+    rows = args.rows or SIZE_PRESETS.get(args.size or 'small')
+
+    print(f"📦 Generating {rows:,} synthetic routes "
+          f"({args.stores} stores, {args.carriers} carriers, {args.days} days)...")
+
+    output_path = generate_route_csv(
+        output_file=args.output,
+        rows=rows,
+        stores=args.stores,
+        carriers=args.carriers,
+        couriers_per_store=args.couriers_per_store,
+        days=args.days,
+        start_date=args.start_date,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+    )
+
+    print(f"✅ Saved to: {output_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Analysis Job Service
+Runs analyses as queued jobs instead of one unbounded Python process per
+upload. A fixed number of worker slots each run one analysis process at a
+time; further jobs wait in a bounded queue, and submissions beyond it are
+refused (HTTP 429) until capacity frees up. Every job gets an id to poll for
+status and fetch the result, plus a memory and a wall-time limit - a job
+that exceeds either is killed without affecting the others.
+
+Peak memory is bounded by workers × memory limit, however bursty the load.
+
+Endpoints:
+    POST   /jobs               {"analysis": "store-metrics", "request": {"csv_path": ...}}
+    GET    /jobs/<id>          status, queue position, timings, peak memory
+    GET    /jobs/<id>/result   the analysis JSON once the job has succeeded
+    DELETE /jobs/<id>          cancel (queued jobs are dropped, running ones killed)
+    GET    /health             workers, queue depth and limits
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, the RSS watchdog still applies
+    resource = None
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+ANALYSIS_DIR = SCRIPTS_DIR / 'analysis'
+
+# Analysis name -> script in scripts/analysis (stdin JSON request, stdout JSON result).
+# Names match the UI's analysisType values.
+ANALYSES = {
+    'store-metrics': 'store_metrics_breakdown.py',
+    'batch-by-day': 'batch_density_by_day.py',
+    'returns': 'returns_breakdown.py',
+    'route-analyzer': 'route_analyzer.py',
+    'failed-orders': 'route_analyzer.py',
+    'store-trends': 'store_kpi_trends.py',
+    'bigquery-kpi': 'bigquery_kpi_analysis.py',
+    'bigquery-metrics': 'bigquery_metrics_analysis.py',
+    'tableau-metrics': 'tableau_metrics_analysis.py',
+    'driver-store': 'driver_store_analysis.py',
+    'multiday': 'multiday_route_analysis.py',
+    'time-breakdown': 'detailed_time_analysis.py',
+    'store-analysis': 'store_specific_analysis.py',
+    'pending-orders': 'pending_orders_analysis.py',
+    'store-comparison': 'store_comparison.py',
+    'store-metrics-incremental': 'store_metrics_incremental.py',
+}
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUED = 16
+DEFAULT_MEMORY_MB = 2048
+DEFAULT_TIMEOUT_SECONDS = 600
+# Finished jobs (and their result files) kept for polling
+DEFAULT_KEEP_FINISHED = 200
+
+# How often running jobs are checked against their limits
+POLL_SECONDS = 0.25
+
+FINISHED = ('succeeded', 'failed', 'timeout', 'memory_limit', 'cancelled')
+
+
+class QueueFull(Exception):
+    """Raised when a job is refused by admission control"""
+
+
+# ===== PROCESS LIMITS =====
+
+def _process_tree_rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its descendants (None without /proc)"""
+    proc = Path('/proc')
+    if not proc.exists():
+        return None
+
+    children: Dict[int, List[int]] = {}
+    rss_pages: Dict[int, int] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+            statm = (entry / 'statm').read_text()
+        except OSError:
+            continue  # exited while we looked
+        # Fields after the parenthesised command name: state, ppid, ...
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+        rss_pages[int(entry.name)] = int(statm.split()[1])
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss_pages.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+# Run as `python -c` in the job's process: sets the rlimits, then execs the
+# analysis in place (same pid, so the watchdog and killpg still apply).
+# Argv: CPU seconds, address-space bytes (0 = unlimited), command...
+_LIMITS_WRAPPER = """
+import os, sys, resource
+cpu, address_space = int(sys.argv[1]), int(sys.argv[2])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+if address_space:
+    resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+os.execv(sys.argv[3], sys.argv[3:])
+"""
+
+
+def _limited_command(script: Path, memory_mb: int, timeout_seconds: float) -> List[str]:
+    """
+    Command running script under hard rlimits, backstops in case the
+    parent's watchdog can't act. The limits are set by the child itself
+    rather than a preexec_fn, which isn't safe with the worker threads.
+    """
+    command = [sys.executable, str(script)]
+    if resource is None:
+        return command
+    # CPU seconds can't exceed wall time; the watchdog normally kills first
+    cpu = int(timeout_seconds) + 5
+    # No RSS watchdog without /proc, so cap the address space instead
+    address_space = 0 if Path('/proc').exists() else memory_mb * 1024 * 1024
+    return [sys.executable, '-c', _LIMITS_WRAPPER, str(cpu), str(address_space)] + command
+
+
+# ===== QUEUE =====
+
+class JobQueue:
+    """
+    Bounded job queue drained by a fixed number of worker threads, each
+    supervising one analysis process at a time.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 memory_mb: int = DEFAULT_MEMORY_MB, timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+                 jobs_dir: Optional[str] = None, keep_finished: int = DEFAULT_KEEP_FINISHED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.memory_mb = memory_mb
+        self.timeout_seconds = timeout_seconds
+        self.keep_finished = keep_finished
+        self.jobs_dir = Path(jobs_dir or tempfile.mkdtemp(prefix='route-analyzer-jobs-'))
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.pending = deque()
+        self.finished = deque()
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.condition = threading.Condition()
+        self.stopping = False
+
+        self.threads = [threading.Thread(target=self._worker, name=f'job-worker-{n}', daemon=True)
+                        for n in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # ----- public API -----
+
+    def submit(self, analysis: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a job; raises QueueFull when the queue is at capacity, ValueError for bad input"""
+        if analysis not in ANALYSES:
+            raise ValueError(f"Unknown analysis '{analysis}' (expected one of: {', '.join(ANALYSES)})")
+        if not (ANALYSIS_DIR / ANALYSES[analysis]).exists():
+            raise ValueError(f"Analysis '{analysis}' is not available ({ANALYSES[analysis]} not found)")
+        if not isinstance(request, dict) or 'csv_path' not in request:
+            raise ValueError("request must be an object with a csv_path")
+
+        with self.condition:
+            if self.stopping:
+                raise QueueFull("Job service is shutting down")
+            if len(self.pending) >= self.max_queued:
+                raise QueueFull(f"{len(self.pending)} jobs already queued (limit {self.max_queued})")
+
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {
+                'id': job_id,
+                'analysis': analysis,
+                'request': request,
+                'status': 'queued',
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+                'peak_rss_mb': None,
+                'error': None,
+            }
+            self.pending.append(job_id)
+            self.condition.notify()
+            return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Public view of a job (None if unknown or expired)"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            view = {key: value for key, value in job.items() if key != 'request'}
+            if job['status'] == 'queued':
+                view['position'] = self.pending.index(job_id) + 1
+            if job['started'] is not None:
+                view['queued_seconds'] = round(job['started'] - job['submitted'], 3)
+                end = job['finished'] or time.time()
+                view['run_seconds'] = round(end - job['started'], 3)
+            return view
+
+    def result(self, job_id: str) -> Optional[str]:
+        """Result JSON text of a succeeded job (None otherwise)"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] != 'succeeded':
+                return None
+        try:
+            return self._output_path(job_id).read_text()
+        except OSError:
+            return None  # expired (and its file removed) since the check
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Drop a queued job or kill a running one"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'queued':
+                self.pending.remove(job_id)
+                self._finish(job, 'cancelled')
+            elif job['status'] == 'running':
+                job['cancel'] = True
+                process = self.processes.get(job_id)
+                if process is not None:
+                    self._kill(process)
+        return self.status(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                'workers': self.workers,
+                'running': len(self.processes),
+                'queued': len(self.pending),
+                'max_queued': self.max_queued,
+                'memory_limit_mb': self.memory_mb,
+                'timeout_seconds': self.timeout_seconds,
+                'memory_bound_mb': self.workers * self.memory_mb,
+            }
+
+    def shutdown(self, kill_running: bool = True):
+        """Stop taking jobs, cancel the queue and (optionally) kill running jobs"""
+        with self.condition:
+            self.stopping = True
+            while self.pending:
+                self._finish(self.jobs[self.pending.popleft()], 'cancelled')
+            if kill_running:
+                for job_id, process in self.processes.items():
+                    self.jobs[job_id]['cancel'] = True
+                    self._kill(process)
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    # ----- workers -----
+
+    def _output_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f'{job_id}.json'
+
+    def _error_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f'{job_id}.err'
+
+    def _finish(self, job: Dict[str, Any], status: str, error: Optional[str] = None):
+        """Mark a job finished and expire the oldest finished jobs (condition held)"""
+        job['status'] = status
+        job['finished'] = time.time()
+        job['error'] = error
+        job.pop('cancel', None)
+        self.finished.append(job['id'])
+        while len(self.finished) > self.keep_finished:
+            expired = self.finished.popleft()
+            self.jobs.pop(expired, None)
+            self._output_path(expired).unlink(missing_ok=True)
+            self._error_path(expired).unlink(missing_ok=True)
+
+    @staticmethod
+    def _kill(process: subprocess.Popen):
+        """Kill the job's whole process group (analyses may start worker processes)"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError, AttributeError):
+            process.kill()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if self.stopping and not self.pending:
+                    return
+                job_id = self.pending.popleft()
+                job = self.jobs[job_id]
+                job['status'] = 'running'
+                job['started'] = time.time()
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        """Run one job's analysis process under the memory and time limits"""
+        job_id = job['id']
+        script = ANALYSIS_DIR / ANALYSES[job['analysis']]
+        out = err = None
+        try:
+            out = open(self._output_path(job_id), 'wb')
+            err = open(self._error_path(job_id), 'wb')
+            process = subprocess.Popen(
+                _limited_command(script, self.memory_mb, self.timeout_seconds),
+                stdin=subprocess.PIPE, stdout=out, stderr=err, cwd=str(SCRIPTS_DIR.parent),
+                start_new_session=True,
+            )
+        except Exception as e:
+            # Out of processes, file descriptors or memory: fail this job but keep the worker
+            for handle in (out, err):
+                if handle is not None:
+                    handle.close()
+            with self.condition:
+                self._finish(job, 'failed', f"Could not start the analysis: {e}")
+            return
+
+        with out, err:
+            with self.condition:
+                self.processes[job_id] = process
+                cancelled = job.get('cancel', False)
+            if cancelled:
+                self._kill(process)
+
+            try:
+                process.stdin.write(json.dumps(job['request']).encode())
+                process.stdin.close()
+            except BrokenPipeError:
+                pass  # died straight away; the exit code says why
+
+            outcome = None
+            peak_mb = 0.0
+            deadline = time.monotonic() + self.timeout_seconds
+            while True:
+                try:
+                    process.wait(timeout=POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                rss_mb = _process_tree_rss_mb(process.pid)
+                if rss_mb is not None:
+                    peak_mb = max(peak_mb, rss_mb)
+                    if rss_mb > self.memory_mb:
+                        outcome = ('memory_limit', f"Exceeded {self.memory_mb} MB (at {rss_mb:.0f} MB)")
+                if outcome is None and time.monotonic() > deadline:
+                    outcome = ('timeout', f"Exceeded {self.timeout_seconds:g}s")
+                if outcome is not None:
+                    self._kill(process)
+                    process.wait()
+                    break
+
+        with self.condition:
+            self.processes.pop(job_id, None)
+            job['peak_rss_mb'] = round(peak_mb, 1) if peak_mb else None
+            if job.get('cancel'):
+                self._finish(job, 'cancelled')
+            elif outcome is not None:
+                self._finish(job, *outcome)
+            elif process.returncode == 0:
+                self._finish(job, 'succeeded')
+            else:
+                stderr = self._error_path(job_id).read_text(errors='replace').strip()
+                last_line = stderr.splitlines()[-1] if stderr else f"Exited with code {process.returncode}"
+                self._finish(job, 'failed', last_line)
+
+
+# ===== HTTP =====
+
+def make_handler(queue: JobQueue):
+    class JobHandler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: Any, headers: Optional[Dict[str, str]] = None):
+            payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _job_path(self):
+            """(job id, trailing part) for /jobs/<id>[/result]"""
+            parts = self.path.split('?', 1)[0].strip('/').split('/')
+            if len(parts) >= 2 and parts[0] == 'jobs':
+                return parts[1], '/'.join(parts[2:])
+            return None, None
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._send(404, {'error': 'Not found'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                # Accept {"analysis", "request": {...}} or the request fields inline
+                request = body.get('request', {key: value for key, value in body.items() if key != 'analysis'})
+                job = queue.submit(body.get('analysis'), request)
+            except QueueFull as e:
+                return self._send(429, {'error': str(e)}, {'Retry-After': str(int(POLL_SECONDS * 20))})
+            except (ValueError, AttributeError) as e:
+                return self._send(400, {'error': str(e)})
+            self._send(202, job, {'Location': f"/jobs/{job['id']}"})
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/health':
+                return self._send(200, {'status': 'healthy', **queue.stats()})
+
+            job_id, rest = self._job_path()
+            status = queue.status(job_id) if job_id else None
+            if status is None:
+                return self._send(404, {'error': 'Unknown job'})
+            if rest == '':
+                return self._send(200, status)
+            if rest != 'result':
+                return self._send(404, {'error': 'Not found'})
+
+            if status['status'] in ('queued', 'running'):
+                return self._send(409, status, {'Retry-After': '1'})
+            result = queue.result(job_id)
+            if result is None:
+                return self._send(500 if status['status'] != 'cancelled' else 410, status)
+            self._send(200, result)
+
+        def do_DELETE(self):
+            job_id, rest = self._job_path()
+            status = queue.cancel(job_id) if job_id and rest == '' else None
+            if status is None:
+                return self._send(404, {'error': 'Unknown job'})
+            self._send(200, status)
+
+        def log_message(self, format, *args):
+            print(f"🌐 {self.address_string()} {format % args}", file=sys.stderr)
+
+    return JobHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run analyses through a bounded job queue',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Two analyses at a time, up to 16 waiting, 2 GB / 10 min per job
+  python3 scripts/job_service.py --port 8765
+
+  # Submit and poll
+  curl -s -X POST localhost:8765/jobs -d '{"analysis": "store-metrics", "request": {"csv_path": "data/latest.csv"}}'
+  curl -s localhost:8765/jobs/<id>
+  curl -s localhost:8765/jobs/<id>/result
+        """
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port (default: 8765)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Analyses run at once (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED,
+                        help=f'Jobs allowed to wait before submissions get 429 (default: {DEFAULT_MAX_QUEUED})')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'Per-job memory limit in MB (default: {DEFAULT_MEMORY_MB})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT_SECONDS,
+                        help=f'Per-job wall-time limit in seconds (default: {DEFAULT_TIMEOUT_SECONDS})')
+    parser.add_argument('--jobs-dir', help='Where job output is kept (default: a temp directory)')
+    parser.add_argument('--keep-finished', type=int, default=DEFAULT_KEEP_FINISHED,
+                        help=f'Finished jobs kept for polling (default: {DEFAULT_KEEP_FINISHED})')
+    args = parser.parse_args()
+
+    queue = JobQueue(args.workers, args.max_queued, args.memory_mb, args.timeout,
+                     args.jobs_dir, args.keep_finished)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(queue))
+
+    print(f"🚀 Job service on http://{args.host}:{args.port} "
+          f"({args.workers} workers × {args.memory_mb} MB, queue {args.max_queued}, "
+          f"timeout {args.timeout:g}s)", file=sys.stderr)
+    print(f"📁 Job output: {queue.jobs_dir}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Shutting down...", file=sys.stderr)
+    finally:
+        server.server_close()
+        queue.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Merge Route CSV Exports
+Concatenates several route exports into one CSV, dropping trips that appear
+in more than one file (overlapping weekly downloads). Used by the
+/api/merge-csv endpoint.
+
+Analyses no longer need a merged file - they accept a list or glob of
+exports directly - but a single combined download is still handy.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'analysis'))
+from multi_file import resolve_inputs, duplicate_trip_masks  # noqa: E402
+from compressed_input import read_csv  # noqa: E402
+
+
+def merge_csv_files(inputs, output_file: str, remove_duplicates: bool = True) -> dict:
+    """
+    Merge route exports into one CSV.
+
+    Args:
+        inputs: Paths and/or glob patterns
+        output_file: Where to write the merged CSV
+        remove_duplicates: Drop trips already present in an earlier file
+
+    Returns:
+        Row counts for the merge
+    """
+    paths = resolve_inputs(inputs)
+    masks = duplicate_trip_masks(paths) if remove_duplicates and len(paths) > 1 else [None] * len(paths)
+
+    total_rows = 0
+    written_rows = 0
+    columns = None
+    for index, (path, keep) in enumerate(zip(paths, masks)):
+        # Read as text so values are written back exactly as exported
+        df = read_csv(path, dtype=str, keep_default_na=False)
+        total_rows += len(df)
+        if keep is not None:
+            df = df[keep]
+
+        if columns is None:
+            columns = list(df.columns)
+        else:
+            # Align later files to the first file's columns
+            df = df.reindex(columns=columns, fill_value='')
+
+        df.to_csv(output_file, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+        written_rows += len(df)
+        print(f"   ✓ {Path(path).name}: {len(df):,} rows", file=sys.stderr)
+
+    return {
+        'files': len(paths),
+        'input_rows': total_rows,
+        'output_rows': written_rows,
+        'duplicates_removed': total_rows - written_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge route CSV exports, dropping duplicate trips',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Merge two weekly exports
+  python3 scripts/merge_csv_files.py data/week1.csv data/week2.csv -o data/merged.csv
+
+  # Merge everything matching a glob, keeping duplicates
+  python3 scripts/merge_csv_files.py "data/weekly-*.csv" -o data/merged.csv --keep-duplicates
+        """
+    )
+
+    parser.add_argument('inputs', nargs='+', help='CSV files or glob patterns to merge')
+    parser.add_argument('--output', '-o', required=True, help='Merged CSV output path')
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help='Keep trips that appear in more than one file')
+
+    args = parser.parse_args()
+
+    print(f"📂 Merging {len(args.inputs)} input(s)...", file=sys.stderr)
+    stats = merge_csv_files(args.inputs, args.output, remove_duplicates=not args.keep_duplicates)
+
+    print(f"✅ Wrote {stats['output_rows']:,} rows to {args.output} "
+          f"({stats['duplicates_removed']:,} duplicate trips removed)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,21 +2,23 @@
 """
 Process Manually Downloaded Tableau "Full Data"
 Converts the TSV file from Tableau's "View Data" button to clean CSV format.
+The download may also be gzip/zstd compressed or zipped.
 """
 
 import sys
 import argparse
-import pandas as pd
 from pathlib import Path
 import chardet
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'analysis'))
+from compressed_input import read_csv, read_head  # noqa: E402
+
 
 def detect_encoding(file_path):
     """Detect the encoding of the file"""
-    with open(file_path, 'rb') as f:
-        raw_data = f.read(10000)  # Read first 10KB
-        result = chardet.detect(raw_data)
-        return result['encoding']
+    raw_data = read_head(file_path, 10000)  # First 10KB of the (decompressed) text
+    result = chardet.detect(raw_data)
+    return result['encoding']
 
 
 def process_tableau_file(input_file, output_file, carrier=None, os_filter=None, client=None):
@@ -24,7 +26,7 @@ def process_tableau_file(input_file, output_file, carrier=None, os_filter=None,
     Process a manually downloaded Tableau Full Data file.
     
     Args:
-        input_file: Path to the downloaded TSV file (usually UTF-16LE encoded)
+        input_file: Path to the downloaded TSV file (usually UTF-16LE encoded; .gz/.zst/.zip accepted)
         output_file: Path for the output CSV file
         carrier: Optional carrier filter
         os_filter: Optional OS filter
@@ -43,11 +45,11 @@ def process_tableau_file(input_file, output_file, carrier=None, os_filter=None,
     # Read the TSV file
     print("📥 Reading data...")
     try:
-        df = pd.read_csv(input_file, sep='\t', encoding=encoding)
+        df = read_csv(input_file, sep='\t', encoding=encoding)
     except:
         # Fallback to UTF-16LE if detection fails
         print("   Trying UTF-16LE encoding...")
-        df = pd.read_csv(input_file, sep='\t', encoding='utf-16le')
+        df = read_csv(input_file, sep='\t', encoding='utf-16le')
     
     print(f"✅ Loaded {len(df)} rows, {len(df.columns)} columns")
     print()
@@ -137,7 +139,7 @@ Example:
     
     parser.add_argument(
         'input_file',
-        help='Path to the manually downloaded TSV file'
+        help='Path to the manually downloaded TSV file (may be .gz, .zst or .zip)'
     )
     parser.add_argument(
         '--output', '-o',
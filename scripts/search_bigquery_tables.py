@@ -2,12 +2,22 @@
 """
 Systematic BigQuery Table Search
 Find tables matching the Tableau dashboard structure.
+
+Column metadata comes from one INFORMATION_SCHEMA.COLUMNS query per dataset
+and is cached on disk (default 24 hours), so repeat searches don't touch
+BigQuery at all. Tables are scored from an inverted index of column names.
+Pass --catalog-file to search a local JSON catalog instead of BigQuery;
+it is read on every run and never cached.
 """
 
-import subprocess
-import json
+import os
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
 
 # Target columns from the manual download
 TARGET_COLUMNS = [
@@ -18,168 +28,252 @@ TARGET_COLUMNS = [
 PROJECT = 'wmt-gdap-dl-sec-lmd-prod'
 DATASETS = ['WW_LMD_TABLES', 'WW_LMD_REPORTING_TABLES', 'WW_LMD_STAGE_TABLES']
 
+CACHE_DIR = Path.home() / '.cache' / 'route-analyzer' / 'bigquery_catalog'
+CACHE_TTL_HOURS = 24
+MIN_SCORE = 3  # Require at least 3 matches
+
+# One dataset's catalog: {table: [column names in ordinal order]}
+Catalog = Dict[str, List[str]]
+
 
 def run_command(cmd):
-    """Run a shell command and return output"""
+    """Run a command and return (stdout, returncode)"""
     try:
         result = subprocess.run(
             cmd,
-            shell=True,
             capture_output=True,
             text=True,
-            timeout=30
+            timeout=120
         )
         return result.stdout, result.returncode
     except Exception as e:
         return str(e), 1
 
 
-def get_table_list(dataset):
-    """Get all tables in a dataset"""
-    print(f"\n📋 Listing tables in {dataset}...")
-    cmd = f"bq ls {PROJECT}:{dataset} 2>&1 | awk 'NR>2 {{print $1}}'"
-    output, _ = run_command(cmd)
-    tables = [t.strip() for t in output.split('\n') if t.strip() and t.strip() != '------']
-    print(f"   Found {len(tables)} tables")
-    return tables
+# ===== CATALOG SOURCES =====
 
+class BigQueryCatalog:
+    """Column metadata for a whole dataset from a single INFORMATION_SCHEMA query"""
 
-def get_table_schema(dataset, table):
-    """Get schema for a specific table"""
-    cmd = f"bq show --format=json {PROJECT}:{dataset}.{table} 2>/dev/null"
-    output, code = run_command(cmd)
-    
-    if code == 0 and output:
-        try:
-            data = json.loads(output)
-            if 'schema' in data and 'fields' in data['schema']:
-                columns = [f['name'] for f in data['schema']['fields']]
-                return columns
-        except:
-            pass
-    return []
-
-
-def score_table(columns):
-    """Score how well a table matches our target columns"""
-    score = 0
-    matched_cols = []
-    
-    # Normalize column names for comparison
-    columns_lower = [c.lower().replace('_', ' ') for c in columns]
-    
-    for target in TARGET_COLUMNS:
+    cacheable = True
+
+    def __init__(self, project: str = PROJECT):
+        self.project = project
+
+    def fetch_columns(self, dataset: str) -> Catalog:
+        query = f"""
+        SELECT table_name, column_name
+        FROM `{self.project}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+        ORDER BY table_name, ordinal_position
+        """
+        cmd = ['bq', 'query', '--nouse_legacy_sql', '--format=json', '--max_rows=10000000',
+               f'--project_id={self.project}', query]
+        output, code = run_command(cmd)
+        if code != 0:
+            raise RuntimeError(f"INFORMATION_SCHEMA query failed for {dataset}: {output.strip()}")
+
+        tables = {}
+        for row in json.loads(output or '[]'):
+            tables.setdefault(row['table_name'], []).append(row['column_name'])
+        return tables
+
+
+class FileCatalog:
+    """
+    Local catalog for offline runs and testing - a JSON file shaped like
+    {"DATASET": {"TABLE": ["col_a", "col_b", ...]}}
+    """
+
+    # Read fresh on every run: a cached copy would hide edits to the file
+    cacheable = False
+
+    def __init__(self, path: str):
+        self.project = f'file:{path}'
+        self.datasets = json.loads(Path(path).read_text())
+
+    def fetch_columns(self, dataset: str) -> Catalog:
+        return self.datasets.get(dataset, {})
+
+
+class CachedCatalog:
+    """Disk cache in front of a catalog source, one JSON file per dataset (remote sources only)"""
+
+    def __init__(self, source, cache_dir: Path = CACHE_DIR, ttl_hours: float = CACHE_TTL_HOURS,
+                 refresh: bool = False):
+        self.source = source
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_hours * 3600
+        self.refresh = refresh
+
+    def _cache_path(self, dataset: str) -> Path:
+        project = self.source.project.replace(':', '_').replace('/', '_')
+        return self.cache_dir / project / f'{dataset}.json'
+
+    def fetch_columns(self, dataset: str) -> Tuple[Catalog, bool]:
+        """Tables and columns for a dataset, plus whether they came from the cache"""
+        if not self.source.cacheable:
+            return self.source.fetch_columns(dataset), False
+
+        path = self._cache_path(dataset)
+        if not self.refresh and path.exists():
+            try:
+                cached = json.loads(path.read_text())
+                if time.time() - cached['fetched_at'] < self.ttl_seconds:
+                    return cached['tables'], True
+            except (OSError, ValueError, KeyError):
+                pass
+
+        tables = self.source.fetch_columns(dataset)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'fetched_at': time.time(), 'tables': tables}))
+        os.replace(tmp_path, path)
+        return tables, False
+
+
+# ===== SCORING =====
+
+def normalize_column(name: str) -> str:
+    return name.lower().replace('_', ' ')
+
+
+class ColumnIndex:
+    """Inverted index: normalized column name -> tables holding it (with position)"""
+
+    def __init__(self):
+        self.tables = []        # (dataset, table, columns)
+        self.postings = {}      # normalized name -> [(table number, position, original name)]
+
+    def add_table(self, dataset: str, table: str, columns: List[str]) -> None:
+        number = len(self.tables)
+        self.tables.append((dataset, table, columns))
+        for position, column in enumerate(columns):
+            self.postings.setdefault(normalize_column(column), []).append((number, position, column))
+
+    def match(self, target: str) -> Dict[int, Tuple[int, str]]:
+        """Tables with a column matching target -> (position, name) of the first such column"""
         target_lower = target.lower()
-        
-        # Check for exact or close matches
-        for i, col in enumerate(columns_lower):
-            if target_lower in col or col in target_lower:
-                score += 1
-                matched_cols.append(columns[i])
-                break
-    
-    # Bonus for having many columns (aggregated data tends to have 100+ columns)
-    if len(columns) > 100:
-        score += 5
-    elif len(columns) > 50:
-        score += 2
-    
-    return score, matched_cols
-
-
-def search_table(dataset, table):
-    """Search a single table"""
-    try:
-        columns = get_table_schema(dataset, table)
-        if not columns:
-            return None
-        
-        score, matched = score_table(columns)
-        
-        if score >= 3:  # Require at least 3 matches
-            return {
+        matches = {}
+        # Only the distinct names are compared, not every column of every table
+        for name, postings in self.postings.items():
+            if name and (target_lower in name or name in target_lower):
+                for number, position, column in postings:
+                    if number not in matches or position < matches[number][0]:
+                        matches[number] = (position, column)
+        return matches
+
+    def score(self, targets: List[str] = TARGET_COLUMNS) -> List[Dict]:
+        """Score every indexed table against the target columns"""
+        matched = [[] for _ in self.tables]
+        for target in targets:
+            for number, (_, column) in self.match(target).items():
+                matched[number].append(column)
+
+        results = []
+        for number, (dataset, table, columns) in enumerate(self.tables):
+            score = len(matched[number])
+            # Bonus for having many columns (aggregated data tends to have 100+ columns)
+            if len(columns) > 100:
+                score += 5
+            elif len(columns) > 50:
+                score += 2
+            results.append({
                 'dataset': dataset,
                 'table': table,
                 'score': score,
                 'total_columns': len(columns),
-                'matched_columns': matched,
+                'matched_columns': matched[number],
                 'all_columns': columns[:20]  # First 20 columns
-            }
-    except Exception as e:
-        pass
-    
-    return None
+            })
+        return results
+
+
+def search_catalog(catalog: CachedCatalog, datasets: List[str], min_score: int = MIN_SCORE) -> List[Dict]:
+    """Index every table in the datasets and return candidates, best first"""
+    index = ColumnIndex()
+    for dataset in datasets:
+        print(f"\n📂 Dataset: {dataset}")
+        try:
+            tables, cached = catalog.fetch_columns(dataset)
+        except Exception as e:
+            print(f"   ❌ {e}")
+            print("   No tables found or access denied")
+            continue
+        source = 'cached' if cached else 'fetched'
+        print(f"   Found {len(tables)} tables ({source})")
+        for table, columns in tables.items():
+            index.add_table(dataset, table, columns)
+
+    candidates = [result for result in index.score() if result['score'] >= min_score]
+    candidates.sort(key=lambda x: x['score'], reverse=True)
+    return candidates
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description='Find BigQuery tables matching the Tableau dashboard columns',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Search the default datasets (uses the cached catalog when fresh)
+  python3 scripts/search_bigquery_tables.py
+
+  # Force a new INFORMATION_SCHEMA fetch
+  python3 scripts/search_bigquery_tables.py --refresh
+
+  # Search a local catalog file instead of BigQuery
+  python3 scripts/search_bigquery_tables.py --catalog-file catalog.json
+        """
+    )
+    parser.add_argument('--project', default=PROJECT, help=f'GCP project (default: {PROJECT})')
+    parser.add_argument('--datasets', nargs='+', default=DATASETS, help='Datasets to search')
+    parser.add_argument('--catalog-file', help='JSON catalog {dataset: {table: [columns]}} to search instead')
+    parser.add_argument('--cache-dir', default=str(CACHE_DIR), help=f'Catalog cache directory (default: {CACHE_DIR})')
+    parser.add_argument('--ttl-hours', type=float, default=CACHE_TTL_HOURS,
+                        help=f'Reuse cached catalogs younger than this (default: {CACHE_TTL_HOURS})')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the cache and re-fetch')
+    parser.add_argument('--min-score', type=int, default=MIN_SCORE,
+                        help=f'Minimum score to report (default: {MIN_SCORE})')
+    args = parser.parse_args()
+
+    project = args.project
+    source = FileCatalog(args.catalog_file) if args.catalog_file else BigQueryCatalog(project)
+    catalog = CachedCatalog(source, args.cache_dir, args.ttl_hours, args.refresh)
+
     print("\n" + "="*80)
     print("🔍 SYSTEMATIC BIGQUERY TABLE SEARCH")
     print("="*80)
     print()
-    print(f"Project: {PROJECT}")
+    print(f"Project: {project}")
     print(f"Target columns: {', '.join(TARGET_COLUMNS[:4])}...")
-    print()
-    
-    all_candidates = []
-    
-    for dataset in DATASETS:
-        print(f"\n{'='*80}")
-        print(f"📂 Dataset: {dataset}")
-        print(f"{'='*80}")
-        
-        # Get all tables
-        tables = get_table_list(dataset)
-        
-        if not tables:
-            print("   No tables found or access denied")
-            continue
-        
-        # Search tables in parallel
-        print(f"\n🔎 Analyzing {len(tables)} tables...")
-        
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(search_table, dataset, table): table for table in tables}
-            
-            for i, future in enumerate(as_completed(futures), 1):
-                if i % 50 == 0:
-                    print(f"   Progress: {i}/{len(tables)}...")
-                
-                result = future.result()
-                if result:
-                    all_candidates.append(result)
-                    print(f"\n   ✅ CANDIDATE FOUND: {result['table']}")
-                    print(f"      Score: {result['score']}/8+")
-                    print(f"      Columns: {result['total_columns']}")
-                    print(f"      Matched: {', '.join(result['matched_columns'][:5])}...")
-    
+
+    all_candidates = search_catalog(catalog, args.datasets, args.min_score)
+
     # Summary
     print("\n" + "="*80)
     print("📊 RESULTS SUMMARY")
     print("="*80)
     print()
-    
+
     if all_candidates:
-        # Sort by score
-        all_candidates.sort(key=lambda x: x['score'], reverse=True)
-        
         print(f"Found {len(all_candidates)} candidate table(s):\n")
-        
+
         for i, candidate in enumerate(all_candidates, 1):
             print(f"{i}. {candidate['dataset']}.{candidate['table']}")
             print(f"   Score: {candidate['score']} | Columns: {candidate['total_columns']}")
             print(f"   Matched: {', '.join(candidate['matched_columns'])}")
             print(f"   First columns: {', '.join(candidate['all_columns'][:10])}")
             print()
-        
+
         print("\n🎯 TOP RECOMMENDATION:")
         top = all_candidates[0]
-        print(f"   {PROJECT}:{top['dataset']}.{top['table']}")
+        print(f"   {project}:{top['dataset']}.{top['table']}")
         print(f"   Score: {top['score']}")
         print(f"   Total columns: {top['total_columns']}")
         print()
         print("Try querying this table:")
-        print(f"   bq head {PROJECT}:{top['dataset']}.{top['table']} --max_rows=5")
-        
+        print(f"   bq head {project}:{top['dataset']}.{top['table']} --max_rows=5")
+
     else:
         print("❌ No matching tables found.")
         print()
@@ -192,9 +286,9 @@ def main():
         print("  1. Ask your team for the exact table name")
         print("  2. Check if data is in a different GCP project")
         print("  3. Verify you have read permissions on the dataset")
-    
+
     return 0
 
 
 if __name__ == '__main__':
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -15,6 +15,8 @@ from typing import Optional, Dict, Any
 from pathlib import Path
 from dotenv import load_dotenv
 
+from fetch_cache import FetchCache, normalize_filters, cached_fetch
+
 # Disable SSL warnings for internal servers with self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -230,8 +232,46 @@ class TableauFetcher:
                    store_id: Optional[str] = None,
                    carrier: Optional[str] = None,
                    os_filter: Optional[str] = None,
-                   client: Optional[str] = None) -> str:
-        """Fetch data from Tableau and save as CSV/Excel"""
+                   client: Optional[str] = None,
+                   cache: Optional[FetchCache] = None,
+                   refresh: bool = False) -> str:
+        """
+        Fetch data from Tableau and save as CSV/Excel.
+
+        An identical request (same view, filters and output format) fetched
+        within the cache TTL is copied from the fetch cache without signing in.
+        Pass refresh=True to fetch anyway and replace the cached copy.
+        """
+        cache = cache or FetchCache('tableau')
+        filters = normalize_filters({
+            'server': self.server,
+            'site': self.site_id,
+            'workbook': self.workbook,
+            'view': self.view,
+            # .csv outputs are converted from Excel and post-filtered, others saved as-is
+            'format': Path(output_file).suffix.lower(),
+            'start_date': start_date,
+            'end_date': end_date,
+            'store': store_id,
+            'carrier': carrier,
+            'os': os_filter,
+            'client': client,
+        })
+        return cached_fetch(
+            cache, filters, output_file,
+            lambda: self._download(output_file, start_date, end_date, store_id, carrier, os_filter, client),
+            refresh=refresh,
+        )
+
+    def _download(self,
+                  output_file: str,
+                  start_date: Optional[str] = None,
+                  end_date: Optional[str] = None,
+                  store_id: Optional[str] = None,
+                  carrier: Optional[str] = None,
+                  os_filter: Optional[str] = None,
+                  client: Optional[str] = None) -> str:
+        """Sign in, query the view and write output_file (no cache)"""
         
         try:
             # Sign in
@@ -346,6 +386,16 @@ def main():
         '--client',
         help='Filter by Client (e.g., Walmart)'
     )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore a cached copy of this request and fetch again'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        help='Seconds a cached fetch stays fresh (default: $FETCH_CACHE_TTL or 3600, 0 disables)'
+    )
     
     args = parser.parse_args()
     
@@ -366,7 +416,9 @@ def main():
             store_id=args.store,
             carrier=args.carrier,
             os_filter=args.os,
-            client=args.client
+            client=args.client,
+            cache=FetchCache('tableau', ttl_seconds=args.cache_ttl),
+            refresh=args.refresh
         )
         
         print(f"\n🎉 SUCCESS! Data fetched and saved to: {output_path}")
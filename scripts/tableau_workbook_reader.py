@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Streaming Tableau Workbook Reader
+Pulls datasource, connection, relation and column definitions out of
+.twb / .tds files and packaged .twbx / .tdsx archives without loading the
+document. The XML is decompressed straight out of the zip and parsed with
+iterparse; finished elements are dropped as soon as they're read, so memory
+stays flat however large the workbook is.
+"""
+
+import sys
+import json
+import zipfile
+import argparse
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Packaged file -> document inside it
+PACKAGED_SUFFIXES = {'.twbx': '.twb', '.tdsx': '.tds'}
+
+RECORD_KINDS = ('datasource', 'connection', 'relation', 'column', 'metadata', 'repository-location')
+
+# <metadata-record class='column'> children copied into 'metadata' records
+METADATA_FIELDS = ('remote-name', 'remote-type', 'local-name', 'parent-name', 'local-type')
+
+
+def local_tag(tag: str) -> str:
+    """Tag without Tableau's feature-flag prefix ('_.fcp.X.true...relation' -> 'relation')"""
+    return tag.rsplit('...', 1)[-1]
+
+
+@contextmanager
+def open_workbook_xml(path: str):
+    """Binary stream of the workbook/datasource XML, read from inside the zip for packaged files"""
+    suffix = Path(path).suffix.lower()
+    if suffix not in PACKAGED_SUFFIXES:
+        with open(path, 'rb') as f:
+            yield f
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        wanted = PACKAGED_SUFFIXES[suffix]
+        members = [name for name in archive.namelist() if name.lower().endswith(wanted)]
+        if not members:
+            raise ValueError(f"No {wanted} document inside {path}")
+        # The document sits at the archive root; nested ones are embedded extras
+        members.sort(key=lambda name: name.count('/'))
+        with archive.open(members[0]) as f:
+            yield f
+
+
+def iter_workbook_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one dict per datasource definition element, in document order.
+
+    Records carry 'kind' (see RECORD_KINDS), the element's attributes and the
+    name/caption of the datasource they belong to ('datasource',
+    'datasource_caption'). Only datasources defined at the top of the
+    document are read - the references worksheets make to them are skipped.
+    """
+    with open_workbook_xml(path) as stream:
+        stack = []          # open elements
+        datasource = None   # (depth, name, caption) of the datasource being read
+
+        for event, element in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element)
+                tag = local_tag(element.tag)
+                depth = len(stack)
+                # Top-level datasource: the document root (.tds) or workbook/datasources/datasource
+                if tag == 'datasource' and datasource is None and (
+                        depth == 1 or (depth == 3 and local_tag(stack[1].tag) == 'datasources')):
+                    datasource = (depth, element.get('name', ''), element.get('caption', ''))
+                continue
+
+            stack.pop()
+            tag = local_tag(element.tag)
+
+            if datasource is not None:
+                record = _record(tag, element, stack, datasource)
+                if record is not None:
+                    yield record
+                if len(stack) + 1 == datasource[0]:
+                    datasource = None
+            elif tag == 'repository-location' and len(stack) == 1:
+                yield {'kind': 'repository-location', 'datasource': None, 'datasource_caption': None,
+                       **element.attrib}
+
+            # Drop the finished element - it is always its parent's last child so far.
+            # A metadata-record's fields are kept until the record itself is read
+            if stack and local_tag(stack[-1].tag) != 'metadata-record':
+                del stack[-1][-1]
+                element.clear()
+            elif not stack:
+                element.clear()
+
+
+def _record(tag: str, element: ET.Element, stack: List[ET.Element], datasource) -> Optional[Dict[str, Any]]:
+    depth, name, caption = datasource
+    parent = local_tag(stack[-1].tag) if stack else None
+    context = {'datasource': name, 'datasource_caption': caption}
+
+    if tag == 'datasource' and len(stack) + 1 == depth:
+        return {'kind': 'datasource', **context, **element.attrib}
+    if tag == 'connection':
+        return {'kind': 'connection', **context, **element.attrib}
+    if tag == 'relation':
+        record = {'kind': 'relation', **context, **element.attrib}
+        if element.get('type') == 'text' and element.text:
+            record['sql'] = element.text.strip()
+        return record
+    if tag == 'column' and len(stack) == depth:
+        return {'kind': 'column', **context, **element.attrib}
+    if tag == 'metadata-record' and element.get('class') == 'column':
+        fields = {field: element.findtext(field) for field in METADATA_FIELDS}
+        return {'kind': 'metadata', **context, **fields}
+    if tag == 'repository-location' and parent == 'datasource':
+        return {'kind': 'repository-location', **context, **element.attrib}
+    return None
+
+
+def parse_relation_table(table: str) -> Dict[str, Optional[str]]:
+    """Split a relation's table attribute ('[project.dataset].[table]') into parts"""
+    parts = [part.strip('[]') for part in table.split('].[')]
+    qualified = '.'.join(parts).split('.')
+    if len(qualified) >= 3:
+        return {'project': '.'.join(qualified[:-2]), 'dataset': qualified[-2], 'table': qualified[-1]}
+    if len(qualified) == 2:
+        return {'project': None, 'dataset': qualified[0], 'table': qualified[1]}
+    return {'project': None, 'dataset': None, 'table': qualified[0] if qualified else None}
+
+
+def summarize_workbook(path: str) -> Dict[str, List[str]]:
+    """Unique connection / source-table facts from a workbook, for datasource discovery"""
+    found = {
+        'BigQuery Project': [],
+        'BigQuery Dataset': [],
+        'BigQuery Table': [],
+        'Connection Server': [],
+        'Database Name': [],
+        'Data Source Name': [],
+        'Repository Location': [],
+    }
+
+    def add(key, value):
+        if value and value not in found[key]:
+            found[key].append(value)
+
+    for record in iter_workbook_records(path):
+        kind = record['kind']
+        if kind == 'datasource':
+            add('Data Source Name', record.get('caption') or record.get('formatted-name') or record.get('name'))
+        elif kind == 'connection':
+            add('BigQuery Project', record.get('project') or record.get('CATALOG'))
+            if record.get('class') == 'bigquery':
+                add('BigQuery Dataset', record.get('schema') or record.get('dataset'))
+            add('Connection Server', record.get('server'))
+            add('Database Name', record.get('dbname'))
+        elif kind == 'relation' and record.get('table') and record.get('type') == 'table':
+            parts = parse_relation_table(record['table'])
+            if parts['table'] and parts['table'] != 'sqlproxy':
+                add('BigQuery Project', parts['project'])
+                add('BigQuery Dataset', parts['dataset'])
+                add('BigQuery Table', parts['table'])
+        elif kind == 'repository-location':
+            add('Repository Location', record.get('id'))
+
+    return {key: values for key, values in found.items() if values}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Stream datasource definitions out of Tableau workbooks',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Connection and source-table summary
+  python3 scripts/tableau_workbook_reader.py "data/ProjectCentralSummaryDashboard_.twbx"
+
+  # Every column record as JSON lines
+  python3 scripts/tableau_workbook_reader.py data/source.tdsx --records --kind column metadata
+        """
+    )
+    parser.add_argument('path', help='.twb, .twbx, .tds or .tdsx file')
+    parser.add_argument('--records', action='store_true', help='Print every record as a JSON line')
+    parser.add_argument('--kind', nargs='+', choices=RECORD_KINDS, help='Only these record kinds')
+    args = parser.parse_args()
+
+    if args.records:
+        for record in iter_workbook_records(args.path):
+            if args.kind is None or record['kind'] in args.kind:
+                print(json.dumps(record))
+        return 0
+
+    print(json.dumps(summarize_workbook(args.path), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
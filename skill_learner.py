@@ -3,114 +3,587 @@
 Skill Learning System - Automatically generates skills from repetitive patterns
 """
 
+import re
 import json
 import os
+import zlib
+import random
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from collections import Counter
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+import sqlite3
 import hashlib
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-user use only
+    fcntl = None
+
+# Examples kept per pattern (oldest dropped first)
+MAX_EXAMPLES = 20
+
+# Intent -> phrases that signal it (substring match, each phrase counts once)
+INTENT_KEYWORDS = {
+    "analysis": ["analyze", "analysis", "break down", "examine", "evaluate"],
+    "api_docs": ["api", "documentation", "latest api", "current docs", "api reference"],
+    "reporting": ["report", "summary", "brief", "update", "status"],
+    "search": ["search", "find", "lookup", "query"],
+    "comparison": ["compare", "vs", "versus", "difference between"],
+    "validation": ["validate", "check", "verify", "test"],
+    "generation": ["generate", "create", "make", "build"]
+}
+
+# Words that start a trigger phrase (whole words, phrase = word + next two)
+TRIGGER_WORDS = ["analyze", "search", "find", "compare", "check", "api", "documentation"]
+# Lookahead so overlapping phrases ("analyze and check ...") are all captured
+TRIGGER_PATTERN = re.compile(
+    r"(?<!\S)(?=((?:" + "|".join(map(re.escape, TRIGGER_WORDS)) + r")(?!\S)(?:\s+\S+){0,2}))"
+)
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a fixed phrase list: one pass over the text
+    finds every phrase occurrence, overlapping ones included.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for phrase in phrases:
+            node = 0
+            for char in phrase:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].add(phrase)
+
+        # Breadth-first failure links (depth-1 nodes fall back to the root);
+        # each node inherits the phrases ending at its fallback
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text: str) -> set:
+        """Phrases occurring anywhere in text"""
+        found = set()
+        node = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return found
+
+
+_INTENT_MATCHER = None
+
+
+def intent_matcher() -> Tuple[PhraseMatcher, Dict[str, List[str]]]:
+    """Phrase matcher for INTENT_KEYWORDS, built once per process"""
+    global _INTENT_MATCHER
+    if _INTENT_MATCHER is None:
+        phrase_intents = {}
+        for intent, terms in INTENT_KEYWORDS.items():
+            for term in terms:
+                phrase_intents.setdefault(term, []).append(intent)
+        _INTENT_MATCHER = (PhraseMatcher(phrase_intents), phrase_intents)
+    return _INTENT_MATCHER
+
+
+# ===== NEAR-DUPLICATE CLUSTERING =====
+# Requests are shingled into word pairs and MinHashed; an LSH index over the
+# MinHash bands finds earlier patterns with similar wording without comparing
+# against every pattern. 32 bands x 2 rows makes pairs above ~0.4 Jaccard
+# near-certain candidates; SIMILARITY_THRESHOLD then confirms them.
+SHINGLE_WORDS = 2
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 32
+SIMILARITY_THRESHOLD = 0.4
+
+_PRIME = (1 << 61) - 1
+_seeded = random.Random(20240611)
+# Fixed hash family so MinHashes stay comparable across runs
+_PERMUTATIONS = [(_seeded.randrange(1, _PRIME), _seeded.randrange(0, _PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def shingles(text: str) -> set:
+    """Overlapping SHINGLE_WORDS-word sequences of the normalized text"""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text: str) -> List[int]:
+    """MinHash signature of the text's shingles"""
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(text)]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def estimated_similarity(first: List[int], second: List[int]) -> float:
+    """Jaccard similarity estimate: share of matching MinHash slots"""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+# Band keys are mixed into 64 bits (stored as SQLite's signed INTEGER); a
+# collision only adds a candidate, which SIMILARITY_THRESHOLD then rejects
+_KEY_MOD = (1 << 64) - 59
+_KEY_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def lsh_band_keys(namespace: str, signature: List[int], bands: int = LSH_BANDS) -> List[int]:
+    """LSH bucket keys of a MinHash, partitioned by namespace (intent)"""
+    rows = len(signature) // bands
+    base = zlib.crc32(namespace.encode())
+    keys = []
+    for band in range(bands):
+        key = base * bands + band
+        for value in signature[band * rows:(band + 1) * rows]:
+            key = (key * _KEY_MULTIPLIER + value) % _KEY_MOD
+        keys.append(key - (1 << 63))
+    return keys
+
+
+class PatternIndex:
+    """
+    Signature-keyed pattern index (SQLite): one row per pattern plus one row
+    per LSH band key, so recording a request reads and writes only the
+    patterns it touches, however many there are. `offset` is how much of
+    the event log the index covers.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS patterns (
+            signature TEXT PRIMARY KEY,
+            intent TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            skill_created INTEGER NOT NULL DEFAULT 0,
+            minhash TEXT NOT NULL,
+            examples TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS bands (band_key INTEGER NOT NULL, signature TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS bands_by_key ON bands (band_key);
+        CREATE TABLE IF NOT EXISTS skills (seq INTEGER PRIMARY KEY AUTOINCREMENT, skill TEXT NOT NULL);
+    """
+
+    def __init__(self, path: Path, max_examples: int = MAX_EXAMPLES):
+        self.max_examples = max_examples
+        # Autocommit; transaction() groups the statements of one update
+        self.conn = sqlite3.connect(str(path), isolation_level=None)
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _meta(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key: str, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def initialized(self) -> bool:
+        return self._meta("offset") is not None
+
+    @property
+    def offset(self) -> int:
+        return self._meta("offset", 0)
+
+    @offset.setter
+    def offset(self, value: int):
+        self._set_meta("offset", value)
+
+    @staticmethod
+    def _pattern(row) -> Dict:
+        signature, intent, count, first_seen, last_seen, skill_created, minhash_json, examples = row
+        return {
+            "signature": signature,
+            "intent": intent,
+            "count": count,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
+            "examples": json.loads(examples),
+            "skill_created": bool(skill_created),
+            "minhash": json.loads(minhash_json),
+        }
+
+    def get(self, signature: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM patterns WHERE signature = ?", (signature,)).fetchone()
+        return self._pattern(row) if row else None
+
+    def put(self, pattern: Dict, new: bool = False):
+        """Write a pattern row (and, for a new pattern, its LSH band keys)"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO patterns VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (pattern["signature"], pattern["intent"], pattern["count"], pattern["first_seen"],
+             pattern["last_seen"], int(pattern.get("skill_created", False)),
+             json.dumps(pattern["minhash"]), json.dumps(pattern["examples"]))
+        )
+        if new:
+            self.conn.executemany(
+                "INSERT INTO bands (band_key, signature) VALUES (?, ?)",
+                [(key, pattern["signature"]) for key in lsh_band_keys(pattern["intent"], pattern["minhash"])]
+            )
+
+    def candidates(self, namespace: str, signature: List[int]) -> Dict[str, List[int]]:
+        """Patterns sharing at least one LSH band with the MinHash -> their MinHashes"""
+        keys = lsh_band_keys(namespace, signature)
+        rows = self.conn.execute(
+            "SELECT DISTINCT p.signature, p.minhash FROM bands b JOIN patterns p ON p.signature = b.signature "
+            f"WHERE b.band_key IN ({','.join('?' * len(keys))})", keys
+        )
+        return {candidate: json.loads(minhash_json) for candidate, minhash_json in rows}
+
+    def apply_event(self, event: Dict):
+        """Fold one logged event into the index"""
+        if event["type"] == "request":
+            pattern = self.get(event["signature"])
+            new = pattern is None
+            if new:
+                pattern = {
+                    "signature": event["signature"],
+                    "intent": event["intent"],
+                    "count": 0,
+                    "first_seen": event["ts"],
+                    "last_seen": event["ts"],
+                    "examples": [],
+                    "skill_created": False,
+                    # A pattern is matched on its first request
+                    "minhash": event.get("minhash") or minhash(request_text(event["request"],
+                                                                            event["instructions"]))
+                }
+            pattern["count"] += 1
+            pattern["last_seen"] = event["ts"]
+            # Ring buffer: keep only the newest examples
+            pattern["examples"].append({
+                "request": event["request"],
+                "instructions": event["instructions"]
+            })
+            del pattern["examples"][:-self.max_examples]
+            self.put(pattern, new=new)
+        elif event["type"] == "skill_created":
+            self.conn.execute("INSERT INTO skills (skill) VALUES (?)", (json.dumps(event["skill"]),))
+            self.conn.execute("UPDATE patterns SET skill_created = 1 WHERE signature = ?", (event["signature"],))
+
+    def patterns(self) -> List[Dict]:
+        return [self._pattern(row) for row in self.conn.execute("SELECT * FROM patterns ORDER BY rowid")]
+
+    def skills(self) -> List[Dict]:
+        return [json.loads(skill) for skill, in self.conn.execute("SELECT skill FROM skills ORDER BY seq")]
+
+    def pattern_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM patterns").fetchone()[0]
+
+
+def request_text(request: str, instructions: str = "") -> str:
+    """Text a request is clustered on"""
+    return f"{request}\n{instructions}"
+
+
 class SkillLearner:
+    """
+    Pattern store layout (.claude/learning/):
+        events.jsonl  - append-only log of recorded requests and created skills
+        index.db      - SQLite pattern index keyed by signature, with each
+                        pattern's LSH band keys, plus the log offset it covers
+                        (events after it are replayed when it is opened)
+        learning.lock - held while reading/appending, so concurrent runs
+                        never lose each other's events
+
+    Each update appends its events to the log, then applies them to the
+    index in one transaction that also moves the offset; a run interrupted
+    in between is caught up by the next one. An index.json from before the
+    SQLite index (or a legacy patterns.json) is imported the first time.
+    """
+
     def __init__(self):
-        self.patterns_file = Path(".claude/learning/patterns.json")
-        self.patterns_file.parent.mkdir(parents=True, exist_ok=True)
+        self.learning_dir = Path(".claude/learning")
+        self.learning_dir.mkdir(parents=True, exist_ok=True)
+        self.patterns_file = self.learning_dir / "patterns.json"
+        self.events_file = self.learning_dir / "events.jsonl"
+        self.index_file = self.learning_dir / "index.json"
+        self.db_file = self.learning_dir / "index.db"
+        self.lock_file = self.learning_dir / "learning.lock"
         self.skills_dir = Path(".claude/skills")
         self.threshold = 2  # Create skill after 2 similar requests
+        self.max_examples = MAX_EXAMPLES
+        self._lock_handle = None
+        self._lock_depth = 0
+
+    # ===== STORAGE =====
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the pattern store (re-entrant within this process)"""
+        if self._lock_depth == 0:
+            self._lock_handle = open(self.lock_file, "a")
+            if fcntl is not None:
+                fcntl.flock(self._lock_handle, fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+                self._lock_handle.close()
+                self._lock_handle = None
+
+    @contextmanager
+    def _open_index(self):
+        """The pattern index, caught up with the event log (lock must be held)"""
+        index = PatternIndex(self.db_file, self.max_examples)
+        try:
+            with index.transaction():
+                if not index.initialized:
+                    self._import_legacy(index)
+                self._replay_events(index)
+            yield index
+        finally:
+            index.close()
+
+    def _import_legacy(self, index: PatternIndex):
+        """Seed a new index from index.json, or else a legacy patterns.json"""
+        if self.index_file.exists():
+            legacy = json.loads(self.index_file.read_text())
+            patterns = list(legacy.get("patterns", {}).values())
+            offset = legacy.get("offset", 0)
+        elif self.patterns_file.exists():
+            legacy = json.loads(self.patterns_file.read_text())
+            patterns = [p for p in legacy.get("patterns", []) if "signature" in p and "count" in p]
+            offset = 0
+        else:
+            legacy, patterns, offset = {}, [], 0
+
+        for pattern in patterns:
+            pattern.setdefault("examples", [])
+            pattern["examples"] = pattern["examples"][-self.max_examples:]
+            pattern.setdefault("skill_created", False)
+            pattern.setdefault("first_seen", None)
+            pattern.setdefault("last_seen", None)
+            if "minhash" not in pattern:
+                # Patterns from before clustering are matched on their first example
+                first = pattern["examples"][0] if pattern["examples"] else {}
+                pattern["minhash"] = minhash(request_text(first.get("request", ""),
+                                                          first.get("instructions", "")))
+            index.put(pattern, new=True)
+        for skill in legacy.get("skills_created", []):
+            index.conn.execute("INSERT INTO skills (skill) VALUES (?)", (json.dumps(skill),))
+        index.offset = offset
+
+    def _replay_events(self, index: PatternIndex):
+        """Apply events logged after the index's offset (normally none)"""
+        if not self.events_file.exists():
+            return
+        offset = index.offset
+        with open(self.events_file, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # torn line from an interrupted write
+                index.apply_event(event)
+        index.offset = offset
+
+    def _write_events(self, index: PatternIndex, events: List[Dict]):
+        """Append events to the log in one write and move the index offset past them (lock must be held)"""
+        payload = "".join(json.dumps(event) + "\n" for event in events).encode()
+        with open(self.events_file, "ab") as f:
+            if f.tell() > 0:
+                # Terminate a torn last line so this write starts cleanly
+                with open(self.events_file, "rb") as tail:
+                    tail.seek(-1, os.SEEK_END)
+                    if tail.read(1) != b"\n":
+                        payload = b"\n" + payload
+            f.write(payload)
+            f.flush()
+            index.offset = f.tell()
+
+    def compact(self) -> int:
+        """Fold any events the index hasn't seen into it and reclaim space; returns the pattern count"""
+        with self._locked():
+            with self._open_index() as index:
+                index.conn.execute("VACUUM")
+                return index.pattern_count()
 
     def load_patterns(self) -> Dict:
-        """Load existing pattern tracking"""
-        if self.patterns_file.exists():
-            return json.loads(self.patterns_file.read_text())
-        return {"patterns": [], "skills_created": []}
-
-    def save_patterns(self, data: Dict):
-        """Persist pattern data"""
-        self.patterns_file.write_text(json.dumps(data, indent=2))
+        """Current pattern tracking (patterns list + skills created)"""
+        with self._locked():
+            with self._open_index() as index:
+                return {"patterns": index.patterns(), "skills_created": index.skills()}
 
     def extract_intent(self, user_request: str) -> str:
         """Extract the core intent from user request"""
         # Simple keyword extraction - could use embeddings for better matching
-        keywords = {
-            "analysis": ["analyze", "analysis", "break down", "examine", "evaluate"],
-            "api_docs": ["api", "documentation", "latest api", "current docs", "api reference"],
-            "reporting": ["report", "summary", "brief", "update", "status"],
-            "search": ["search", "find", "lookup", "query"],
-            "comparison": ["compare", "vs", "versus", "difference between"],
-            "validation": ["validate", "check", "verify", "test"],
-            "generation": ["generate", "create", "make", "build"]
-        }
-
-        request_lower = user_request.lower()
+        matcher, phrase_intents = intent_matcher()
         intent_scores = Counter()
+        for phrase in matcher.find(user_request.lower()):
+            for intent in phrase_intents[phrase]:
+                intent_scores[intent] += 1
 
-        for intent, terms in keywords.items():
-            for term in terms:
-                if term in request_lower:
-                    intent_scores[intent] += 1
-
-        return intent_scores.most_common(1)[0][0] if intent_scores else "general"
+        if not intent_scores:
+            return "general"
+        # Ties go to the intent listed first, as in INTENT_KEYWORDS
+        best = max(intent_scores.values())
+        return next(intent for intent in INTENT_KEYWORDS if intent_scores[intent] == best)
 
     def create_signature(self, intent: str, context: str) -> str:
         """Create unique signature for a pattern"""
         combined = f"{intent}:{context}"
         return hashlib.md5(combined.encode()).hexdigest()[:12]
 
-    def record_request(self, user_request: str, user_instructions: str = ""):
-        """Track a user request and detect patterns"""
-        data = self.load_patterns()
-
-        intent = self.extract_intent(user_request)
-        signature = self.create_signature(intent, user_instructions[:100])
+    def find_similar_pattern(self, index: PatternIndex, intent: str, signature: List[int]) -> Optional[str]:
+        """Most similar pattern with the same intent, if any clears SIMILARITY_THRESHOLD"""
+        best, best_similarity = None, SIMILARITY_THRESHOLD
+        for candidate, candidate_minhash in sorted(index.candidates(intent, signature).items()):
+            similarity = estimated_similarity(signature, candidate_minhash)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def _request_event(self, user_request: str, user_instructions: str = "",
+                       ts: Optional[str] = None) -> Dict:
+        """Log event for one request (pattern assigned later, under the lock)"""
+        request, instructions = user_request[:200], user_instructions[:500]
+        return {
+            "type": "request",
+            "ts": ts or datetime.now().isoformat(),
+            "intent": self.extract_intent(user_request),
+            "request": request,
+            "instructions": instructions,
+            "minhash": minhash(request_text(request, instructions))
+        }
 
-        # Find existing pattern or create new
-        pattern_found = False
-        for pattern in data["patterns"]:
-            if pattern["signature"] == signature:
-                pattern["count"] += 1
-                pattern["last_seen"] = datetime.now().isoformat()
-                pattern["examples"].append({
-                    "request": user_request[:200],
-                    "instructions": user_instructions[:500]
-                })
-                pattern_found = True
-
-                # Trigger skill creation at threshold
-                if pattern["count"] == self.threshold and not pattern.get("skill_created"):
-                    self.generate_skill(pattern)
-                    pattern["skill_created"] = True
-                break
-
-        if not pattern_found:
-            data["patterns"].append({
-                "signature": signature,
-                "intent": intent,
-                "count": 1,
-                "first_seen": datetime.now().isoformat(),
-                "last_seen": datetime.now().isoformat(),
-                "examples": [{
-                    "request": user_request[:200],
-                    "instructions": user_instructions[:500]
-                }],
-                "skill_created": False
-            })
+    def _assign_pattern(self, index: PatternIndex, event: Dict):
+        """Point a request event at its near-duplicate pattern, or open a new one (lock must be held)"""
+        signature = self.find_similar_pattern(index, event["intent"], event["minhash"])
+        if signature is None:
+            signature = self.create_signature(event["intent"], request_text(event["request"], event["instructions"]))
+        if index.get(signature) is not None:
+            del event["minhash"]  # only a pattern's first event needs to carry it
+        event["signature"] = signature
+
+    def _skill_event(self, index: PatternIndex, signature: str) -> Optional[Dict]:
+        """skill_created event if the pattern just reached the threshold, else None"""
+        pattern = index.get(signature)
+        if pattern["count"] != self.threshold or pattern.get("skill_created"):
+            return None
+        skill = self.generate_skill(pattern)
+        return {
+            "type": "skill_created",
+            "ts": skill["created"],
+            "signature": signature,
+            "skill": skill
+        }
 
-        self.save_patterns(data)
-        print(f"✅ Tracked pattern: {intent} (seen {self._get_pattern_count(signature, data)} times)")
+    def record_request(self, user_request: str, user_instructions: str = ""):
+        """Track a user request and detect patterns"""
+        event = self._request_event(user_request, user_instructions)
+        intent = event["intent"]
+
+        # Touches only the matched pattern's rows and its LSH buckets, so the
+        # cost doesn't grow with the number of patterns or logged events
+        with self._locked(), self._open_index() as index, index.transaction():
+            self._assign_pattern(index, event)
+            signature = event["signature"]
+            self._write_events(index, [event])
+            index.apply_event(event)
+
+            # Trigger skill creation at threshold
+            skill_event = self._skill_event(index, signature)
+            if skill_event is not None:
+                self._write_events(index, [skill_event])
+                index.apply_event(skill_event)
+            count = index.get(signature)["count"]
+
+        print(f"✅ Tracked pattern: {intent} (seen {count} times)")
 
         # Check if threshold reached
-        count = self._get_pattern_count(signature, data)
         if count == self.threshold:
             print(f"🎯 Pattern detected {self.threshold} times - generating skill!")
 
-    def _get_pattern_count(self, signature: str, data: Dict) -> int:
-        for pattern in data["patterns"]:
-            if pattern["signature"] == signature:
-                return pattern["count"]
-        return 0
-
-    def generate_skill(self, pattern: Dict):
-        """Auto-generate a skill from detected pattern"""
+    def ingest(self, path: str) -> Dict:
+        """
+        Bulk-load historical requests from a JSONL file, one object per line:
+        {"request": "...", "instructions": "...", "ts": "..."} (instructions
+        and ts optional; user_request / user_instructions / timestamp also
+        accepted).
+
+        The file is streamed through the matcher and applied to the index in
+        one transaction under a single lock; all events go to the log in one
+        write before it commits.
+        """
+        counts = {"requests": 0, "skipped": 0, "skills": 0}
+        with self._locked(), self._open_index() as index, index.transaction():
+            events = []
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                        request = record.get("request", record.get("user_request"))
+                    except (ValueError, AttributeError):
+                        request = None
+                    if not isinstance(request, str) or not request:
+                        counts["skipped"] += 1
+                        continue
+
+                    instructions = record.get("instructions", record.get("user_instructions")) or ""
+                    event = self._request_event(request, str(instructions),
+                                                record.get("ts", record.get("timestamp")))
+                    self._assign_pattern(index, event)
+                    index.apply_event(event)
+                    events.append(event)
+                    counts["requests"] += 1
+
+                    skill_event = self._skill_event(index, event["signature"])
+                    if skill_event is not None:
+                        index.apply_event(skill_event)
+                        events.append(skill_event)
+                        counts["skills"] += 1
+
+            if events:
+                self._write_events(index, events)
+            counts["patterns"] = index.pattern_count()
+        return counts
+
+    def generate_skill(self, pattern: Dict) -> Dict:
+        """Auto-generate a skill from detected pattern (returns the skill record to log)"""
         intent = pattern["intent"]
         examples = pattern["examples"]
 
@@ -188,15 +661,13 @@ This skill improves with use. After each invocation:
             print(f"   🌐 Web search enabled for current documentation")
         print(f"\n💡 This skill will now be auto-invoked for similar requests!")
 
-        # Log skill creation
-        data = self.load_patterns()
-        data["skills_created"].append({
+        # Skill creation is logged by the caller
+        return {
             "name": skill_name,
             "intent": intent,
             "created": datetime.now().isoformat(),
             "from_pattern": pattern["signature"]
-        })
-        self.save_patterns(data)
+        }
 
     def _synthesize_instructions(self, examples: List[Dict]) -> str:
         """Create step-by-step instructions from examples"""
@@ -221,14 +692,9 @@ This skill improves with use. After each invocation:
         """Extract trigger phrases from examples"""
         triggers = set()
         for ex in examples:
-            request = ex["request"].lower()
-            # Extract key phrases (simple approach)
-            words = request.split()
-            for i, word in enumerate(words):
-                if word in ["analyze", "search", "find", "compare", "check", "api", "documentation"]:
-                    # Capture 2-3 word phrase
-                    phrase = ' '.join(words[i:i+3])
-                    triggers.add(phrase)
+            # Trigger word plus the next two words (whitespace collapsed)
+            for phrase in TRIGGER_PATTERN.findall(ex["request"].lower()):
+                triggers.add(' '.join(phrase.split()))
 
         return list(triggers)[:5]  # Max 5 triggers
 
@@ -294,11 +760,14 @@ Commands:
   track           - Interactive: track a new request pattern
   list            - Show all learned skills and patterns
   record "request" "instructions"  - Record a pattern programmatically
+  compact         - Fold the event log into the pattern index
+  ingest FILE     - Bulk-load past requests from a JSONL file
 
 Examples:
   ./lmd-skill-learner track
   ./lmd-skill-learner list
   ./lmd-skill-learner record "analyze the BRD" "First read the BRD, then..."
+  ./lmd-skill-learner ingest history.jsonl
         """)
         return
 
@@ -310,8 +779,15 @@ Examples:
         learner.list_learned_skills()
     elif cmd == "record" and len(sys.argv) >= 4:
         learner.record_request(sys.argv[2], sys.argv[3])
+    elif cmd == "compact":
+        patterns = learner.compact()
+        print(f"✅ Compacted {patterns} patterns into {learner.db_file}")
+    elif cmd == "ingest" and len(sys.argv) >= 3:
+        counts = learner.ingest(sys.argv[2])
+        print(f"✅ Ingested {counts['requests']} requests ({counts['skipped']} skipped): "
+              f"{counts['patterns']} patterns, {counts['skills']} new skills")
     else:
-        print("Unknown command. Use: track, list, or record")
+        print("Unknown command. Use: track, list, record, compact, or ingest")
 
 if __name__ == "__main__":
     main()
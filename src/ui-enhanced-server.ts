@@ -21,6 +21,9 @@ const BASE_DIR = resolve(__dirname, '..');
 const SCRIPTS_DIR = resolve(BASE_DIR, 'scripts');
 
 // Ensure directories exist (relative to BASE_DIR)
+// Analyses keep a Parquet copy of each upload in uploads/.route_cache. Copies of
+// deleted uploads are swept on the next build, and the directory is capped at
+// ROUTE_ANALYZER_CACHE_MAX_MB. Set ROUTE_ANALYZER_CACHE=0 to skip the copy.
 const UPLOAD_DIR = join(BASE_DIR, 'uploads');
 const DATA_DIR = join(BASE_DIR, 'data');
 if (!existsSync(UPLOAD_DIR)) mkdirSync(UPLOAD_DIR, { recursive: true });
@@ -80,7 +83,7 @@ app.post('/api/analyze', upload.single('csv'), async (req, res) => {
     res.json(result);
   } catch (error: any) {
     console.error('Analysis error:', error);
-    res.status(500).json({ error: error.message });
+    sendAnalysisError(res, error);
   }
 });
 
@@ -97,14 +100,14 @@ app.post('/api/analyze-path', async (req, res) => {
     res.json(result);
   } catch (error: any) {
     console.error('Analysis error:', error);
-    res.status(500).json({ error: error.message });
+    sendAnalysisError(res, error);
   }
 });
 
 // GET /api/tableau-fetch - Fetch data from Tableau
 app.get('/api/tableau-fetch', async (req, res) => {
   try {
-    const { days, startDate, endDate, store } = req.query;
+    const { days, startDate, endDate, store, refresh } = req.query;
 
     const args = [join(SCRIPTS_DIR, 'tableau_fetcher.py')];
     const outputPath = join(DATA_DIR, `tableau-${Date.now()}.csv`);
@@ -114,6 +117,8 @@ app.get('/api/tableau-fetch', async (req, res) => {
     if (startDate) args.push('--start-date', startDate as string);
     if (endDate) args.push('--end-date', endDate as string);
     if (store) args.push('--store', store as string);
+    // Identical fetches within the TTL are copied from data/.fetch_cache; refresh=true forces a new one
+    if (refresh === 'true') args.push('--refresh');
 
     console.log('Fetching from Tableau:', args);
 
@@ -144,7 +149,7 @@ app.get('/api/tableau-fetch', async (req, res) => {
 // GET /api/bigquery-fetch - Fetch data from BigQuery
 app.get('/api/bigquery-fetch', async (req, res) => {
   try {
-    const { days, carrier, client, type, oversized } = req.query;
+    const { days, carrier, client, type, oversized, refresh } = req.query;
 
     const pythonPath = getPythonPath();
     const args = [join(SCRIPTS_DIR, 'auto_fetch_bigquery.py')];
@@ -156,6 +161,7 @@ app.get('/api/bigquery-fetch', async (req, res) => {
     if (client) args.push('--client', client as string);
     if (type) args.push('--type', type as string);
     if (oversized) args.push('--oversized', oversized as string);
+    if (refresh === 'true') args.push('--refresh');
 
     console.log('Fetching from BigQuery:', pythonPath, args);
 
@@ -289,117 +295,110 @@ app.get('/health', (req, res) => {
 
 // ===== HELPER FUNCTIONS =====
 
-function runPythonAnalysis(analysisType: string, csvPath: string, storeId?: string, additionalParams: any = {}): Promise<any> {
-  return new Promise((resolve, reject) => {
-    let scriptPath: string;
-    let args: string[];
-
-    switch (analysisType) {
-      case 'bigquery-metrics':
-        // Use old basic metrics script
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'bigquery_metrics_analysis.py');
-        args = [];
-        break;
-      case 'bigquery-kpi':
-        // Use new leadership KPI analysis
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'bigquery_kpi_analysis.py');
-        args = [];
-        break;
-      case 'tableau-metrics':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'tableau_metrics_analysis.py');
-        args = [];
-        break;
-      case 'store-metrics':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'store_metrics_breakdown.py');
-        args = [];
-        break;
-      case 'driver-store':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'driver_store_analysis.py');
-        args = storeId ? [storeId] : [];
-        break;
-      case 'multiday':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'multiday_route_analysis.py');
-        args = storeId ? [storeId] : [];
-        break;
-      case 'time-breakdown':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'detailed_time_analysis.py');
-        args = [];
-        break;
-      case 'returns':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'returns_breakdown.py');
-        args = [];
-        break;
-      case 'store-analysis':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'store_specific_analysis.py');
-        args = storeId ? [storeId] : [];
-        break;
-      case 'pending-orders':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'pending_orders_analysis.py');
-        args = [];
-        break;
-      case 'failed-orders':
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'route_analyzer.py'); // This has failed orders analysis
-        args = [];
-        break;
-      default:
-        scriptPath = join(SCRIPTS_DIR, 'analysis', 'store_metrics_breakdown.py');
-        args = [];
-    }
+// Analyses run through scripts/job_service.py: a fixed pool of workers with a
+// bounded queue and per-job memory/time limits, instead of one unbounded
+// Python process per upload. Set JOB_SERVICE_URL to use a service started
+// separately; otherwise one is started alongside this server.
+const JOB_SERVICE_PORT = process.env.JOB_SERVICE_PORT ? parseInt(process.env.JOB_SERVICE_PORT) : 8765;
+const JOB_SERVICE_URL = process.env.JOB_SERVICE_URL || `http://127.0.0.1:${JOB_SERVICE_PORT}`;
+const JOB_POLL_MS = 500;
+const JOB_SERVICE_STARTUP_MS = 10000;
+
+class JobServiceError extends Error {
+  constructor(message: string, public status: number = 500, public retryAfter?: string) {
+    super(message);
+  }
+}
 
-    const pythonProcess = spawn(getPythonPath(), [scriptPath]);
+function startJobService() {
+  if (process.env.JOB_SERVICE_URL) return;
+
+  const args = [join(SCRIPTS_DIR, 'job_service.py'), '--port', String(JOB_SERVICE_PORT)];
+  if (process.env.JOB_SERVICE_WORKERS) args.push('--workers', process.env.JOB_SERVICE_WORKERS);
+  if (process.env.JOB_SERVICE_MEMORY_MB) args.push('--memory-mb', process.env.JOB_SERVICE_MEMORY_MB);
+  const jobService = spawn(getPythonPath(), args, { cwd: BASE_DIR, stdio: ['ignore', 'inherit', 'inherit'] });
+  jobService.on('exit', (code) => console.error(`⚠️  Job service exited (code ${code})`));
+  // SIGINT lets the service kill its running analyses on the way out
+  process.on('exit', () => jobService.kill('SIGINT'));
+  for (const signal of ['SIGINT', 'SIGTERM'] as const) {
+    process.on(signal, () => process.exit(0));
+  }
+}
 
-    let stdout = '';
-    let stderr = '';
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
 
-    pythonProcess.stdout.on('data', (chunk) => {
-      stdout += chunk.toString();
-    });
+async function jobServiceRequest(path: string, init: RequestInit = {}): Promise<Response> {
+  // The service may still be starting when the first analysis arrives
+  const deadline = Date.now() + JOB_SERVICE_STARTUP_MS;
+  while (true) {
+    try {
+      return await fetch(`${JOB_SERVICE_URL}${path}`, init);
+    } catch (error) {
+      if (Date.now() > deadline) {
+        throw new JobServiceError(`Job service unavailable at ${JOB_SERVICE_URL}`, 503);
+      }
+      await sleep(JOB_POLL_MS);
+    }
+  }
+}
 
-    pythonProcess.stderr.on('data', (chunk) => {
-      stderr += chunk.toString();
-    });
+async function runAnalysisJob(analysis: string, request: Record<string, any>): Promise<any> {
+  const submitted = await jobServiceRequest('/jobs', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ analysis, request })
+  });
+  const job = await submitted.json();
+  if (submitted.status === 429) {
+    throw new JobServiceError(`Too many analyses running, try again shortly (${job.error})`, 429,
+      submitted.headers.get('Retry-After') || undefined);
+  }
+  if (!submitted.ok) {
+    throw new JobServiceError(job.error || 'Analysis could not be queued', submitted.status);
+  }
 
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        reject(new Error(stderr || 'Analysis failed'));
-        return;
-      }
+  let status = job;
+  while (status.status === 'queued' || status.status === 'running') {
+    await sleep(JOB_POLL_MS);
+    status = await (await jobServiceRequest(`/jobs/${job.id}`)).json();
+  }
+  if (status.status !== 'succeeded') {
+    throw new JobServiceError(status.error || `Analysis ${status.status}`);
+  }
+  return (await jobServiceRequest(`/jobs/${job.id}/result`)).json();
+}
 
-      try {
-        const result = JSON.parse(stdout);
-
-        // Generate formatted text report from JSON using the report generator
-        // Pass ranking parameter if available
-        const ranking = additionalParams.ranking || 10;
-        const { report, summary } = generateReport(result, analysisType, ranking);
-
-        resolve({
-          success: true,
-          report: report,
-          summary: summary,
-          detailed: report,
-          data: result,
-          stats: extractStats(result),
-          rankingValue: additionalParams.ranking || '10' // Pass ranking to frontend for chart rendering
-        });
-      } catch (error) {
-        console.error('Parse error:', error);
-        console.error('stdout:', stdout.substring(0, 500));
-        console.error('stderr:', stderr);
-        reject(new Error(`Failed to parse analysis results: ${error instanceof Error ? error.message : String(error)}`));
-      }
-    });
+async function runPythonAnalysis(analysisType: string, csvPath: string, storeId?: string, additionalParams: any = {}): Promise<any> {
+  // Send CSV path, store_id, and additional params to the Python script
+  const inputData = {
+    csv_path: csvPath,
+    store_id: storeId,
+    storeId: storeId, // Include both formats for compatibility
+    ...additionalParams
+  };
+  const result = await runAnalysisJob(analysisType || 'store-metrics', inputData);
+
+  // Generate formatted text report from JSON using the report generator
+  // Pass ranking parameter if available
+  const ranking = additionalParams.ranking || 10;
+  const { report, summary } = generateReport(result, analysisType, ranking);
+
+  return {
+    success: true,
+    report: report,
+    summary: summary,
+    detailed: report,
+    data: result,
+    stats: extractStats(result),
+    rankingValue: additionalParams.ranking || '10' // Pass ranking to frontend for chart rendering
+  };
+}
 
-    // Send CSV path, store_id, and additional params to Python script
-    const inputData = {
-      csv_path: csvPath,
-      store_id: storeId,
-      storeId: storeId, // Include both formats for compatibility
-      ...additionalParams
-    };
-    pythonProcess.stdin.write(JSON.stringify(inputData));
-    pythonProcess.stdin.end();
-  });
+function sendAnalysisError(res: express.Response, error: any) {
+  if (error instanceof JobServiceError && error.retryAfter) {
+    res.setHeader('Retry-After', error.retryAfter);
+  }
+  res.status(error instanceof JobServiceError ? error.status : 500).json({ error: error.message });
 }
 
 function runPythonScript(args: string[]): Promise<string> {
@@ -446,6 +445,8 @@ function extractStats(result: any): Record<string, any> {
 
 // ===== START SERVER =====
 
+startJobService();
+
 app.listen(PORT, () => {
   console.log(`
 ╔════════════════════════════════════════════════════════╗